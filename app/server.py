@@ -1,17 +1,19 @@
 import os
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Union
 
 # Ensure project root on path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from fastapi import FastAPI, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from src.retriever import Retriever
+from src.retriever import RetrieverReloader
+from src.search import diversity
 from src.rag import answer_with_citations
 try:
     from src.rerank import Reranker
@@ -24,70 +26,146 @@ EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
 INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
 CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
 RE_RANK = os.getenv("RE_RANK", "false").lower() == "true"
-USE_MMR = os.getenv("USE_MMR", "false").lower() == "true"
+# true (= mmr), mmr, dpp or facility: diversify hybrid results by default
+USE_MMR = diversity.strategy(os.getenv("USE_MMR", "false"))
+# at most N hits per document (0 = no cap)
+MAX_PER_DOC = int(os.getenv("MAX_PER_DOC", "0"))
 
 # Hybrid defaults
 SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
 HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.65"))
+# score fusion of the vector and BM25 candidates: minmax, rrf or zscore
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "minmax")
 FETCH_K = int(os.getenv("FETCH_K", "64"))
 LEXICAL_FALLBACK = os.getenv("LEXICAL_FALLBACK", "true").lower() != "false"
+# Coalesce concurrent requests into batched query embedding + index search
+SEARCH_BATCH = os.getenv("SEARCH_BATCH", "true").lower() != "false"
+# Pick up indexes rewritten by scripts/update_lexical.py or ingest: check every N seconds (0 = only POST /reload)
+RELOAD_CHECK_S = float(os.getenv("RELOAD_CHECK_S", "2"))
 
 app = FastAPI(title="RAG Semantic Search API (Hybrid+Cache+Fallback)")
 
-retriever = Retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
+# searches run on the threadpool (not the event loop), so concurrent requests meet in the batcher
+reloader = RetrieverReloader(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL, RELOAD_CHECK_S, batch=SEARCH_BATCH)
 reranker = Reranker() if (RE_RANK and Reranker is not None) else None
 
 class AskRequest(BaseModel):
     question: str
     top_k: int = 8
-    mmr: Optional[bool] = None
+    mmr: Optional[Union[bool, str]] = None
     mode: Optional[str] = None
     alpha: Optional[float] = None
+    fusion: Optional[str] = None
     fetch_k: Optional[int] = None
     lexical_fallback: Optional[bool] = None
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    max_per_doc: Optional[int] = None
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 8
+    mmr: Optional[Union[bool, str]] = None
+    mode: Optional[str] = None
+    alpha: Optional[float] = None
+    fusion: Optional[str] = None
+    fetch_k: Optional[int] = None
+    lexical_fallback: Optional[bool] = None
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    max_per_doc: Optional[int] = None
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit / miss / eviction counters of the in-process query embedding cache."""
+    query_cache = getattr(reloader.get().embedder, "query_cache", None)
+    return {"query_embeddings": query_cache.stats() if query_cache is not None else None}
+
+@app.get("/batch/stats")
+async def batch_stats():
+    """Batches run and queries per batch of the cross-request query batcher (reset by a reload)."""
+    batcher = reloader.get().batcher
+    return {"enabled": batcher is not None, **(batcher.stats() if batcher is not None else {})}
+
+@app.post("/reload")
+async def reload():
+    """Reopen the indexes now, e.g. right after scripts/update_lexical.py, instead of waiting for RELOAD_CHECK_S."""
+    reloaded = await run_in_threadpool(reloader.reload)
+    return {"reloaded": reloaded, "reloads": reloader.reloads}
+
 @app.get("/search")
 async def search(
     q: str = Query(..., description="query"),
     top_k: int = 8,
-    mmr: bool = False,
+    mmr: Optional[str] = Query(None, description="diversity: true/false, or mmr, dpp, facility (default USE_MMR)"),
     mode: str = SEARCH_MODE,
     alpha: float = HYBRID_ALPHA,
+    fusion: str = Query(HYBRID_FUSION, description="hybrid score fusion: minmax, rrf or zscore"),
     fetch_k: int = FETCH_K,
     lexical_fallback: bool = LEXICAL_FALLBACK,
+    nprobe: Optional[int] = Query(None, description="IVF lists to probe (ivf_* indexes)"),
+    ef_search: Optional[int] = Query(None, description="HNSW search breadth (hnsw index)"),
+    max_per_doc: int = Query(MAX_PER_DOC, description="at most N hits per document (0 = no cap)"),
 ):
     try:
-        hits = retriever.search(q, top_k=top_k, mode=mode, mmr=mmr or USE_MMR, fetch_k=fetch_k, alpha=alpha, lexical_fallback=lexical_fallback)
+        use_mmr = diversity.strategy(mmr) if mmr is not None else USE_MMR
+        hits = await run_in_threadpool(reloader.get().search, q, top_k=top_k, mode=mode, mmr=use_mmr, fetch_k=fetch_k, alpha=alpha, lexical_fallback=lexical_fallback, nprobe=nprobe, ef_search=ef_search, max_per_doc=max_per_doc, fusion=fusion)
         if reranker and mode != "bm25":  # rerank makes sense for vector/hybrid
             try:
                 hits = reranker.rerank(q, hits, top_k)
             except Exception as e:
                 print(f"Reranking failed: {e}")
-        return {"mode": mode, "alpha": alpha, "lexical_fallback": lexical_fallback, "hits": hits}
+        return {"mode": mode, "alpha": alpha, "fusion": fusion, "lexical_fallback": lexical_fallback, "hits": hits}
     except Exception as e:
         return {"error": str(e), "hits": []}
 
+@app.post("/search/batch")
+async def search_batch(req: SearchBatchRequest):
+    """Many queries in one request: embedded, searched and BM25-scored as one batch (``search_many``)."""
+    try:
+        use_mmr = diversity.strategy(req.mmr) if req.mmr is not None else USE_MMR
+        max_per_doc = req.max_per_doc if req.max_per_doc is not None else MAX_PER_DOC
+        mode = (req.mode or SEARCH_MODE)
+        alpha = float(req.alpha if req.alpha is not None else HYBRID_ALPHA)
+        fusion = req.fusion or HYBRID_FUSION
+        fetch_k = int(req.fetch_k if req.fetch_k is not None else FETCH_K)
+        lexical_fb = req.lexical_fallback if req.lexical_fallback is not None else LEXICAL_FALLBACK
+
+        results = await run_in_threadpool(reloader.get().search_many, req.queries, top_k=req.top_k, mode=mode, mmr=use_mmr, fetch_k=fetch_k, alpha=alpha, lexical_fallback=lexical_fb, nprobe=req.nprobe, ef_search=req.ef_search, max_per_doc=max_per_doc, fusion=fusion)
+        if reranker and mode != "bm25":  # rerank makes sense for vector/hybrid
+            for i, (q, hits) in enumerate(zip(req.queries, results)):
+                try:
+                    results[i] = reranker.rerank(q, hits, req.top_k)
+                except Exception as e:
+                    print(f"Reranking failed: {e}")
+        return {"mode": mode, "alpha": alpha, "fusion": fusion, "lexical_fallback": lexical_fb,
+                "results": [{"q": q, "hits": hits} for q, hits in zip(req.queries, results)]}
+    except Exception as e:
+        return {"error": str(e), "results": []}
+
 @app.post("/ask")
 async def ask(req: AskRequest):
     try:
-        use_mmr = req.mmr if req.mmr is not None else USE_MMR
+        use_mmr = diversity.strategy(req.mmr) if req.mmr is not None else USE_MMR
+        max_per_doc = req.max_per_doc if req.max_per_doc is not None else MAX_PER_DOC
         mode = (req.mode or SEARCH_MODE)
         alpha = float(req.alpha if req.alpha is not None else HYBRID_ALPHA)
+        fusion = req.fusion or HYBRID_FUSION
         fetch_k = int(req.fetch_k if req.fetch_k is not None else FETCH_K)
         lexical_fb = req.lexical_fallback if req.lexical_fallback is not None else LEXICAL_FALLBACK
 
-        hits = retriever.search(req.question, top_k=req.top_k, mode=mode, mmr=use_mmr, fetch_k=fetch_k, alpha=alpha, lexical_fallback=lexical_fb)
+        hits = await run_in_threadpool(reloader.get().search, req.question, top_k=req.top_k, mode=mode, mmr=use_mmr, fetch_k=fetch_k, alpha=alpha, lexical_fallback=lexical_fb, nprobe=req.nprobe, ef_search=req.ef_search, max_per_doc=max_per_doc, fusion=fusion)
         if reranker and mode != "bm25":  # rerank makes sense for vector/hybrid
             try:
                 hits = reranker.rerank(req.question, hits, req.top_k)
             except Exception as e:
                 print(f"Reranking failed: {e}")
-        ans = answer_with_citations(req.question, hits)
-        return {"answer": ans["answer"], "mode": mode, "alpha": alpha, "lexical_fallback": lexical_fb, "hits": hits}
+        ans = await run_in_threadpool(answer_with_citations, req.question, hits)
+        return {"answer": ans["answer"], "mode": mode, "alpha": alpha, "fusion": fusion, "lexical_fallback": lexical_fb, "hits": hits}
     except Exception as e:
         return {"error": str(e), "answer": "An error occurred while processing your request.", "hits": []}
 
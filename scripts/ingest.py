@@ -1,4 +1,4 @@
-import os, json, sys
+import os, sys
 from pathlib import Path
 
 # Add the project root to Python path
@@ -6,42 +6,33 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from dotenv import load_dotenv
-from src.ingest.extract import load_documents
-from src.ingest.chunk import make_chunks
-from src.ingest.build_index import build_faiss
-from src.utils.cached_embedder import get_embedder
+from src.ingest.extract import list_documents, read_documents
+from src.ingest.chunk import iter_chunks
+from src.search.bm25 import default_lexical_path
+from src.search.shard import default_shards_path
+from src.ingest.incremental import default_manifest_path, run_ingest
 
 load_dotenv()
 
 RAW = os.getenv("RAW_DATA_DIR", "data/raw")
 CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
 INDEX_PATH  = os.getenv("INDEX_PATH", "./index/faiss.index")
+LEXICAL_PATH = os.getenv("LEXICAL_INDEX_PATH") or default_lexical_path(INDEX_PATH)
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))
+SHARDS_DIR = os.getenv("SHARDS_DIR") or default_shards_path(INDEX_PATH)
 EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
-EMB_CACHE   = os.getenv("EMB_CACHE", "true").lower() != "false"
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH") or default_manifest_path(INDEX_PATH)
 
-if __name__ == "__main__":
-    print("[1/4] Loading documents...")
-    docs = load_documents(RAW)
-    print(f"Loaded {len(docs)} documents from {RAW}")
-
-    print("[2/4] Chunking...")
-    rows = make_chunks(docs, max_chars=1000, overlap=100)
-    os.makedirs(os.path.dirname(CHUNKS_PATH), exist_ok=True)
-    with open(CHUNKS_PATH, "w", encoding="utf-8") as f:
-        for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-    print(f"Saved {len(rows)} chunks -> {CHUNKS_PATH}")
+def iter_document_chunks(paths):
+    # documents stream through chunking one at a time
+    return iter_chunks(read_documents(paths), max_chars=1000, overlap=100)
 
-    print("[3/4] Pre-warming embedding cache..." if EMB_CACHE else "[3/4] Skipping cache warm-up (EMB_CACHE=false)")
-    if EMB_CACHE and rows:
-        embedder = get_embedder(EMBED_MODEL)
-        texts = [r["text"] for r in rows]
-        # Batch to avoid OOM
-        B = int(os.getenv("EMB_WARM_BATCH", "256"))
-        for i in range(0, len(texts), B):
-            _ = embedder.embed_passages(texts[i:i+B])
-        print("Embedding cache warmed.")
-
-    print("[4/4] Building FAISS index...")
-    count, _ = build_faiss(CHUNKS_PATH, INDEX_PATH, EMBED_MODEL)
-    print(f"Indexed {count} chunks -> {INDEX_PATH}")
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Ingest documents; only new, modified and removed files are processed")
+    ap.add_argument("--full", action="store_true", help="re-read every document and rebuild all indexes")
+    args = ap.parse_args()
+
+    print(f"Ingesting documents from {RAW}")
+    run_ingest(list_documents(RAW), iter_document_chunks, CHUNKS_PATH, INDEX_PATH, LEXICAL_PATH, EMBED_MODEL,
+               MANIFEST_PATH, INDEX_SHARDS, SHARDS_DIR, full=args.full)
@@ -1,12 +1,9 @@
 import os
-import json
 import sys
 import asyncio
-import aiofiles
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
 from functools import partial
-import time
 from concurrent.futures import ThreadPoolExecutor
 
 # Add the project root to Python path
@@ -14,19 +11,23 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from dotenv import load_dotenv
-from src.ingest.extract import EXT_READERS
+from src.ingest.extract import EXT_READERS, list_documents
 from src.ingest.chunk import chunk_text
-from src.ingest.build_index import build_faiss
-from src.utils.cached_embedder import get_embedder
+from src.search.bm25 import default_lexical_path
+from src.search.shard import default_shards_path
+from src.ingest.incremental import default_manifest_path, run_ingest
 
 load_dotenv()
 
 RAW = os.getenv("RAW_DATA_DIR", "data/raw")
 CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
 INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+LEXICAL_PATH = os.getenv("LEXICAL_INDEX_PATH") or default_lexical_path(INDEX_PATH)
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))
+SHARDS_DIR = os.getenv("SHARDS_DIR") or default_shards_path(INDEX_PATH)
 EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
-EMB_CACHE = os.getenv("EMB_CACHE", "true").lower() != "false"
 N_WORKERS = int(os.getenv("N_WORKERS", str(max(1, cpu_count() - 1))))
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH") or default_manifest_path(INDEX_PATH)
 
 # Import document readers
 from src.ingest.extract import read_pdf, read_html, read_md_or_txt
@@ -59,37 +60,18 @@ async def process_document_async(file_info):
         print(f"[WARN] Failed to read {path}: {e}")
     return None
 
-def get_document_files(root):
-    """Get list of document files to process"""
-    files_to_process = []
-    for dirpath, _, filenames in os.walk(root):
-        for filename in filenames:
-            ext = os.path.splitext(filename.lower())[1]
-            if ext in EXT_READERS:
-                files_to_process.append((dirpath, filename))
-    return files_to_process
-
-async def process_documents_async(root, max_concurrent=10):
-    """Load documents using async processing"""
-    files_to_process = get_document_files(root)
+async def iter_document_batches_async(paths, max_concurrent=10):
+    """Yield documents in batches of up to max_concurrent files read concurrently"""
+    files_to_process = [os.path.split(path) for path in paths]
     print(f"Found {len(files_to_process)} documents to process")
     
-    if not files_to_process:
-        return []
-    
-    # Process documents with limited concurrency
-    semaphore = asyncio.Semaphore(max_concurrent)
-    
-    async def process_with_semaphore(file_info):
-        async with semaphore:
-            return await process_document_async(file_info)
-    
-    tasks = [process_with_semaphore(file_info) for file_info in files_to_process]
-    results = await asyncio.gather(*tasks)
-    
-    # Filter out None results
-    docs = [doc for doc in results if doc is not None]
-    return docs
+    # only one batch of full document texts is in memory at a time
+    for i in range(0, len(files_to_process), max_concurrent):
+        batch = files_to_process[i:i + max_concurrent]
+        results = await asyncio.gather(*(process_document_async(file_info) for file_info in batch))
+        docs = [doc for doc in results if doc is not None]
+        if docs:
+            yield docs
 
 def chunk_document_parallel(doc, max_chars=1000, overlap=100):
     """Chunk a single document in parallel"""
@@ -103,81 +85,36 @@ def chunk_document_parallel(doc, max_chars=1000, overlap=100):
         })
     return chunks
 
-def process_chunks_parallel(docs, max_chars=1000, overlap=100, n_workers=None):
-    """Process chunks using parallel processing"""
+def iter_chunks_async(paths, max_chars=1000, overlap=100, max_concurrent=10, n_workers=None):
+    """Stream chunk rows: documents are read concurrently on an event loop, batch by batch, and chunked in a process pool"""
     if n_workers is None:
         n_workers = N_WORKERS
     
-    print(f"Chunking {len(docs)} documents with {n_workers} workers")
-    
-    # Create partial function with fixed parameters
     chunk_func = partial(chunk_document_parallel, max_chars=max_chars, overlap=overlap)
-    
-    # Use multiprocessing to chunk documents in parallel
-    with Pool(processes=n_workers) as pool:
-        chunk_results = pool.map(chunk_func, docs)
-    
-    # Flatten results
-    all_chunks = []
-    for chunks in chunk_results:
-        all_chunks.extend(chunks)
-    
-    return all_chunks
-
-async def save_chunks_async(chunks, filepath):
-    """Save chunks asynchronously"""
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    
-    async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
-        for chunk in chunks:
-            await f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
-
-def warm_embedding_cache_parallel(texts, embedder, batch_size=256):
-    """Warm embedding cache using parallel processing"""
-    print(f"Warming embedding cache for {len(texts)} texts")
-    
-    # Process in batches to avoid OOM
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        _ = embedder.embed_passages(batch)
-        print(f"Processed batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
-
-async def ingest_async():
-    """Main ingestion function with async processing"""
-    start_time = time.time()
-    
-    print(f"[1/4] Loading documents asynchronously...")
-    docs = await process_documents_async(RAW, max_concurrent=10)
-    print(f"Loaded {len(docs)} documents from {RAW}")
-    
-    print(f"[2/4] Chunking with {N_WORKERS} workers...")
-    rows = process_chunks_parallel(docs, max_chars=1000, overlap=100)
-    
-    # Save chunks asynchronously
-    print(f"Saving {len(rows)} chunks...")
-    await save_chunks_async(rows, CHUNKS_PATH)
-    print(f"Saved chunks -> {CHUNKS_PATH}")
-    
-    print("[3/4] Pre-warming embedding cache..." if EMB_CACHE else "[3/4] Skipping cache warm-up (EMB_CACHE=false)")
-    if EMB_CACHE and rows:
-        embedder = get_embedder(EMBED_MODEL)
-        texts = [row["text"] for row in rows]
-        batch_size = int(os.getenv("EMB_WARM_BATCH", "256"))
-        warm_embedding_cache_parallel(texts, embedder, batch_size=batch_size)
-        print("Embedding cache warmed.")
-    
-    print("[4/4] Building FAISS index...")
-    count, _ = build_faiss(CHUNKS_PATH, INDEX_PATH, EMBED_MODEL)
-    print(f"Indexed {count} chunks -> {INDEX_PATH}")
-    
-    total_time = time.time() - start_time
-    print(f"✅ Async ingestion completed in {total_time:.2f} seconds")
-
-def ingest():
-    """Wrapper function to run async ingestion"""
-    asyncio.run(ingest_async())
+    loop = asyncio.new_event_loop()
+    batches = iter_document_batches_async(paths, max_concurrent=max_concurrent)
+    try:
+        with Pool(processes=n_workers) as pool:
+            while True:
+                try:
+                    docs = loop.run_until_complete(batches.__anext__())
+                except StopAsyncIteration:
+                    break
+                for chunks in pool.map(chunk_func, docs):
+                    yield from chunks
+    finally:
+        loop.run_until_complete(batches.aclose())
+        loop.close()
+
+def ingest(full=False):
+    """Main ingestion function with async reads; unchanged files (see Manifest) are skipped"""
+    return run_ingest(list_documents(RAW), iter_chunks_async, CHUNKS_PATH, INDEX_PATH, LEXICAL_PATH, EMBED_MODEL,
+                      MANIFEST_PATH, INDEX_SHARDS, SHARDS_DIR, full=full)
 
 if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Async ingestion; only new, modified and removed files are processed")
+    ap.add_argument("--full", action="store_true", help="re-read every document and rebuild all indexes")
+    args = ap.parse_args()
     print(f"🚀 Starting async ingestion with {N_WORKERS} workers")
-    ingest()
-
+    ingest(args.full)
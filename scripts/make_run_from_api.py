@@ -6,6 +6,7 @@ def main():
     ap.add_argument("--api", default=os.environ.get("API_URL","http://127.0.0.1:8000"), help="Base URL of FastAPI (without trailing slash)")
     ap.add_argument("--qa", default="data/eval/qa_min.jsonl", help="Path to qa jsonl")
     ap.add_argument("--top_k", type=int, default=int(os.environ.get("TOP_K","6")))
+    ap.add_argument("--batch", type=int, default=32, help="Questions per POST /search/batch request")
     ap.add_argument("--out", default="run_min.jsonl", help="Output run (basenames)")
     ap.add_argument("--out_full", default="run_min_fullpaths.jsonl", help="Output run (full paths)")
     args = ap.parse_args()
@@ -14,16 +15,19 @@ def main():
         qas = [json.loads(l) for l in f if l.strip()]
 
     out_bn, out_full = [], []
-    for item in qas:
-        q = item["question"]
-        r = requests.get(f"{args.api}/search", params={"q": q, "top_k": args.top_k}, timeout=60)
+    for i in range(0, len(qas), args.batch):
+        questions = [item["question"] for item in qas[i:i + args.batch]]
+        r = requests.post(f"{args.api}/search/batch", json={"queries": questions, "top_k": args.top_k}, timeout=300)
         r.raise_for_status()
-        hits = r.json()["hits"]
-        ranking_full = [h["doc_path"] for h in hits]
-        ranking_bn = [os.path.basename(p) for p in ranking_full]
-        out_full.append({"question": q, "ranking": ranking_full})
-        out_bn.append({"question": q, "ranking": ranking_bn})
-        print(f"[OK] {q} -> {ranking_bn}")
+        body = r.json()
+        if "error" in body:
+            raise RuntimeError(f"/search/batch failed: {body['error']}")
+        for q, res in zip(questions, body["results"]):
+            ranking_full = [h["doc_path"] for h in res["hits"]]
+            ranking_bn = [os.path.basename(p) for p in ranking_full]
+            out_full.append({"question": q, "ranking": ranking_full})
+            out_bn.append({"question": q, "ranking": ranking_bn})
+            print(f"[OK] {q} -> {ranking_bn}")
 
     with open(args.out_full, "w", encoding="utf-8") as f:
         for row in out_full:
@@ -0,0 +1,91 @@
+import os, json, sys, time
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from dotenv import load_dotenv
+from src.ingest.incremental import Manifest, default_manifest_path, update_indexes
+from src.search.bm25 import default_lexical_path
+from src.search.lexical_index import LexicalIndex
+from src.search.shard import default_shards_path, load_manifest, shard_paths
+
+load_dotenv()
+
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
+INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+LEXICAL_PATH = os.getenv("LEXICAL_INDEX_PATH") or default_lexical_path(INDEX_PATH)
+EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))
+SHARDS_DIR = os.getenv("SHARDS_DIR") or default_shards_path(INDEX_PATH)
+
+def load_rows(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+def update(new_chunks_path: str | None, stale_ids):
+    """Append and/or delete chunk rows in chunks.jsonl, embeddings.npy, the vector and the lexical index.
+
+    Goes through the same ``update_indexes`` as incremental ingest, so the
+    indexes stay aligned; the manifest, if any, is told about the new row
+    count and the deleted rows.
+    """
+    new_ids = update_indexes(new_chunks_path, list(stale_ids), CHUNKS_PATH, INDEX_PATH, LEXICAL_PATH, EMBED_MODEL)
+    manifest_path = default_manifest_path(INDEX_PATH)
+    if os.path.exists(manifest_path):
+        Manifest(manifest_path).record_edit(stale_ids, CHUNKS_PATH)
+    return new_ids
+
+def add(new_chunks_path: str):
+    """Append rows to chunks.jsonl and index them (vectors and a lexical delta segment)."""
+    new_ids = update(new_chunks_path, [])
+    ids = sorted(i for rows in new_ids.values() for i in rows)
+    print(f"Added {len(ids)} chunks as ids {ids[0] if ids else '-'}..{ids[-1] if ids else '-'}")
+
+def delete(idx: LexicalIndex, chunk_ids, doc_paths):
+    """Delete chunks by chunk_id or by source document path: tombstoned, and removed from the vector index where it can."""
+    chunk_ids, doc_paths = set(chunk_ids or []), set(doc_paths or [])
+    rows = load_rows(CHUNKS_PATH)
+    ids = [i for i, r in enumerate(rows) if (r.get("chunk_id") in chunk_ids or r.get("doc_path") in doc_paths) and not idx.deleted[i]]
+    update(None, ids)
+
+def lexical_paths():
+    """The lexical index directories in use: one per shard when INDEX_SHARDS > 1."""
+    if INDEX_SHARDS > 1:
+        return [shard_paths(os.path.join(SHARDS_DIR, e["name"]))[2] for e in load_manifest(SHARDS_DIR)]
+    return [LEXICAL_PATH]
+
+def compact(path: str):
+    """Merge all segments of one lexical index and purge its tombstoned postings."""
+    idx = LexicalIndex.load(path)
+    idx.merge(full=True)
+    idx.wait_for_merge()
+    idx.save()
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser(description="Add or delete chunks in place: chunks.jsonl, embeddings, vector and lexical (BM25) index")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    p_add = sub.add_parser("add", help="embed and index new chunks (jsonl with doc_path/chunk_id/text)")
+    p_add.add_argument("chunks")
+    p_del = sub.add_parser("delete", help="delete chunks (tombstoned; removed from the vector index unless it is HNSW)")
+    p_del.add_argument("--chunk_id", action="append")
+    p_del.add_argument("--doc_path", action="append")
+    sub.add_parser("compact", help="merge all segments and purge tombstoned postings")
+    args = p.parse_args()
+
+    t0 = time.time()
+    if INDEX_SHARDS > 1 and args.cmd != "compact":
+        sys.exit(f"INDEX_SHARDS={INDEX_SHARDS}: sharded indexes cannot be updated in place; re-run scripts/ingest.py")
+    if args.cmd == "add":
+        add(args.chunks)
+    elif args.cmd == "delete":
+        delete(LexicalIndex.load(LEXICAL_PATH), args.chunk_id, args.doc_path)
+    else:
+        for path in lexical_paths():
+            compact(path)
+    for path in lexical_paths():
+        idx = LexicalIndex.load(path)
+        print(f"{path}: {idx.n_live} live chunks in {len(idx.segments)} segment(s)")
+    print(f"Done in {time.time() - t0:.2f}s")
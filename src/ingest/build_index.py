@@ -1,22 +1,239 @@
 import json
 import os
+import shutil
+from itertools import islice
 import faiss
 import numpy as np
-from .embed import E5Embedder
+from faiss.contrib.ondisk import merge_ondisk
+from src.search.bm25 import BM25Okapi, tokenize
+from src.search.shard import MANIFEST, shard_paths
+from src.search.vector_index import (add_rows, ann_report, default_embeddings_path, default_ivfdata_path,
+                                     index_config, make_index, train_sample)
+from src.utils.cached_embedder import get_embedder
+from .memory import MemoryBudget
 
-def build_faiss(chunks_path: str, index_path: str, embed_model: str):
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        rows = [json.loads(line) for line in f]
+ANN_REPORT_QUERIES = os.getenv("ANN_REPORT_QUERIES", "data/eval/qa.jsonl")
+# chunks per embedding batch; each batch goes to the cache, embeddings.npy and the index once
+EMB_BATCH = int(os.getenv("EMB_BATCH", os.getenv("EMB_WARM_BATCH", "256")))
+
+def embed_to_disk(embedder, texts, n: int, emb_path: str, batch_size: int = EMB_BATCH, on_batch=None,
+                  budget: MemoryBudget | None = None) -> np.ndarray:
+    """Embed a stream of ``n`` texts batch by batch into a float32 .npy at ``emb_path``; returns it memory-mapped.
+
+    Only one batch of texts and vectors is in memory at a time; ``budget``
+    shrinks the batch when RSS exceeds the ingest ceiling. ``on_batch(start, E)``
+    sees every batch as it is produced (e.g. to ``index.add`` it). The file
+    is written under a temporary name and renamed at the end, so a server
+    mapping the old one is unaffected.
+    """
+    tmp = emb_path + ".tmp.npy"
+    X = None
+    texts, start = iter(texts), 0
+    while True:
+        batch = list(islice(texts, batch_size))
+        if not batch:
+            break
+        E = np.asarray(embedder.embed_passages(batch), dtype=np.float32)
+        if X is None:
+            X = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(n, E.shape[1]))
+        X[start:start + len(E)] = E
+        if on_batch is not None:
+            on_batch(start, E)
+        start += len(E)
+        if budget is not None:
+            batch_size = budget.check(batch_size)
+    if X is None:
+        raise ValueError("No chunks to embed")
+    if start != n:
+        raise ValueError(f"Expected {n} texts, got {start}")
+    X.flush()
+    del X
+    os.replace(tmp, emb_path)
+    return np.load(emb_path, mmap_mode="r")
 
-    texts = [r["text"] for r in rows]
-    embedder = E5Embedder(embed_model)
-    X = embedder.embed_passages(texts)
+def build_faiss(chunks_path: str, index_path: str, embed_model: str, index_type: str | None = None,
+                report: bool = True, embedder=None, **overrides):
+    """Embed all chunks and write a FAISS index of FAISS_INDEX_TYPE (see vector_index.INDEX_TYPES).
 
-    dim = X.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine via normalized vectors
-    index.add(X)
+    Chunks are embedded once, in EMB_BATCH batches, through the cached
+    embedder (EMB_CACHE), so vectors go to the cache, embeddings.npy and the
+    index in the same pass; types that need no training index each batch as
+    it arrives. embeddings.npy is also used for exact re-scoring of quantized
+    indexes. For approximate types a recall/latency report against exact
+    search is written as ann_report.json. With FAISS_ONDISK the index is
+    built shard by shard (see _build_ondisk).
 
+    chunks.jsonl is streamed, never loaded whole. INGEST_MAX_MEMORY_MB caps
+    the embedding batch, training sample and on-disk shard size.
+    Returns the number of chunks indexed.
+    """
+    n = _count_lines(chunks_path)
+    embedder = embedder or get_embedder(embed_model)
+    cfg = index_config(index_type, **overrides)
+    budget = MemoryBudget()
     os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    emb_path = default_embeddings_path(index_path)
+
+    index = None
+    def add(start, E):
+        nonlocal index
+        if index is None:
+            index = make_index(E.shape[1], n, cfg)  # cosine via normalized vectors
+        if index.is_trained:
+            add_rows(index, E, start)
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        texts = (json.loads(line)["text"] for line in f)
+        X = embed_to_disk(embedder, texts, n, emb_path, on_batch=None if cfg["ondisk"] else add, budget=budget)
+    row_bytes = 4 * X.shape[1]
+    cfg["train_sample"] = budget.rows(row_bytes, cfg["train_sample"])
+
+    if cfg["ondisk"]:
+        cfg["shard_size"] = budget.rows(row_bytes, cfg["shard_size"])
+        index = _build_ondisk(X, index_path, cfg)
+    else:
+        if not index.is_trained:
+            # IVF / PQ / SQ: train on a sample once everything is embedded, then add from disk
+            index.train(np.ascontiguousarray(train_sample(X, cfg["train_sample"])))
+            for start in range(0, len(X), EMB_BATCH):
+                add_rows(index, np.ascontiguousarray(X[start:start + EMB_BATCH]), start)
+        faiss.write_index(index, index_path)
+        # lists from an earlier on-disk build would be picked up by read_index
+        if os.path.exists(default_ivfdata_path(index_path)):
+            os.remove(default_ivfdata_path(index_path))
+
+    if report and cfg["index_type"] != "flat":
+        rep = ann_report(index, X, _report_queries(embedder, X), flat_baseline=not cfg["ondisk"])
+        rep["config"] = cfg
+        rep_path = os.path.join(os.path.dirname(index_path), "ann_report.json")
+        with open(rep_path, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2)
+        _print_report(rep, rep_path)
+
+    return n
+
+def _count_lines(path: str) -> int:
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+def _build_ondisk(X: np.ndarray, index_path: str, cfg: dict):
+    """IVF index whose inverted lists live in <index>.ivfdata; only centroids stay in RAM.
+
+    At most one shard of ``shard_size`` vectors (plus the training sample) is
+    held in memory: the quantizer is trained on a sample of the memory-mapped
+    embeddings ``X``, each shard is added to a copy of the empty trained
+    index and written out, and the shards' lists are merged into the
+    .ivfdata file.
+    """
+    shard = max(1, cfg["shard_size"])
+    index = make_index(X.shape[1], len(X), cfg)
+    index.train(np.ascontiguousarray(train_sample(X, cfg["train_sample"])))
+
+    shard_dir = os.path.join(os.path.dirname(index_path), "ivf_shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_paths = []
+    for n, start in enumerate(range(0, len(X), shard)):
+        part = faiss.clone_index(index)
+        block = np.ascontiguousarray(X[start:start + shard])
+        part.add_with_ids(block, np.arange(start, start + len(block), dtype=np.int64))
+        shard_paths.append(os.path.join(shard_dir, f"shard_{n:04d}.index"))
+        faiss.write_index(part, shard_paths[-1])
+        del part, block
+        print(f"  shard {n + 1}: {min(start + shard, len(X))}/{len(X)} vectors")
+
+    # unlink rather than overwrite: a running server keeps reading the old lists
+    ivfdata = default_ivfdata_path(index_path)
+    if os.path.exists(ivfdata):
+        os.remove(ivfdata)
+    merge_ondisk(index, shard_paths, ivfdata)
     faiss.write_index(index, index_path)
+    shutil.rmtree(shard_dir)
+    return index
+
+def _report_queries(embedder, X: np.ndarray, n: int = 200) -> np.ndarray:
+    """Eval questions if available, else a sample of the passages themselves."""
+    if os.path.exists(ANN_REPORT_QUERIES):
+        with open(ANN_REPORT_QUERIES, "r", encoding="utf-8") as f:
+            questions = [json.loads(l)["question"] for l in f if l.strip()][:n]
+        if questions:
+            return embedder.embed_queries(questions)
+    rows = np.random.default_rng(0).choice(len(X), min(n, len(X)), replace=False)
+    return np.ascontiguousarray(X[rows])
+
+def _print_report(rep: dict, path: str):
+    k = rep["k"]
+    flat = f", exact flat search {rep['flat_ms_per_query']:.3f} ms/query" if rep["flat_ms_per_query"] is not None else ""
+    print(f"ANN report ({rep['n_queries']} queries{flat}) -> {path}")
+    for r in rep["runs"]:
+        knob = f"{r['knob']}={r['value']}" if r["knob"] else "default"
+        print(f"  {knob:<16} recall@{k} {r[f'recall@{k}']:.3f}  {r['ms_per_query']:.3f} ms/query")
+
+def build_lexical_index(chunks_path: str, lexical_path: str):
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        bm25 = BM25Okapi(tokenize(json.loads(line).get("text", "")) for line in f)
+    bm25.save(lexical_path)
+    return bm25.N
+
+def build_shards(chunks_path: str, shards_dir: str, embed_model: str, n_shards: int,
+                 index_type: str | None = None, embedder=None, **overrides):
+    """Split chunks.jsonl into ``n_shards`` contiguous row ranges, each with its own vector and lexical index.
+
+    Shard directories hold faiss.index, embeddings.npy, chunks.jsonl and bm25/;
+    shards.json records each shard's first global row id for ShardedRetriever.
+    """
+    n = _count_lines(chunks_path)
+    n_shards = max(1, min(n_shards, n))
+    bounds = np.linspace(0, n, n_shards + 1).astype(int)
+    embedder = embedder or get_embedder(embed_model)
+    entries = []
+    with open(chunks_path, "r", encoding="utf-8") as src:
+        for s in range(n_shards):
+            name = f"shard_{s:03d}"
+            index_path, shard_chunks, lexical_path = shard_paths(os.path.join(shards_dir, name))
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with open(shard_chunks, "w", encoding="utf-8") as f:
+                f.writelines(islice(src, bounds[s + 1] - bounds[s]))
+            print(f"  {name}: chunks {bounds[s]}-{bounds[s + 1]}")
+            build_faiss(shard_chunks, index_path, embed_model, index_type, embedder=embedder, **overrides)
+            build_lexical_index(shard_chunks, lexical_path)
+            entries.append({"name": name, "offset": int(bounds[s]), "count": int(bounds[s + 1] - bounds[s])})
+    tmp = os.path.join(shards_dir, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"shards": entries}, f, indent=2)
+    os.replace(tmp, os.path.join(shards_dir, MANIFEST))
+    return n
 
-    return len(rows), rows
+if __name__ == "__main__":
+    # Rebuild only the vector index from an existing chunks.jsonl, e.g.
+    #   python -m src.ingest.build_index --index_type hnsw --ef_search 128
+    # or, with --shards N, the per-shard vector and lexical indexes
+    import argparse
+    from src.search.vector_index import INDEX_TYPES
+    p = argparse.ArgumentParser()
+    p.add_argument("--chunks_path", default=os.getenv("CHUNKS_PATH", "./index/chunks.jsonl"))
+    p.add_argument("--index_path", default=os.getenv("INDEX_PATH", "./index/faiss.index"))
+    p.add_argument("--embed_model", default=os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base"))
+    p.add_argument("--index_type", choices=sorted(INDEX_TYPES))
+    p.add_argument("--nlist", type=int)
+    p.add_argument("--pq_m", type=int)
+    p.add_argument("--hnsw_m", type=int)
+    p.add_argument("--train_sample", type=int)
+    p.add_argument("--nprobe", type=int)
+    p.add_argument("--ef_search", type=int)
+    p.add_argument("--ondisk", action="store_true", default=None, help="IVF lists on disk, built shard by shard")
+    p.add_argument("--shard_size", type=int)
+    p.add_argument("--no_report", action="store_true")
+    p.add_argument("--shards", type=int, default=int(os.getenv("INDEX_SHARDS", "1")),
+                   help="partition into N shards with their own vector + lexical index (SHARDS_DIR)")
+    args = p.parse_args()
+    knobs = dict(nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m, train_sample=args.train_sample,
+                 nprobe=args.nprobe, ef_search=args.ef_search, ondisk=args.ondisk, shard_size=args.shard_size)
+    if args.shards > 1:
+        from src.search.shard import default_shards_path
+        shards_dir = os.getenv("SHARDS_DIR") or default_shards_path(args.index_path)
+        count = build_shards(args.chunks_path, shards_dir, args.embed_model, args.shards, args.index_type,
+                             report=not args.no_report, **knobs)
+        print(f"Indexed {count} chunks into {args.shards} shards -> {shards_dir}")
+    else:
+        count = build_faiss(args.chunks_path, args.index_path, args.embed_model, args.index_type,
+                            report=not args.no_report, **knobs)
+        print(f"Indexed {count} chunks -> {args.index_path}")
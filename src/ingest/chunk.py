@@ -1,4 +1,6 @@
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
+import json
+import os
 import re
 
 SENT_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-ZА-ЯІЇЄҐ0-9])", re.UNICODE)
@@ -29,14 +31,26 @@ def chunk_text(text: str, max_chars: int = 1200, overlap: int = 200) -> List[str
         chunks = windowed
     return chunks
 
-def make_chunks(docs: List[Dict], **kw) -> List[Dict]:
-    rows = []
+def iter_chunks(docs: Iterable[Dict], **kw) -> Iterator[Dict]:
+    """Chunk rows for a stream of documents; each document's text can be dropped once it is chunked."""
     for d in docs:
         parts = chunk_text(d["text"], **kw)
         for j, p in enumerate(parts):
-            rows.append({
+            yield {
                 "doc_path": d["path"],
                 "chunk_id": f"{d['path']}::chunk_{j}",
                 "text": p,
-            })
-    return rows
+            }
+
+def make_chunks(docs: List[Dict], **kw) -> List[Dict]:
+    return list(iter_chunks(docs, **kw))
+
+def write_chunks(rows: Iterable[Dict], path: str) -> int:
+    """Stream chunk rows to a JSONL file; returns how many were written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            n += 1
+    return n
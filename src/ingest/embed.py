@@ -1,13 +1,35 @@
+import os
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+# torch: sentence-transformers in float32; onnx: int8-quantized ONNX Runtime (src/ingest/embed_onnx.py)
+BACKENDS = ("torch", "onnx")
+
+def embed_backend(backend: str | None = None) -> str:
+    backend = (backend or os.getenv("EMBED_BACKEND", "torch")).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND {backend!r}; expected one of {BACKENDS}")
+    return backend
+
+def embedder_id(model_name: str, backend: str | None = None) -> str:
+    """Name of the vectors a model produces: ONNX vectors differ slightly from the reference, so they are cached and indexed apart."""
+    if embed_backend(backend) == "onnx":
+        from .embed_onnx import ONNX_QUANTIZE
+        return f"{model_name}@onnx" + ("-int8" if ONNX_QUANTIZE else "")
+    return model_name
+
 class E5Embedder:
-    def __init__(self, model_name: str = "intfloat/multilingual-e5-base"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = "intfloat/multilingual-e5-base", backend: str | None = None):
+        self.backend = embed_backend(backend)
+        if self.backend == "onnx":
+            from .embed_onnx import OnnxEncoder
+            self.model = OnnxEncoder(model_name)
+        else:
+            self.model = SentenceTransformer(model_name)
 
-    def embed_passages(self, texts):
+    def embed_passages(self, texts, batch_size: int = 64, show_progress_bar: bool = True):
         marked = [f"passage: {t}" for t in texts]
-        embs = self.model.encode(marked, batch_size=64, normalize_embeddings=True, show_progress_bar=True)
+        embs = self.model.encode(marked, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=show_progress_bar)
         return np.asarray(embs, dtype="float32")
 
     def embed_queries(self, texts):
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+
+# EMBED_BACKEND=onnx: exported models live in ONNX_MODEL_DIR/<model name>/
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./index/onnx")
+# dynamic int8 quantization of the weights (activations are quantized per batch at run time)
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "true").lower() != "false"
+# intra-op threads per session (0 = ONNX Runtime default, one per physical core)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+MAX_SEQ_LENGTH = 512
+
+def default_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+def model_file(model_dir: str, quantize: bool) -> str:
+    return os.path.join(model_dir, "model.int8.onnx" if quantize else "model.onnx")
+
+def export(model_name: str, model_dir: str, quantize: bool = True) -> str:
+    """Export the Hugging Face encoder to ONNX (dynamic batch and sequence axes), int8-quantize it; returns the model path."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["query: export"], return_tensors="pt")
+    # forward() order; XLM-R based e5 models take no token_type_ids
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "sequence"} for n in names + ["last_hidden_state"]}
+    fp32 = model_file(model_dir, False)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[n] for n in names), fp32, input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=17)
+    if not quantize:
+        return fp32
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8 = model_file(model_dir, True)
+    quantize_dynamic(fp32, int8, weight_type=QuantType.QInt8)
+    return int8
+
+class OnnxEncoder:
+    """``SentenceTransformer.encode`` over an ONNX Runtime CPU session.
+
+    Same pipeline as the e5 sentence-transformers models: tokenize (truncated
+    to 512 tokens), mean-pool the last hidden state over the attention mask,
+    L2-normalize. Texts are batched shortest first, as sentence-transformers
+    does, to keep padding low. The model is exported (and quantized) on first
+    use.
+    """
+    def __init__(self, model_name: str, quantize: bool | None = None, model_dir: str | None = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        quantize = ONNX_QUANTIZE if quantize is None else quantize
+        model_dir = model_dir or default_model_dir(model_name)
+        path = model_file(model_dir, quantize)
+        if not os.path.exists(path):
+            print(f"Exporting {model_name} to {path} ...")
+            export(model_name, model_dir, quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = min(MAX_SEQ_LENGTH, self.tokenizer.model_max_length)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            opts.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size: int = 64, normalize_embeddings: bool = True, show_progress_bar: bool = False, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        out = None
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            enc = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.inputs}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if out is None:
+                out = np.empty((len(texts), pooled.shape[1]), dtype="float32")
+            out[idx] = pooled
+        if normalize_embeddings:
+            out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        return out
@@ -0,0 +1,144 @@
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+import numpy as np
+
+# Passage embedding at ingest: EMBED_WORKERS processes x EMBED_THREADS threads (0 = auto)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+# tokens (longest text x batch size) per model call, and the batch size cap for short texts
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "16384"))
+EMBED_MAX_BATCH = 256
+# pin each worker to its own cores (Linux)
+EMBED_PIN_CPUS = os.getenv("EMBED_PIN_CPUS", "true").lower() != "false"
+MAX_SEQ_LENGTH = 512
+
+_embedder = None
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _init_worker(model_name: str, backend: str | None, threads: int, cores):
+    global _embedder
+    cpus = cores.get() if cores is not None else None
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ONNX_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        # torch may already be imported (the parent's main module is re-imported under spawn)
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from src.ingest.embed import E5Embedder
+    _embedder = E5Embedder(model_name, backend)
+
+def _embed_passages(texts: List[str]) -> np.ndarray:
+    return _embedder.embed_passages(texts, batch_size=len(texts), show_progress_bar=False)
+
+def _embed_queries(texts: List[str]) -> np.ndarray:
+    return _embedder.embed_queries(texts)
+
+class EmbedPool:
+    """Passage embedding across worker processes, in length-bucketed batches.
+
+    Same ``embed_passages`` / ``embed_queries`` interface as E5Embedder, so it
+    slots in as CachedEmbedder's inner model. Each call sorts its texts by
+    token length, cuts them into batches of about EMBED_BATCH_TOKENS padded
+    tokens (many short texts or a few long ones, so little compute goes to
+    padding) and hands the batches, longest first, to EMBED_WORKERS spawned
+    processes. Each worker has EMBED_THREADS intra-op threads, pinned to its
+    own cores. Results come back in input order. Workers start, and load the
+    model, on the first call.
+    """
+    def __init__(self, model_name: str, workers: int | None = None, threads: int | None = None,
+                 backend: str | None = None, batch_tokens: int | None = None):
+        self.model_name = model_name
+        self.backend = backend
+        cores = available_cores()
+        workers = workers or EMBED_WORKERS or max(1, len(cores) // 4)
+        self.workers = max(1, min(workers, len(cores)))
+        self.threads = threads or EMBED_THREADS or max(1, len(cores) // self.workers)
+        self.cores = cores
+        self.batch_tokens = batch_tokens or EMBED_BATCH_TOKENS
+        self.executor = None
+        self.tokenizer = None
+        self.chunks = 0
+        self.seconds = 0.0
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def _start(self):
+        if self.executor is not None:
+            return
+        ctx = mp.get_context("spawn")
+        groups = None
+        if EMBED_PIN_CPUS and hasattr(os, "sched_setaffinity") and self.workers * self.threads <= len(self.cores):
+            groups = ctx.Queue()
+            for w in range(self.workers):
+                groups.put(self.cores[w * self.threads:(w + 1) * self.threads])
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=ctx, initializer=_init_worker,
+                                            initargs=(self.model_name, self.backend, self.threads, groups))
+        try:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        except Exception:
+            print("[WARN] No tokenizer for length bucketing; using ~4 characters per token")
+
+    def _lengths(self, texts: List[str]) -> np.ndarray:
+        if self.tokenizer is None:
+            return np.array([len(t) // 4 + 3 for t in texts])
+        ids = self.tokenizer([f"passage: {t}" for t in texts], truncation=True, max_length=MAX_SEQ_LENGTH)["input_ids"]
+        return np.array([len(x) for x in ids])
+
+    def _buckets(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """Positions grouped into batches of similar length, longest first."""
+        order = np.argsort(-lengths, kind="stable")
+        batches, i = [], 0
+        while i < len(order):
+            size = max(1, min(EMBED_MAX_BATCH, self.batch_tokens // max(int(lengths[order[i]]), 1)))
+            batches.append(order[i:i + size])
+            self.padded_tokens += int(lengths[order[i]]) * len(batches[-1])
+            i += size
+        self.tokens += int(lengths.sum())
+        return batches
+
+    def embed_passages(self, texts) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        self._start()
+        t0 = time.perf_counter()
+        batches = self._buckets(self._lengths(texts))
+        futures = [self.executor.submit(_embed_passages, [texts[j] for j in b]) for b in batches]
+        out = None
+        for b, fut in zip(batches, futures):
+            E = fut.result()
+            if out is None:
+                out = np.empty((len(texts), E.shape[1]), dtype="float32")
+            out[b] = E
+        self.seconds += time.perf_counter() - t0
+        self.chunks += len(texts)
+        return out
+
+    def embed_queries(self, texts) -> np.ndarray:
+        self._start()
+        return self.executor.submit(_embed_queries, list(texts)).result()
+
+    def report(self) -> str:
+        cores = self.workers * self.threads
+        rate = self.chunks / self.seconds if self.seconds else 0.0
+        fill = self.tokens / self.padded_tokens if self.padded_tokens else 1.0
+        return (f"Embedded {self.chunks} chunks in {self.seconds:.1f}s: {rate:.1f} chunks/s, "
+                f"{rate / cores:.2f} chunks/s per core ({self.workers} workers x {self.threads} threads, "
+                f"{fill:.0%} of batch tokens are text, not padding)")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
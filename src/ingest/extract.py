@@ -1,5 +1,5 @@
 import os
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
 from bs4 import BeautifulSoup
 import html2text
 from pypdf import PdfReader
@@ -35,17 +35,27 @@ EXT_READERS = {
     ".txt": read_md_or_txt,
 }
 
-def load_documents(root: str) -> List[Dict]:
-    docs = []
+def list_documents(root: str) -> List[str]:
+    """Paths of the readable documents under ``root``."""
+    paths = []
     for dirpath, _, filenames in os.walk(root):
         for fn in filenames:
-            ext = os.path.splitext(fn.lower())[1]
-            if ext in EXT_READERS:
-                path = os.path.join(dirpath, fn)
-                try:
-                    text = EXT_READERS[ext](path)
-                    if text and text.strip():
-                        docs.append({"path": path, "text": text})
-                except Exception as e:
-                    print(f"[WARN] Failed to read {path}: {e}")
-    return docs
+            if os.path.splitext(fn.lower())[1] in EXT_READERS:
+                paths.append(os.path.join(dirpath, fn))
+    return paths
+
+def read_documents(paths: Iterable[str]) -> Iterator[Dict]:
+    """Yield {"path", "text"} one document at a time, so only one full text is held in memory."""
+    for path in paths:
+        try:
+            text = EXT_READERS[os.path.splitext(path.lower())[1]](path)
+            if text and text.strip():
+                yield {"path": path, "text": text}
+        except Exception as e:
+            print(f"[WARN] Failed to read {path}: {e}")
+
+def iter_documents(root: str) -> Iterator[Dict]:
+    return read_documents(list_documents(root))
+
+def load_documents(root: str) -> List[Dict]:
+    return list(iter_documents(root))
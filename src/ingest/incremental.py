@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List
+
+import faiss
+import numpy as np
+
+from src.search.bm25 import BM25Okapi
+from src.search.lexical_index import LexicalIndex
+from src.search.vector_index import (add_rows, default_embeddings_path, default_ivfdata_path, index_config,
+                                     read_index, remove_rows)
+from src.utils.cached_embedder import get_embedder
+from .embed import embedder_id
+from .embed_pool import EmbedPool
+from .build_index import EMB_BATCH, _count_lines, build_faiss, build_lexical_index, build_shards
+from .chunk import write_chunks
+from .memory import MAX_MEMORY_MB, peak_rss_mb
+
+MANIFEST_VERSION = 1
+# fall back to a full rebuild once this share of chunk rows is tombstoned
+REBUILD_DEAD_RATIO = float(os.getenv("INGEST_REBUILD_DEAD_RATIO", "0.3"))
+
+def default_manifest_path(index_path: str) -> str:
+    """The ingest manifest lives next to the index: index/manifest.json."""
+    return os.path.join(os.path.dirname(index_path) or ".", "manifest.json")
+
+def file_sha256(path: str, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+def ingest_settings(embed_model: str, shards: int = 1) -> Dict:
+    """What the indexes were built with; a change to any of these needs a full rebuild."""
+    cfg = index_config()
+    return {"embed_model": embedder_id(embed_model), "index_type": cfg["index_type"], "ondisk": cfg["ondisk"], "shards": shards}
+
+@dataclass
+class Plan:
+    full: bool
+    reason: str = ""
+    changed: List[str] = field(default_factory=list)   # new or modified files, to be (re)chunked
+    removed: List[str] = field(default_factory=list)
+    stale_ids: List[int] = field(default_factory=list)  # chunk rows of changed and removed files
+    unchanged: int = 0
+
+    def summary(self) -> str:
+        return (f"{self.unchanged} unchanged, {len(self.changed)} new or modified, {len(self.removed)} removed "
+                f"file(s); {len(self.stale_ids)} chunk(s) to delete")
+
+class Manifest:
+    """Per-file size / mtime / content hash and the chunk rows each file produced.
+
+    ``plan`` compares it with the files on disk: files whose size and mtime
+    match are skipped without being opened, files that were only touched are
+    recognised by their sha256, and everything else is re-extracted. The
+    manifest is written last (``commit``), after chunks.jsonl and the indexes,
+    and records their row count, so an interrupted update is detected and
+    answered with a full rebuild.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {"version": MANIFEST_VERSION, "rows": 0, "dead": 0, "files": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        self._stats: Dict[str, Dict] = {}
+
+    @property
+    def files(self) -> Dict[str, Dict]:
+        return self.data["files"]
+
+    def _full_reason(self, settings: Dict, chunks_path: str, index_path: str, lexical_path: str) -> str:
+        if not os.path.exists(self.path):
+            return "no manifest yet"
+        if self.data.get("version") != MANIFEST_VERSION:
+            return "manifest format changed"
+        for key, value in settings.items():
+            if self.data.get(key) != value:
+                return f"{key} changed"
+        if settings.get("shards", 1) > 1:
+            return "sharded indexes are rebuilt in full"
+        for path in (chunks_path, index_path, default_embeddings_path(index_path)):
+            if not os.path.exists(path):
+                return f"{path} is missing"
+        if not BM25Okapi.exists(lexical_path):
+            return f"{lexical_path} is missing"
+        if _count_lines(chunks_path) != self.data["rows"]:
+            return f"{chunks_path} is out of sync with the manifest"
+        return ""
+
+    def plan(self, paths: List[str], settings: Dict, chunks_path: str, index_path: str, lexical_path: str,
+             full: bool = False) -> Plan:
+        """Work out which files to re-ingest and which chunk rows to delete."""
+        reason = "requested" if full else self._full_reason(settings, chunks_path, index_path, lexical_path)
+        known = {} if reason else self.files
+        plan = Plan(full=bool(reason), reason=reason)
+        for path in paths:
+            st = os.stat(path)
+            entry = known.get(path)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                plan.unchanged += 1
+                continue
+            stat = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(path)}
+            if entry and entry["sha256"] == stat["sha256"]:
+                # touched but identical: keep its chunks, remember the new mtime
+                entry.update(stat)
+                plan.unchanged += 1
+                continue
+            self._stats[path] = stat
+            plan.changed.append(path)
+            plan.stale_ids.extend(entry["ids"] if entry else [])
+        plan.removed = sorted(set(known) - set(paths))
+        for path in plan.removed:
+            plan.stale_ids.extend(known[path]["ids"])
+        if not plan.full:
+            dead = self.data["dead"] + len(plan.stale_ids)
+            if dead > REBUILD_DEAD_RATIO * max(self.data["rows"], 1):
+                # too many tombstones: start over rather than keep growing the indexes
+                plan = self.plan(paths, settings, chunks_path, index_path, lexical_path, full=True)
+                plan.reason = f"{dead} of {self.data['rows']} chunk rows would be tombstoned"
+        return plan
+
+    def commit(self, plan: Plan, new_ids: Dict[str, List[int]], settings: Dict, chunks_path: str):
+        """Record the outcome of ``plan`` (``new_ids``: chunk rows per changed file) and save atomically."""
+        files = {} if plan.full else self.files
+        for path in plan.removed:
+            files.pop(path, None)
+        for path in plan.changed:
+            if new_ids.get(path):
+                files[path] = {**self._stats[path], "ids": new_ids[path]}
+            else:
+                # extraction failed or found no text: leave it out so the next plan retries it
+                files.pop(path, None)
+        dead = 0 if plan.full else self.data["dead"] + len(plan.stale_ids)
+        self.data = {"version": MANIFEST_VERSION, **settings, "rows": _count_lines(chunks_path), "dead": dead,
+                     "files": files}
+        self._save()
+
+    def record_edit(self, stale_ids: List[int], chunks_path: str):
+        """Account for rows added or deleted by ``update_indexes`` outside ingest (scripts/update_lexical.py) and save."""
+        stale = set(stale_ids)
+        for entry in self.files.values():
+            entry["ids"] = [i for i in entry["ids"] if i not in stale]
+        self.data["rows"] = _count_lines(chunks_path)
+        self.data["dead"] += len(stale)
+        self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+def ids_by_path(chunks_path: str) -> Dict[str, List[int]]:
+    """Chunk row numbers per doc_path in ``chunks_path``."""
+    out: Dict[str, List[int]] = {}
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            out.setdefault(json.loads(line)["doc_path"], []).append(i)
+    return out
+
+def update_indexes(new_chunks_path: str | None, stale_ids: List[int], chunks_path: str, index_path: str,
+                   lexical_path: str, embed_model: str, embedder=None) -> Dict[str, List[int]]:
+    """Delete ``stale_ids`` and append the rows of ``new_chunks_path`` (None: none); returns the new rows per doc_path.
+
+    Only the new chunks are embedded. Row ids are never reused: new chunks
+    are appended to chunks.jsonl, deleted ones are tombstoned in the lexical
+    index (which the retrievers consult) and removed from the vector index
+    by id where the index type allows it (flat/SQ via IDMap, IVF natively;
+    HNSW keeps them until the next full build). An on-disk IVF index cannot
+    be edited in place and is rebuilt from the embedding cache.
+    """
+    n = _count_lines(chunks_path)
+    rows = []
+    if new_chunks_path is not None:
+        with open(new_chunks_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(l) for l in f if l.strip()]
+    texts = [r["text"] for r in rows]
+    lex = LexicalIndex.load(lexical_path)
+    emb_path = default_embeddings_path(index_path)
+    if lex.N != n or len(np.load(emb_path, mmap_mode="r")) != n:
+        raise ValueError(f"Indexes next to {index_path} do not match {chunks_path}; run a full ingest")
+
+    deleted = lex.delete(stale_ids)
+    ondisk = os.path.exists(default_ivfdata_path(index_path))
+    removed = 0
+    if not ondisk:
+        index = read_index(index_path, mmap=False)
+        removed = remove_rows(index, stale_ids)
+        if texts:
+            embedder = embedder or get_embedder(embed_model)
+            E = np.vstack([np.asarray(embedder.embed_passages(texts[i:i + EMB_BATCH]), dtype=np.float32)
+                           for i in range(0, len(texts), EMB_BATCH)])
+            add_rows(index, E, n)
+            _append_embeddings(emb_path, E, n)
+        # write beside and rename: a server mapping the old index keeps its pages
+        tmp = index_path + ".tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, index_path)
+
+    with open(chunks_path, "a", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    if texts:
+        lex.add(texts)
+    lex.wait_for_merge()
+    lex.save()
+    if ondisk:
+        # unchanged chunks are embedding cache hits, only the new ones reach the model
+        build_faiss(chunks_path, index_path, embed_model, report=False, embedder=embedder)
+    added = f" as rows {n}..{n + len(rows) - 1}" if rows else ""
+    print(f"Deleted {deleted} chunk(s) ({removed} vectors removed), added {len(rows)} chunk(s){added}")
+    new_ids: Dict[str, List[int]] = {}
+    for i, r in enumerate(rows):
+        new_ids.setdefault(r["doc_path"], []).append(n + i)
+    return new_ids
+
+def _append_embeddings(emb_path: str, E: np.ndarray, n: int, block: int = 65536):
+    """Rewrite embeddings.npy with ``E`` as rows ``n..``; copied blockwise from the old memory map."""
+    old = np.load(emb_path, mmap_mode="r")
+    tmp = emb_path + ".tmp.npy"
+    X = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(n + len(E), old.shape[1]))
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        X[start:stop] = old[start:stop]
+    X[n:] = E
+    X.flush()
+    del X, old
+    os.replace(tmp, emb_path)
+
+def run_ingest(paths: List[str], iter_chunks: Callable[[List[str]], Iterable[Dict]], chunks_path: str, index_path: str,
+               lexical_path: str, embed_model: str, manifest_path: str, shards: int = 1, shards_dir: str | None = None,
+               full: bool = False) -> Plan:
+    """Ingest ``paths``: plan against the manifest, chunk, embed and index, then commit the manifest.
+
+    ``iter_chunks(paths)`` streams the chunk rows of some documents; it is
+    the only part the ingest scripts differ in (sequential, process pool or
+    async reads). A full ingest rewrites chunks.jsonl and rebuilds every
+    index (per shard with ``shards`` > 1); an incremental one chunks only
+    new and modified files and goes through ``update_indexes``.
+    """
+    start = time.time()
+    manifest = Manifest(manifest_path)
+    settings = ingest_settings(embed_model, shards)
+    plan = manifest.plan(paths, settings, chunks_path, index_path, lexical_path, full=full)
+    # cache misses go to length-bucketed batches in EMBED_WORKERS processes
+    pool = EmbedPool(embed_model)
+    embedder = get_embedder(embed_model, inner=pool)
+    try:
+        if plan.full:
+            print(f"Full ingest ({plan.reason})")
+            new_ids = _ingest_full(paths, iter_chunks, chunks_path, index_path, lexical_path, embed_model, embedder,
+                                   shards, shards_dir)
+        else:
+            print(f"Incremental ingest: {plan.summary()}")
+            new_ids = {}
+            if plan.changed or plan.removed:
+                new_ids = _ingest_changes(plan, iter_chunks, chunks_path, index_path, lexical_path, embed_model, embedder)
+    finally:
+        pool.close()
+    manifest.commit(plan, new_ids, settings, chunks_path)
+    print(f"Manifest -> {manifest_path}")
+    if pool.chunks:
+        print(pool.report())
+    print(f"✅ Ingestion completed in {time.time() - start:.2f} seconds")
+    ceiling = f" (INGEST_MAX_MEMORY_MB={MAX_MEMORY_MB})" if MAX_MEMORY_MB else ""
+    print(f"Peak RSS {peak_rss_mb():.0f} MB, largest worker {peak_rss_mb(children=True):.0f} MB{ceiling}")
+    return plan
+
+def _ingest_full(paths, iter_chunks, chunks_path, index_path, lexical_path, embed_model, embedder, shards, shards_dir):
+    # documents stream through chunking to disk
+    print(f"[1/3] Loading and chunking {len(paths)} documents...")
+    count = write_chunks(iter_chunks(paths), chunks_path)
+    print(f"Saved {count} chunks -> {chunks_path}")
+    if shards > 1:
+        print(f"[2/3] Embedding chunks into {shards} index shards...")
+        count = build_shards(chunks_path, shards_dir, embed_model, shards, embedder=embedder)
+        print(f"Indexed {count} chunks -> {shards_dir}")
+        print("[3/3] Lexical indexes built per shard")
+    else:
+        print("[2/3] Embedding chunks into the FAISS index (and embedding cache)...")
+        count = build_faiss(chunks_path, index_path, embed_model, embedder=embedder)
+        print(f"Indexed {count} chunks -> {index_path}")
+        print("[3/3] Building lexical index...")
+        count = build_lexical_index(chunks_path, lexical_path)
+        print(f"Indexed {count} chunks -> {lexical_path}")
+    return ids_by_path(chunks_path)
+
+def _ingest_changes(plan, iter_chunks, chunks_path, index_path, lexical_path, embed_model, embedder):
+    new_chunks = chunks_path + ".new"
+    print(f"[1/2] Loading and chunking {len(plan.changed)} new or modified documents...")
+    count = write_chunks(iter_chunks(plan.changed), new_chunks)
+    print(f"Chunked {count} chunks -> {new_chunks}")
+    print("[2/2] Updating the vector and lexical indexes...")
+    new_ids = update_indexes(new_chunks, plan.stale_ids, chunks_path, index_path, lexical_path, embed_model, embedder)
+    os.remove(new_chunks)
+    return new_ids
@@ -0,0 +1,51 @@
+import gc
+import os
+import resource
+import sys
+
+# Soft ceiling for ingest memory; 0 = unlimited
+MAX_MEMORY_MB = int(os.getenv("INGEST_MAX_MEMORY_MB", "0"))
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb(children: bool = False) -> float:
+    """Peak RSS of this process, or of its largest finished child (e.g. pool workers)."""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2**20 if sys.platform == "darwin" else 1024)
+
+class MemoryBudget:
+    """Sizes ingest buffers to INGEST_MAX_MEMORY_MB and backs off when RSS goes over it.
+
+    ``rows`` caps up-front allocations (training sample, on-disk shard);
+    ``check`` runs after each embedding batch and halves the batch size
+    while the process is above the ceiling, down to MIN_BATCH (what is left
+    is the index itself; use a quantized or FAISS_ONDISK type to shrink it).
+    """
+    MIN_BATCH = 16
+
+    def __init__(self, limit_mb: int | None = None):
+        self.limit_mb = MAX_MEMORY_MB if limit_mb is None else limit_mb
+
+    def rows(self, row_bytes: int, wanted: int, share: float = 0.25) -> int:
+        """At most ``wanted`` rows of ``row_bytes`` each, within ``share`` of the ceiling."""
+        if not self.limit_mb:
+            return wanted
+        return max(1, min(wanted, int(self.limit_mb * 2**20 * share) // max(row_bytes, 1)))
+
+    def check(self, batch_size: int) -> int:
+        if not self.limit_mb or rss_mb() <= self.limit_mb:
+            return batch_size
+        gc.collect()
+        if rss_mb() <= self.limit_mb:
+            return batch_size
+        smaller = max(min(self.MIN_BATCH, batch_size), batch_size // 2)
+        if smaller < batch_size:
+            print(f"[WARN] RSS {rss_mb():.0f} MB over INGEST_MAX_MEMORY_MB={self.limit_mb}; embedding batch {batch_size} -> {smaller}")
+        return smaller
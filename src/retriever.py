@@ -1,175 +1,487 @@
 import json
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Tuple
-import faiss
 import numpy as np
 from src.utils.cached_embedder import get_embedder
-from src.search.bm25 import BM25Okapi, tokenize
+from src.search import diversity, shard
+from src.search.batcher import QueryBatcher
+from src.search.bm25 import BM25Okapi, default_lexical_path, tokenize
+from src.search.fusion import fuse, fusion_method
+from src.search.lexical_index import LexicalIndex, merge_stats
+from src.search.shard import MANIFEST as SHARDS_MANIFEST, Shard, default_shards_path, load_manifest
+from src.search.vector_index import default_embeddings_path, gather_vectors, open_index, open_vectors, search_live, search_params
 
-def _normalize_scores(m: dict) -> dict:
-    if not m:
-        return {}
-    vals = list(m.values())
-    lo, hi = min(vals), max(vals)
-    if hi - lo < 1e-9:
-        return {k: 1.0 for k in m}
-    return {k: (v - lo)/(hi - lo) for k, v in m.items()}
+# seconds an old retriever keeps serving the requests that picked it up before a reload swapped it out
+RETIRE_S = 60.0
+
+def _overlap_ratio(overlaps, q_tokens: List[str]) -> float:
+    """Share of (chunk, distinct query term) pairs where the term occurs in the chunk."""
+    if not len(overlaps) or not q_tokens:
+        return 0.0
+    return int(np.sum(overlaps)) / float(len(overlaps) * max(1, len(set(q_tokens))))
+
+def _fuse(vec: List[Tuple[int, float]], bm: List[Tuple[int, float]], alpha: float, method: str, top: int | None = None):
+    """``fuse`` over merged (id, score) lists."""
+    vec_ids, vec_scores = (np.array(x) for x in zip(*vec)) if vec else (np.zeros(0), np.zeros(0))
+    bm_ids, bm_scores = (np.array(x) for x in zip(*bm)) if bm else (np.zeros(0), np.zeros(0))
+    return fuse(vec_ids, vec_scores, bm_ids, bm_scores, alpha, method, top=top)
+
+def _hit(row: Dict, score: float, mode: str) -> Dict:
+    return {"score": float(score), "text": row["text"], "chunk_id": row["chunk_id"], "doc_path": row["doc_path"], "mode": mode}
+
+def open_retriever(index_path: str, chunks_path: str, embed_model: str, embedder=None, strict: bool = False):
+    """A Retriever, or a ShardedRetriever over SHARDS_DIR when the corpus was ingested with INDEX_SHARDS > 1."""
+    if int(os.getenv("INDEX_SHARDS", "1")) > 1:
+        return ShardedRetriever(os.getenv("SHARDS_DIR") or default_shards_path(index_path), embed_model, embedder=embedder)
+    return Retriever(index_path, chunks_path, embed_model, embedder=embedder, strict=strict)
+
+def index_version(index_path: str, chunks_path: str) -> Tuple:
+    """Identity (inode, mtime, size) of every file ingest and ``update_indexes`` rewrite; None for missing ones."""
+    lexical = os.getenv("LEXICAL_INDEX_PATH") or default_lexical_path(index_path)
+    shards_dir = os.getenv("SHARDS_DIR") or default_shards_path(index_path)
+    paths = [index_path, chunks_path, default_embeddings_path(index_path), os.path.join(shards_dir, SHARDS_MANIFEST)]
+    paths += [os.path.join(lexical, name) for name in ("meta.json", "segments.json", "deleted.npy")]
+    out = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            out.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            out.append(None)
+    return tuple(out)
+
+class RetrieverReloader:
+    """Serves a retriever and swaps in a fresh one when the indexes on disk change.
+
+    ``get`` stats the index files at most every ``check_s`` seconds (0: only
+    ``reload`` swaps). An update writes several files, so a change is picked
+    up once they have stayed the same for one more check, and reopened in a
+    background thread while the old retriever keeps serving. A reload whose
+    lexical index does not match chunks.jsonl (an update still being written)
+    is dropped and retried at the next change. The embedder is reused.
+    """
+    def __init__(self, index_path: str, chunks_path: str, embed_model: str, check_s: float = 2.0, batch: bool = False):
+        self.paths = (index_path, chunks_path)
+        self.embed_model = embed_model
+        self.check_s = check_s
+        self.batch = batch
+        self.version = self.seen = index_version(index_path, chunks_path)
+        self.retriever = self._open()
+        self.reloads = 0
+        self.checked = time.monotonic()
+        self.lock = threading.Lock()
+        self.reloading = threading.Lock()
+
+    def _open(self, embedder=None, strict: bool = False):
+        retriever = open_retriever(*self.paths, self.embed_model, embedder=embedder, strict=strict)
+        if self.batch:
+            retriever.start_batcher()
+        return retriever
+
+    def get(self):
+        """The retriever for this request; starts a background reload when the indexes on disk changed and settled."""
+        if self.check_s > 0 and time.monotonic() - self.checked >= self.check_s and self.lock.acquire(blocking=False):
+            try:
+                self.checked = time.monotonic()
+                version = index_version(*self.paths)
+                if version != self.version and version == self.seen and not self.reloading.locked():
+                    threading.Thread(target=self.reload, name="retriever-reload", daemon=True).start()
+                self.seen = version
+            finally:
+                self.lock.release()
+        return self.retriever
+
+    def reload(self) -> bool:
+        """Reopen the indexes and swap them in; False keeps the current retriever (update in progress)."""
+        with self.reloading:
+            version = index_version(*self.paths)
+            try:
+                new = self._open(embedder=self.retriever.embedder, strict=True)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Index reload skipped: {e}")
+                return False
+            if index_version(*self.paths) != version:
+                # files changed while loading: wait for the update to finish
+                new.close()
+                return False
+            old, self.retriever, self.version = self.retriever, new, version
+            self.reloads += 1
+        timer = threading.Timer(RETIRE_S, old.close)
+        timer.daemon = True
+        timer.start()
+        print(f"Reloaded indexes from {self.paths[0]} (reload {self.reloads})")
+        return True
 
 class Retriever:
-    def __init__(self, index_path: str, chunks_path: str, embed_model: str):
-        # Vector index
-        self.index = faiss.read_index(index_path)
+    def __init__(self, index_path: str, chunks_path: str, embed_model: str, lexical_path: str | None = None,
+                 embedder=None, strict: bool = False):
+        """``embedder`` reuses a loaded model; ``strict`` raises ValueError instead of rebuilding a lexical index that does not match the chunks."""
+        # Vector index (optionally re-scored with exact vectors, FAISS_RESCORE)
+        self.index = open_index(index_path)
         # Chunks
         with open(chunks_path, "r", encoding="utf-8") as f:
             self.rows = [json.loads(l) for l in f.read().splitlines()]
         # Embedder (cached)
-        self.embedder = get_embedder(embed_model)
-        # BM25 over chunk texts
-        self.texts = [r.get("text", "") for r in self.rows]
-        self.tokens = [tokenize(t) for t in self.texts]
-        self.bm25 = BM25Okapi(self.tokens)
+        self.embedder = embedder or get_embedder(embed_model)
+        # Passage vectors for MMR: embeddings.npy, else reconstructed by the index, else re-embedded
+        self.vectors = open_vectors(index_path, self.index, len(self.rows))
+        if self.vectors is None and self.rows and gather_vectors(self.index, None, [0]) is None:
+            print("[WARN] No stored passage vectors (embeddings.npy) and the index cannot reconstruct them; MMR re-embeds its candidates")
+        # BM25 over chunk texts: memory-map the index written at ingest, else build it here
+        if lexical_path is None:
+            lexical_path = os.getenv("LEXICAL_INDEX_PATH") or default_lexical_path(index_path)
+        self.bm25 = None
+        if BM25Okapi.exists(lexical_path):
+            try:
+                lex = LexicalIndex.load(lexical_path)
+                if lex.N == len(self.rows):
+                    self.bm25 = lex
+                elif strict:
+                    raise ValueError(f"Lexical index {lexical_path} has {lex.N} docs, chunks have {len(self.rows)}")
+                else:
+                    print(f"[WARN] Lexical index {lexical_path} has {lex.N} docs, chunks have {len(self.rows)}; rebuilding in memory")
+            except ValueError as e:
+                if strict:
+                    raise
+                print(f"[WARN] {e}; rebuilding in memory")
+        if self.bm25 is None:
+            self.bm25 = LexicalIndex(BM25Okapi(tokenize(r.get("text", "")) for r in self.rows))
+        self.batcher = None
 
-    # ---------- Vector only ----------
-    def _vector_topk(self, query: str, top_k: int) -> Tuple[List[Dict], List[int], List[float]]:
+    def start_batcher(self, max_batch: int | None = None, max_wait_ms: float | None = None) -> QueryBatcher:
+        """Coalesce concurrent searches into batched embedding and index calls (SEARCH_BATCH_MAX / _WAIT_MS)."""
+        def search(Q, k, nprobe, ef_search):
+            return self.index.search(Q, k, params=search_params(self.index, nprobe, ef_search))
+        self.batcher = QueryBatcher(self.embedder.embed_queries, search, max_batch, max_wait_ms)
+        return self.batcher
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def _embed_search(self, query: str, k: int, nprobe: int | None = None, ef_search: int | None = None):
+        """Query embedding (1 x d) and its (scores, ids) row, holding top-k live ids; through the batcher when one is running."""
+        dead = self.bm25.N - self.bm25.n_live
+        if self.batcher is not None:
+            embedded = []
+            def search(kk):
+                q, D, I = self.batcher.submit(query, kk, nprobe, ef_search)
+                embedded.append(q)
+                return D[None, :], I[None, :]
+            D, I = search_live(search, k, self.bm25.deleted, dead, self.index.ntotal)
+            return embedded[-1][None, :], D[0], I[0]
         q = self.embedder.embed_queries([query]).astype("float32")
-        D, I = self.index.search(q, top_k)
-        out = []
-        idxs = I[0].tolist()
-        scores = D[0].tolist()
-        for score, idx in zip(scores, idxs):
-            row = self.rows[idx]
-            out.append({
-                "score": float(score),
-                "text": row["text"],
-                "chunk_id": row["chunk_id"],
-                "doc_path": row["doc_path"],
-                "mode": "vector"
-            })
+        params = search_params(self.index, nprobe, ef_search)
+        D, I = search_live(lambda kk: self.index.search(q, kk, params=params), k, self.bm25.deleted, dead, self.index.ntotal)
+        return q, D[0], I[0]
+
+    # ---------- Vector only ----------
+    def _vector_topk(self, query: str, top_k: int, nprobe: int | None = None, ef_search: int | None = None) -> Tuple[List[Dict], List[int], List[float]]:
+        _, D, I = self._embed_search(query, top_k, nprobe, ef_search)
+        return self._vector_hits(D, I, top_k)
+
+    def _vector_hits(self, D: np.ndarray, I: np.ndarray, top_k: int) -> Tuple[List[Dict], List[int], List[float]]:
+        # skip padding (-1) and chunks tombstoned in the lexical index
+        live = [(s, i) for s, i in zip(D.tolist(), I.tolist()) if i >= 0 and not self.bm25.deleted[i]][:top_k]
+        scores = [s for s, _ in live]
+        idxs = [i for _, i in live]
+        out = [_hit(self.rows[idx], score, "vector") for score, idx in live]
         return out, idxs, scores
 
     # ---------- BM25 only ----------
     def _bm25_topk(self, query: str, top_k: int) -> Tuple[List[Dict], List[int], List[float]]:
-        q_tokens = tokenize(query)
-        scores_list = self.bm25.get_scores(q_tokens)
-        idxs = np.argsort(scores_list)[::-1][:top_k].tolist()
-        out = []
-        scores = []
-        for idx in idxs:
-            row = self.rows[int(idx)]
-            sc = float(scores_list[int(idx)])
-            scores.append(sc)
-            out.append({
-                "score": sc,
-                "text": row["text"],
-                "chunk_id": row["chunk_id"],
-                "doc_path": row["doc_path"],
-                "mode": "bm25"
-            })
+        return self._bm25_hits(*self.bm25.top_k(tokenize(query), top_k))
+
+    def _bm25_hits(self, top: np.ndarray, top_scores: np.ndarray) -> Tuple[List[Dict], List[int], List[float]]:
+        idxs = top.tolist()
+        scores = top_scores.tolist()
+        out = [_hit(self.rows[int(idx)], sc, "bm25") for idx, sc in zip(idxs, scores)]
         return out, idxs, scores
 
     # ---------- MMR (vector-only diversity) ----------
-    def _mmr(self, query: str, cand_idxs: List[int], top_k: int = 8, lambda_mult: float = 0.6) -> List[int]:
-        q_emb = self.embedder.embed_queries([query]).astype("float32")[0]
-        cand_texts = [self.rows[i]["text"] for i in cand_idxs]
-        cand_embs = self.embedder.embed_passages(cand_texts)
-        selected = []
-        selected_idx = []
-        def sim(a, b):  # cosine since normalized
-            return float(np.dot(a, b))
-        while len(selected) < min(top_k, len(cand_idxs)):
-            best_j = None
-            best_score = -1e9
-            for j in range(len(cand_idxs)):
-                if j in selected_idx:
-                    continue
-                relevance = sim(q_emb, cand_embs[j])
-                diversity = 0.0
-                if selected_idx:
-                    diversity = max(sim(cand_embs[j], cand_embs[k]) for k in selected_idx)
-                mmr = lambda_mult * relevance - (1 - lambda_mult) * diversity
-                if mmr > best_score:
-                    best_score = mmr
-                    best_j = j
-            selected_idx.append(best_j)
-            selected.append(cand_idxs[best_j])
-        return selected
-
-    # ---------- Lexical overlap heuristic ----------
-    def _lexical_overlap_ratio(self, q_tokens: List[str], idxs: List[int], check_k: int = 8) -> float:
-        idxs = idxs[:max(1, min(len(idxs), check_k))]
-        if not idxs or not q_tokens:
-            return 0.0
-        overlaps = 0
-        total = 0
-        qset = set(q_tokens)
-        for i in idxs:
-            tset = set(self.tokens[i])
-            inter = qset.intersection(tset)
-            overlaps += len(inter)
-            total += max(1, len(qset))
-        return overlaps / float(total)
+    def _passage_vectors(self, idxs: List[int]) -> np.ndarray:
+        """Stored vectors of chunk rows ``idxs``; the model only runs when there are none."""
+        embs = gather_vectors(self.index, self.vectors, idxs)
+        if embs is None:
+            embs = self.embedder.embed_passages([self.rows[i]["text"] for i in idxs])
+        return embs
+
+    def _diversify(self, query: str, cand_idxs: List[int], top_k: int = 8, strategy: str | None = "mmr", lambda_mult: float = 0.6, max_per_doc: int = 0, q_emb: np.ndarray | None = None) -> List[int]:
+        """Pick ``top_k`` of the ranked candidates with a diversity.STRATEGIES strategy (None: in rank order), at most ``max_per_doc`` per document."""
+        groups = [self.rows[i]["doc_path"] for i in cand_idxs] if max_per_doc else None
+        if strategy is None:
+            return [cand_idxs[j] for j in diversity.capped(range(len(cand_idxs)), groups, top_k, max_per_doc)]
+        if q_emb is None:
+            q_emb = self.embedder.embed_queries([query]).astype("float32")[0]
+        cand_embs = self._passage_vectors(cand_idxs)
+        return [cand_idxs[j] for j in diversity.select(strategy, q_emb, cand_embs, top_k, lambda_mult, groups, max_per_doc)]
 
     # ---------- Hybrid with optional lexical fallback ----------
-    def _hybrid(self, query: str, top_k: int = 8, fetch_k: int = 64, alpha: float = 0.6, mmr: bool = False, lambda_mult: float = 0.6, lexical_fallback: bool = True, fallback_check_k: int = 12) -> List[Dict]:
+    def _hybrid(self, query: str, top_k: int = 8, fetch_k: int = 64, alpha: float = 0.6, mmr: bool | str = False, lambda_mult: float = 0.6, lexical_fallback: bool = True, fallback_check_k: int = 12, nprobe: int | None = None, ef_search: int | None = None, max_per_doc: int = 0, fusion: str = "minmax") -> List[Dict]:
+        strategy = diversity.strategy(mmr)
+        method = fusion_method(fusion)
         # 1) Vector candidates
-        q = self.embedder.embed_queries([query]).astype("float32")
-        Dv, Iv = self.index.search(q, fetch_k)
-        vec_scores = {int(i): float(s) for i, s in zip(Iv[0].tolist(), Dv[0].tolist())}
+        q, Dv, Iv = self._embed_search(query, fetch_k, nprobe, ef_search)
+        Dv, Iv = self._live(Dv, Iv, fetch_k)
 
-        # 2) BM25 candidates
+        # 2) BM25 candidates, and the lexical overlap of the top vector hits from the same pass
         q_tokens = tokenize(query)
-        bm_scores_list = self.bm25.get_scores(q_tokens)
-        Ibm = np.argsort(bm_scores_list)[::-1][:fetch_k].tolist()
-        bm_scores = {int(i): float(bm_scores_list[i]) for i in Ibm}
+        check = Iv[:fallback_check_k] if lexical_fallback else Iv[:0]
+        Ibm, Sbm, overlap = self.bm25.top_k_many([q_tokens], fetch_k, overlap_docs=[check])[0]
+        return self._hybrid_rank(query, q[0], Dv, Iv, q_tokens, Ibm, Sbm, overlap, top_k, fetch_k, alpha, strategy, lambda_mult, lexical_fallback, max_per_doc, method)
+
+    def _live(self, D: np.ndarray, I: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The first ``k`` vector hits that are neither padding (-1) nor tombstoned."""
+        live = I >= 0
+        live[live] = ~self.bm25.deleted[I[live]]
+        return D[live][:k], I[live][:k]
 
+    def _hybrid_rank(self, query: str, q_emb: np.ndarray, Dv: np.ndarray, Iv: np.ndarray, q_tokens: List[str], Ibm: np.ndarray, Sbm: np.ndarray,
+                     overlap: np.ndarray, top_k: int, fetch_k: int, alpha: float, strategy: str | None, lambda_mult: float,
+                     lexical_fallback: bool, max_per_doc: int, method: str) -> List[Dict]:
+        """Hybrid hits of one query from its live vector and BM25 candidates.
+
+        ``overlap``: distinct query terms in each of the first vector hits (``top_k_many(overlap_docs=...)``).
+        """
         # 3) Adaptive alpha via lexical overlap
         alpha_used = alpha
         if lexical_fallback:
-            overlap_ratio = self._lexical_overlap_ratio(q_tokens, Iv[0].tolist(), check_k=fallback_check_k)
+            overlap_ratio = _overlap_ratio(overlap, q_tokens)
             # low overlap => rely more on BM25
             if overlap_ratio < 0.15:
                 alpha_used = min(alpha_used, 0.3)
 
-        # 4) Union & normalize both score spaces
-        cand_idxs = list(set(list(vec_scores.keys()) + list(bm_scores.keys())))
-        if not cand_idxs:
+        # 4) Union, map both score spaces to a common scale (fusion method) & combine
+        pool = max(top_k, fetch_k) if strategy or max_per_doc else top_k
+        ranked, scores = fuse(Iv, Dv, Ibm, Sbm, alpha_used, method, top=pool)
+        if not len(ranked):
             return []
-        vec_n = _normalize_scores(vec_scores)
-        bm_n = _normalize_scores(bm_scores)
-
-        # 5) Combine
-        combined = {}
-        for i in cand_idxs:
-            v = vec_n.get(i, 0.0)
-            b = bm_n.get(i, 0.0)
-            combined[i] = alpha_used * v + (1.0 - alpha_used) * b
-
-        # 6) Take top and (optionally) run MMR by embeddings
-        top_idxs = sorted(combined.keys(), key=lambda k: combined[k], reverse=True)[:max(top_k, 2)]
-        if mmr:
-            top_idxs = self._mmr(query, top_idxs, top_k=top_k, lambda_mult=lambda_mult)
+
+        # 5) Take top, or (optionally) diversify the top fetch_k by embeddings / per-document caps
+        combined = dict(zip(ranked.tolist(), scores.tolist()))
+        ranked = ranked.tolist()
+        if strategy or max_per_doc:
+            top_idxs = self._diversify(query, ranked, top_k, strategy, lambda_mult, max_per_doc, q_emb)
         else:
-            top_idxs = top_idxs[:top_k]
-
-        out = []
-        for idx in top_idxs:
-            row = self.rows[int(idx)]
-            out.append({
-                "score": float(combined[idx]),
-                "text": row["text"],
-                "chunk_id": row["chunk_id"],
-                "doc_path": row["doc_path"],
-                "mode": "hybrid-fallback" if lexical_fallback and alpha_used != alpha else "hybrid",
-            })
-        return out
+            top_idxs = ranked[:top_k]
+
+        label = "hybrid-fallback" if lexical_fallback and alpha_used != alpha else "hybrid"
+        return [_hit(self.rows[int(idx)], combined[idx], label) for idx in top_idxs]
 
     # Public API
-    def search(self, query: str, top_k: int = 8, mode: str = "vector", mmr: bool = False, fetch_k: int = 64, alpha: float = 0.6, lexical_fallback: bool = True) -> List[Dict]:
+    def search(self, query: str, top_k: int = 8, mode: str = "vector", mmr: bool | str = False, fetch_k: int = 64, alpha: float = 0.6, lexical_fallback: bool = True, nprobe: int | None = None, ef_search: int | None = None, lambda_mult: float = 0.6, max_per_doc: int = 0, fusion: str = "minmax") -> List[Dict]:
+        """nprobe / ef_search override the ANN index's stored query-time defaults (IVF / HNSW).
+
+        Hybrid only: ``fusion`` ("minmax", "rrf" or "zscore") puts the vector and
+        BM25 scores on a common scale before mixing them by alpha; ``mmr`` (true = "mmr", or "dpp" / "facility") picks a
+        diverse top_k from the top fetch_k candidates; ``max_per_doc`` caps
+        the hits per doc_path, with or without it.
+        """
         mode = (mode or "vector").lower()
         if mode == "bm25":
             hits, _, _ = self._bm25_topk(query, top_k)
             return hits
         if mode == "hybrid":
-            return self._hybrid(query, top_k=top_k, fetch_k=fetch_k, alpha=alpha, mmr=mmr, lexical_fallback=lexical_fallback)
+            return self._hybrid(query, top_k=top_k, fetch_k=fetch_k, alpha=alpha, mmr=mmr, lambda_mult=lambda_mult, lexical_fallback=lexical_fallback, nprobe=nprobe, ef_search=ef_search, max_per_doc=max_per_doc, fusion=fusion)
         # default: vector
-        hits, _, _ = self._vector_topk(query, top_k)
+        hits, _, _ = self._vector_topk(query, top_k, nprobe=nprobe, ef_search=ef_search)
         return hits
+
+    def search_many(self, queries: List[str], top_k: int = 8, mode: str = "vector", mmr: bool | str = False, fetch_k: int = 64, alpha: float = 0.6, lexical_fallback: bool = True, nprobe: int | None = None, ef_search: int | None = None, lambda_mult: float = 0.6, max_per_doc: int = 0, fusion: str = "minmax") -> List[List[Dict]]:
+        """``search`` for several queries at once; one hit list per query.
+
+        The queries are embedded in one call and searched in one index call,
+        and BM25 scores them together (``LexicalIndex.top_k_many``); fusion
+        and diversification then run per query. Bypasses the request batcher.
+        """
+        queries = list(queries)
+        mode = (mode or "vector").lower()
+        if not queries:
+            return []
+        if mode == "bm25":
+            return [self._bm25_hits(I, S)[0] for I, S in self.bm25.top_k_many([tokenize(q) for q in queries], top_k)]
+        if mode == "hybrid":
+            strategy = diversity.strategy(mmr)
+            method = fusion_method(fusion)
+        k = fetch_k if mode == "hybrid" else top_k
+        Q = self.embedder.embed_queries(queries).astype("float32")
+        params = search_params(self.index, nprobe, ef_search)
+        D, I = search_live(lambda kk: self.index.search(Q, kk, params=params), k, self.bm25.deleted, self.bm25.N - self.bm25.n_live, self.index.ntotal)
+        if mode != "hybrid":
+            return [self._vector_hits(D[j], I[j], top_k)[0] for j in range(len(queries))]
+        vec = [self._live(D[j], I[j], fetch_k) for j in range(len(queries))]
+        tokens = [tokenize(q) for q in queries]
+        # search checks the first fallback_check_k=12 vector hits for lexical overlap
+        checks = [Iv[:12] if lexical_fallback else Iv[:0] for _, Iv in vec]
+        lexical = self.bm25.top_k_many(tokens, fetch_k, overlap_docs=checks)
+        return [self._hybrid_rank(query, Q[j], Dv, Iv, tokens[j], Ibm, Sbm, overlap, top_k, fetch_k, alpha, strategy, lambda_mult, lexical_fallback, max_per_doc, method)
+                for j, (query, (Dv, Iv), (Ibm, Sbm, overlap)) in enumerate(zip(queries, vec, lexical))]
+
+class ShardedRetriever:
+    """Scatter-gather search over the shards written by ``build_shards`` (INDEX_SHARDS > 1).
+
+    Each shard (vector index, BM25 index, chunk rows) is served by its own
+    worker process, or thread with SHARD_EXECUTOR=thread; the query is
+    embedded once here. BM25 runs with collection statistics summed over all
+    shards, and per-shard candidates are merged before the scores are
+    normalized, so the ranking matches a Retriever over the unsharded corpus.
+    Only the final hits' rows are fetched back from the shards.
+    """
+    def __init__(self, shards_dir: str, embed_model: str, executor: str | None = None, embedder=None):
+        entries = load_manifest(shards_dir)
+        self.offsets = np.array([e["offset"] for e in entries], dtype=np.int64)
+        dirs = [os.path.join(shards_dir, e["name"]) for e in entries]
+        self.embedder = embedder or get_embedder(embed_model)
+        executor = (executor or os.getenv("SHARD_EXECUTOR", "process")).lower()
+        if executor == "process":
+            # spawn: workers import only the search modules, never the embedding model
+            ctx = mp.get_context("spawn")
+            self.shards = None
+            self.pools = [ProcessPoolExecutor(1, mp_context=ctx, initializer=shard.init_worker, initargs=(d, int(o)))
+                          for d, o in zip(dirs, self.offsets)]
+        else:
+            self.shards = [Shard(d, int(o)) for d, o in zip(dirs, self.offsets)]
+            self.pools = [ThreadPoolExecutor(1) for _ in dirs]
+        # load every shard now rather than on the first query
+        self._gather("term_stats", [])
+        self.batcher = None
+
+    def start_batcher(self, max_batch: int | None = None, max_wait_ms: float | None = None) -> QueryBatcher:
+        """Coalesce concurrent queries into batched embedding calls; the shards still search one query each."""
+        self.batcher = QueryBatcher(self.embedder.embed_queries, None, max_batch, max_wait_ms)
+        return self.batcher
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        for pool in self.pools:
+            pool.shutdown()
+
+    def _submit(self, i: int, method: str, *args):
+        if self.shards is None:
+            return self.pools[i].submit(shard.call, method, *args)
+        return self.pools[i].submit(getattr(self.shards[i], method), *args)
+
+    def _gather(self, method: str, *args) -> List:
+        futures = [self._submit(i, method, *args) for i in range(len(self.pools))]
+        return [f.result() for f in futures]
+
+    def _fetch(self, ids: List[int]) -> Dict[int, Dict]:
+        ids = np.asarray(ids, dtype=np.int64)
+        owner = np.searchsorted(self.offsets, ids, side="right") - 1
+        futures = {s: self._submit(s, "fetch", ids[owner == s].tolist()) for s in np.unique(owner).tolist()}
+        rows = {}
+        for s, f in futures.items():
+            rows.update(zip(ids[owner == s].tolist(), f.result()))
+        return rows
+
+    def _vectors(self, ids: List[int]) -> np.ndarray:
+        """Stored vectors of global row ids, gathered from their shards; re-embedded if a shard has none."""
+        ids = np.asarray(ids, dtype=np.int64)
+        owner = np.searchsorted(self.offsets, ids, side="right") - 1
+        futures = {s: self._submit(s, "vectors", ids[owner == s].tolist()) for s in np.unique(owner).tolist()}
+        out = None
+        for s, f in futures.items():
+            E = f.result()
+            if E is None:
+                rows = self._fetch(ids[owner == s].tolist())
+                E = self.embedder.embed_passages([rows[i]["text"] for i in ids[owner == s].tolist()])
+            if out is None:
+                out = np.empty((len(ids), E.shape[1]), dtype=np.float32)
+            out[owner == s] = E
+        return out
+
+    @staticmethod
+    def _merge(lists: List[List[Tuple[int, float]]], k: int) -> List[Tuple[int, float]]:
+        # ties by row id, as in the single-index BM25 ranking
+        return sorted((h for l in lists for h in l), key=lambda h: (-h[1], h[0]))[:k]
+
+    def search(self, query: str, top_k: int = 8, mode: str = "vector", mmr: bool | str = False, fetch_k: int = 64, alpha: float = 0.6, lexical_fallback: bool = True, nprobe: int | None = None, ef_search: int | None = None, lambda_mult: float = 0.6, max_per_doc: int = 0, fusion: str = "minmax", fallback_check_k: int = 12) -> List[Dict]:
+        """Same contract as ``Retriever.search``."""
+        mode = (mode or "vector").lower()
+        strategy = diversity.strategy(mmr)
+        method = fusion_method(fusion)
+        if mode not in ("bm25", "hybrid"):
+            mode = "vector"
+        q_tokens = tokenize(query)
+        # BM25 needs corpus-wide df / N / avgdl: collect them while the query is embedded
+        stats_futures = [self._submit(i, "term_stats", q_tokens) for i in range(len(self.pools))] if mode != "vector" else []
+        q = None
+        if mode != "bm25":
+            q = self.batcher.submit(query)[0][None, :] if self.batcher is not None else self.embedder.embed_queries([query]).astype("float32")
+        stats = merge_stats([f.result() for f in stats_futures]) if stats_futures else None
+        k = fetch_k if mode == "hybrid" else top_k
+        check_k = fallback_check_k if mode == "hybrid" and lexical_fallback else 0
+        parts = self._gather("search", q, q_tokens, k, stats, nprobe, ef_search, check_k)
+        hits = self._rank(q[0] if q is not None else None, q_tokens, parts, mode, top_k, k, alpha, strategy, lambda_mult, lexical_fallback, max_per_doc, method, check_k)
+        rows = self._fetch([i for i, _, _ in hits])
+        return [_hit(rows[i], s, label) for i, s, label in hits]
+
+    def search_many(self, queries: List[str], top_k: int = 8, mode: str = "vector", mmr: bool | str = False, fetch_k: int = 64, alpha: float = 0.6, lexical_fallback: bool = True, nprobe: int | None = None, ef_search: int | None = None, lambda_mult: float = 0.6, max_per_doc: int = 0, fusion: str = "minmax", fallback_check_k: int = 12) -> List[List[Dict]]:
+        """Same contract as ``Retriever.search_many``: one embedding call, one round trip per shard for statistics and one for the searches."""
+        queries = list(queries)
+        mode = (mode or "vector").lower()
+        strategy = diversity.strategy(mmr)
+        method = fusion_method(fusion)
+        if mode not in ("bm25", "hybrid"):
+            mode = "vector"
+        if not queries:
+            return []
+        tokens = [tokenize(q) for q in queries]
+        all_tokens = sorted({t for q_tokens in tokens for t in q_tokens})
+        stats_futures = [self._submit(i, "term_stats", all_tokens) for i in range(len(self.pools))] if mode != "vector" else []
+        Q = self.embedder.embed_queries(queries).astype("float32") if mode != "bm25" else None
+        stats = merge_stats([f.result() for f in stats_futures]) if stats_futures else None
+        k = fetch_k if mode == "hybrid" else top_k
+        check_k = fallback_check_k if mode == "hybrid" and lexical_fallback else 0
+        shard_parts = self._gather("search_many", Q, tokens, k, stats, nprobe, ef_search, check_k)
+        ranked = [self._rank(Q[j] if Q is not None else None, tokens[j], [p[j] for p in shard_parts], mode, top_k, k, alpha,
+                             strategy, lambda_mult, lexical_fallback, max_per_doc, method, check_k)
+                  for j in range(len(queries))]
+        rows = self._fetch([i for hits in ranked for i, _, _ in hits])
+        return [[_hit(rows[i], s, label) for i, s, label in hits] for hits in ranked]
+
+    def _rank(self, q_emb: np.ndarray | None, q_tokens: List[str], parts: List[Dict], mode: str, top_k: int, k: int, alpha: float,
+              strategy: str | None, lambda_mult: float, lexical_fallback: bool, max_per_doc: int, method: str, check_k: int) -> List[Tuple[int, float, str]]:
+        """(global id, score, mode label) of one query's hits from the shards' ``search`` results."""
+        vec = self._merge([p.get("vector", []) for p in parts], k)
+        bm = self._merge([p.get("bm25", []) for p in parts], k)
+
+        if mode != "hybrid":
+            return [(i, s, mode) for i, s in (vec if mode == "vector" else bm)]
+
+        alpha_used = alpha
+        if lexical_fallback:
+            overlap = {}
+            for p in parts:
+                overlap.update(zip([i for i, _ in p["vector"][:check_k]], p.get("overlap", [])))
+            checked = [overlap[i] for i, _ in vec[:max(1, min(len(vec), check_k))] if i in overlap]
+            # low overlap => rely more on BM25
+            if _overlap_ratio(checked, q_tokens) < 0.15:
+                alpha_used = min(alpha_used, 0.3)
+
+        pool = max(top_k, k) if strategy or max_per_doc else top_k
+        ranked, scores = _fuse(vec, bm, alpha_used, method, pool)
+        if not len(ranked):
+            return []
+        combined = dict(zip(ranked.tolist(), scores.tolist()))
+        ranked = ranked.tolist()
+        if strategy or max_per_doc:
+            cands = ranked
+            groups = None
+            if max_per_doc:
+                rows = self._fetch(cands)
+                groups = [rows[i]["doc_path"] for i in cands]
+            if strategy:
+                picked = diversity.select(strategy, q_emb, self._vectors(cands), top_k, lambda_mult, groups, max_per_doc)
+            else:
+                picked = diversity.capped(range(len(cands)), groups, top_k, max_per_doc)
+            top_idxs = [cands[j] for j in picked]
+        else:
+            top_idxs = ranked[:top_k]
+        label = "hybrid-fallback" if lexical_fallback and alpha_used != alpha else "hybrid"
+        return [(i, combined[i], label) for i in top_idxs]
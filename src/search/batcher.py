@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# Cross-request micro-batching (SEARCH_BATCH=false turns it off)
+BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "32"))
+BATCH_WAIT_MS = float(os.getenv("SEARCH_BATCH_WAIT_MS", "2"))
+
+class QueryBatcher:
+    """Coalesces concurrent queries into one ``embed_fn`` call and one search per parameter set.
+
+    Request threads ``submit`` a query and block on its result. A worker
+    thread takes the first waiting query, collects more for up to
+    ``max_wait_ms`` or until ``max_batch`` are in hand, embeds them all at
+    once and runs ``search_fn(Q, k, nprobe, ef_search)`` once per distinct
+    (k, nprobe, ef_search). The results are the same as unbatched calls; a
+    lone query pays at most ``max_wait_ms`` extra.
+    """
+    def __init__(self, embed_fn: Callable[[List[str]], np.ndarray], search_fn: Optional[Callable] = None,
+                 max_batch: int | None = None, max_wait_ms: float | None = None):
+        self.embed_fn = embed_fn
+        self.search_fn = search_fn
+        self.max_batch = max(1, BATCH_MAX if max_batch is None else max_batch)
+        self.max_wait = (BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000.0
+        self.queue: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = self.queries = self.largest = 0
+        self.worker = threading.Thread(target=self._loop, name="query-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, query: str, k: int = 0, nprobe: int | None = None,
+               ef_search: int | None = None) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """Query embedding and its (scores, ids) row for top ``k``; k=0 only embeds."""
+        fut: Future = Future()
+        self.queue.put((query, k, nprobe, ef_search, fut))
+        return fut.result()
+
+    def close(self):
+        """Stop the worker once the queries already submitted are answered."""
+        self.queue.put(None)
+
+    def _loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            closed = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+            self._run(batch)
+            if closed:
+                return
+
+    def _run(self, batch: List[tuple]):
+        try:
+            Q = np.asarray(self.embed_fn([b[0] for b in batch]), dtype="float32")
+            out: List[tuple] = [(Q[j], None, None) for j in range(len(batch))]
+            groups: Dict[tuple, List[int]] = {}
+            for j, (_, k, nprobe, ef_search, _) in enumerate(batch):
+                if k and self.search_fn is not None:
+                    groups.setdefault((k, nprobe, ef_search), []).append(j)
+            for (k, nprobe, ef_search), js in groups.items():
+                D, I = self.search_fn(np.ascontiguousarray(Q[js]), k, nprobe, ef_search)
+                for r, j in enumerate(js):
+                    out[j] = (Q[j], D[r], I[r])
+        except Exception as e:
+            for b in batch:
+                b[4].set_exception(e)
+            return
+        with self.lock:
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest = max(self.largest, len(batch))
+        for b, res in zip(batch, out):
+            b[4].set_result(res)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"max_batch": self.max_batch, "max_wait_ms": self.max_wait * 1000, "batches": self.batches,
+                    "queries": self.queries, "mean_batch": self.queries / self.batches if self.batches else 0.0,
+                    "largest_batch": self.largest}
@@ -1,48 +1,263 @@
+import json
 import math
+import os
 import re
-from collections import Counter
-from typing import List
+import shutil
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
 
 _WORD = re.compile(r"\w+", re.UNICODE)
 
 def tokenize(text: str) -> List[str]:
     return [w for w in _WORD.findall(text.lower()) if len(w) >= 2]
 
+# arrays persisted by BM25Okapi.save, one .npy file each
+_ARRAYS = ("doc_len", "doc_norm", "post_ptr", "post_docs", "post_tf",
+           "doc_freq", "idf", "max_impact", "max_tf", "min_dl", "doc_ptr", "doc_terms")
+_FORMAT = 2
+
+def default_lexical_path(index_path: str) -> str:
+    """The lexical index lives in a ``bm25/`` directory next to the vector index."""
+    return os.path.join(os.path.dirname(index_path) or ".", "bm25")
+
 class BM25Okapi:
-    """Simple BM25 implementation over in-memory list-of-tokens corpus."""
-    def __init__(self, corpus_tokens: List[List[str]], k1: float = 1.5, b: float = 0.75):
+    """BM25 over an inverted index held in NumPy arrays.
+
+    Postings are stored CSR-style: the documents containing term ``t`` are
+    ``post_docs[post_ptr[t]:post_ptr[t+1]]`` (ascending) with matching
+    frequencies in ``post_tf``. Scoring only touches the postings of the
+    query terms, and ``top_k`` additionally skips the long postings of
+    low-impact (frequent) terms using per-term score upper bounds.
+    A forward index (``doc_terms[doc_ptr[d]:doc_ptr[d+1]]``, the distinct
+    term ids of document ``d``) serves per-document term lookups.
+
+    ``save`` writes the arrays as .npy files; ``load`` memory-maps them, so
+    processes opening the same index share its pages.
+    """
+    def __init__(self, corpus_tokens: Iterable[List[str]], k1: float = 1.5, b: float = 0.75):
+        # intern terms as they stream in: the corpus is only ever held as int32 term ids
+        vocab: Dict[str, int] = {}
+        intern = vocab.setdefault
+        term_ids = array("i")
+        lens = array("q")
+        for doc in corpus_tokens:
+            term_ids.extend([intern(term, len(vocab)) for term in doc])
+            lens.append(len(doc))
+        n = len(lens)
+        doc_len = np.frombuffer(lens, dtype=np.int64) if n else np.zeros(0, dtype=np.int64)
+        term_ids = np.frombuffer(term_ids, dtype=np.int32).astype(np.int64) if len(term_ids) else np.zeros(0, dtype=np.int64)
+        doc_ids = np.repeat(np.arange(n, dtype=np.int64), doc_len)
+        # unique (term, doc) pairs come out sorted by term, then doc
+        keys, tf = np.unique(term_ids * max(n, 1) + doc_ids, return_counts=True)
+        self._index(vocab, keys // max(n, 1), keys % max(n, 1), tf, doc_len.copy(), k1, b)
+
+    @classmethod
+    def from_postings(cls, vocab: Dict[str, int], post_terms: np.ndarray, post_docs: np.ndarray,
+                      post_tf: np.ndarray, doc_len: np.ndarray, k1: float = 1.5, b: float = 0.75) -> "BM25Okapi":
+        """Build from (term id, doc id, tf) triples sorted by term, then doc.
+
+        Every term in ``vocab`` must have at least one posting.
+        """
+        self = cls.__new__(cls)
+        self._index(vocab, post_terms, post_docs, post_tf, doc_len, k1, b)
+        return self
+
+    def _index(self, vocab, post_terms, post_docs, post_tf, doc_len, k1, b):
         self.k1 = k1
         self.b = b
-        self.corpus = corpus_tokens
-        self.N = len(corpus_tokens)
-        self.doc_freq = Counter()
-        self.doc_len = [len(doc) for doc in corpus_tokens]
-        self.avgdl = (sum(self.doc_len) / self.N) if self.N > 0 else 0.0
-        self.tf = [Counter(doc) for doc in corpus_tokens]
-        # document frequencies
-        for doc in corpus_tokens:
-            for term in set(doc):
-                self.doc_freq[term] += 1
-        # precompute idf
-        self.idf = {}
-        for term, df in self.doc_freq.items():
-            # idf with +0.5 smoothing
-            self.idf[term] = math.log(1 + (self.N - df + 0.5) / (df + 0.5))
+        self.vocab = vocab
+        self.N = len(doc_len)
+        self.doc_len = np.asarray(doc_len, dtype=np.int64)
+        self.avgdl = float(self.doc_len.sum() / self.N) if self.N > 0 else 0.0
+        post_terms = np.asarray(post_terms, dtype=np.int64)
+        self.post_docs = np.asarray(post_docs).astype(np.int32)
+        self.post_tf = np.asarray(post_tf).astype(np.int32)
+        self.doc_freq = np.bincount(post_terms, minlength=len(self.vocab)).astype(np.int32)
+        self.post_ptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(self.doc_freq, out=self.post_ptr[1:])
+        # idf with +0.5 smoothing
+        self.idf = np.fromiter(
+            (math.log(1 + (self.N - df + 0.5) / (df + 0.5)) for df in self.doc_freq.tolist()),
+            dtype=np.float64, count=len(self.vocab),
+        )
+        # per-document length normalisation, the query-independent half of the denominator
+        dl = np.where(self.doc_len > 0, self.doc_len, 1).astype(np.float64)
+        self.doc_norm = self.k1 * (1.0 - self.b + self.b * dl / (self.avgdl or 1.0))
+        # per-term upper bound of a single posting's contribution, used for pruning;
+        # max tf / min doc length bound it under any corpus statistics
+        self.max_impact = np.zeros(len(self.vocab), dtype=np.float64)
+        self.max_tf = np.zeros(len(self.vocab), dtype=np.int32)
+        self.min_dl = np.zeros(len(self.vocab), dtype=np.int64)
+        if len(self.post_docs):
+            impacts = self._impacts(self.post_docs, self.post_tf, self.idf[post_terms])
+            self.max_impact = np.maximum.reduceat(impacts, self.post_ptr[:-1])
+            self.max_tf = np.maximum.reduceat(self.post_tf, self.post_ptr[:-1])
+            self.min_dl = np.minimum.reduceat(self.doc_len[self.post_docs], self.post_ptr[:-1])
+        # forward index: distinct term ids per document
+        order = np.lexsort((post_terms, self.post_docs))
+        self.doc_terms = post_terms[order].astype(np.int32)
+        self.doc_ptr = np.zeros(self.N + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.post_docs, minlength=self.N), out=self.doc_ptr[1:])
+
+    def save(self, path: str):
+        """Write the index to directory ``path``, replacing any previous one."""
+        tmp = path.rstrip("/\\") + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in _ARRAYS:
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": _FORMAT, "k1": self.k1, "b": self.b, "N": self.N, "avgdl": self.avgdl}, f)
+        # swap directories; readers that already mapped the old files keep their inodes
+        old = path.rstrip("/\\") + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "BM25Okapi":
+        """Open an index written by ``save``; arrays are memory-mapped read-only unless ``mmap=False``."""
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != _FORMAT:
+            raise ValueError(f"Unsupported lexical index format in {path}: {meta.get('format')}")
+        self = cls.__new__(cls)
+        self.k1, self.b, self.N, self.avgdl = meta["k1"], meta["b"], meta["N"], meta["avgdl"]
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab = {t: i for i, t in enumerate(json.load(f))}
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None))
+        return self
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def term_ids(self, query_tokens: List[str]) -> np.ndarray:
+        """Vocabulary ids of the query tokens that occur in the corpus."""
+        return np.array([self.vocab[t] for t in query_tokens if t in self.vocab], dtype=np.int32)
+
+    def doc_terms_many(self, docs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Distinct term ids of several documents, flattened, with the position in ``docs`` each came from."""
+        docs = np.asarray(docs, dtype=np.int64)
+        starts = self.doc_ptr[docs]
+        lens = self.doc_ptr[docs + 1] - starts
+        owner = np.repeat(np.arange(len(docs)), lens)
+        within = np.arange(int(lens.sum())) - np.repeat(np.cumsum(lens) - lens, lens)
+        return self.doc_terms[starts[owner] + within], owner
+
+    def overlap_counts(self, query_tokens: List[str], docs: np.ndarray) -> np.ndarray:
+        """Number of distinct query terms occurring in each of ``docs``."""
+        terms, owner = self.doc_terms_many(docs)
+        hit = np.isin(terms, self.term_ids(list(set(query_tokens))))
+        return np.bincount(owner[hit], minlength=len(docs))
+
+    def _postings(self, term: str):
+        t = self.vocab.get(term)
+        if t is None:
+            return None, None, 0.0
+        lo, hi = self.post_ptr[t], self.post_ptr[t + 1]
+        return self.post_docs[lo:hi], self.post_tf[lo:hi], float(self.idf[t])
+
+    def _impacts(self, docs: np.ndarray, tf: np.ndarray, idf) -> np.ndarray:
+        freq = tf.astype(np.float64)
+        return idf * (freq * (self.k1 + 1.0) / (freq + self.doc_norm[docs]))
 
     def score(self, query_tokens: List[str], idx: int) -> float:
         score = 0.0
         if idx >= self.N:
             return score
-        dl = self.doc_len[idx] or 1
-        tf = self.tf[idx]
         for term in query_tokens:
-            if term not in tf:
+            docs, tf, idf = self._postings(term)
+            if docs is None:
                 continue
-            idf = self.idf.get(term, 0.0)
-            freq = tf[term]
-            denom = freq + self.k1 * (1.0 - self.b + self.b * dl / (self.avgdl or 1.0))
-            score += idf * (freq * (self.k1 + 1.0) / (denom or 1.0))
+            pos = int(np.searchsorted(docs, idx))
+            if pos < len(docs) and docs[pos] == idx:
+                score += float(self._impacts(docs[pos:pos + 1], tf[pos:pos + 1], idf)[0])
         return score
 
-    def get_scores(self, query_tokens: List[str]) -> List[float]:
-        return [self.score(query_tokens, i) for i in range(self.N)]
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.N, dtype=np.float64)
+        for term in query_tokens:
+            docs, tf, idf = self._postings(term)
+            if docs is None:
+                continue
+            # doc ids are unique within a posting list, so fancy-index += is safe
+            scores[docs] += self._impacts(docs, tf, idf)
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k documents by BM25 without scoring the whole corpus.
+
+        Vectorized MaxScore: query terms are visited in decreasing order of
+        their upper-bound impact and their postings accumulated until the
+        bounds of the remaining terms cannot lift an unseen document into the
+        top-k. The surviving candidates are then rescored exactly, so the
+        result equals ``get_scores`` followed by a full descending sort (ties
+        by ascending doc id). When fewer than ``k`` documents match, the tail
+        is padded with zero-score documents in doc id order, as a full sort
+        would.
+        """
+        k = min(int(k), self.N)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        counts: Dict[int, int] = {}
+        for term in query_tokens:
+            t = self.vocab.get(term)
+            if t is not None:
+                counts[t] = counts.get(t, 0) + 1
+        cand = np.zeros(0, dtype=np.int64)
+        if counts:
+            terms = sorted(counts, key=lambda t: self.max_impact[t] * counts[t], reverse=True)
+            bounds = np.array([self.max_impact[t] * counts[t] for t in terms])
+            rest = np.append(np.cumsum(bounds[::-1])[::-1], 0.0)
+            acc = np.zeros(self.N, dtype=np.float64)
+            # docs with a nonzero score so far, kept from the postings so a term costs O(postings), not O(N)
+            touched = np.zeros(0, dtype=np.int64)
+            theta = 0.0
+            for i, t in enumerate(terms):
+                lo, hi = self.post_ptr[t], self.post_ptr[t + 1]
+                docs = self.post_docs[lo:hi]
+                acc[docs] += counts[t] * self._impacts(docs, self.post_tf[lo:hi], self.idf[t])
+                touched = np.union1d(touched, docs)
+                if len(touched) >= k:
+                    theta = float(np.partition(acc[touched], len(touched) - k)[len(touched) - k])
+                # unseen documents can score at most rest[i + 1]
+                if rest[i + 1] < theta * (1.0 - 1e-9):
+                    break
+            # slack guards the bound checks against summation-order rounding
+            cand = touched[acc[touched] + rest[i + 1] >= theta * (1.0 - 1e-9)]
+        scores = self._rescore(query_tokens, cand)
+        if len(cand) > k:
+            kth = np.partition(scores, len(cand) - k)[len(cand) - k]
+            keep = scores >= kth
+            cand, scores = cand[keep], scores[keep]
+        order = np.lexsort((cand, -scores))[:k]
+        idxs, scores = cand[order], scores[order]
+        if len(idxs) < k:
+            pad = np.setdiff1d(np.arange(min(self.N, 2 * k), dtype=np.int64), idxs)[:k - len(idxs)]
+            idxs = np.concatenate([idxs, pad])
+            scores = np.concatenate([scores, np.zeros(len(pad), dtype=np.float64)])
+        return idxs, scores
+
+    def _rescore(self, query_tokens: List[str], docs: np.ndarray) -> np.ndarray:
+        """Exact scores for ``docs`` (ascending), summed in query order like ``get_scores``."""
+        scores = np.zeros(len(docs), dtype=np.float64)
+        if not len(docs):
+            return scores
+        for term in query_tokens:
+            pdocs, tf, idf = self._postings(term)
+            if pdocs is None:
+                continue
+            pos = np.searchsorted(pdocs, docs)
+            pos[pos == len(pdocs)] = 0
+            hit = pdocs[pos] == docs
+            scores[hit] += self._impacts(docs[hit], tf[pos[hit]], idf)
+        return scores
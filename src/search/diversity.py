@@ -0,0 +1,164 @@
+from typing import List, Sequence
+import numpy as np
+
+# mmr= values on Retriever.search and /search: true = "mmr"
+STRATEGIES = ("mmr", "dpp", "facility")
+
+def strategy(value) -> str | None:
+    """Normalize an ``mmr`` argument (bool, "true"/"false" or a strategy name) to a strategy or None."""
+    if value is None or value is False:
+        return None
+    if value is True:
+        return "mmr"
+    v = str(value).strip().lower()
+    if v in ("", "false", "0", "no", "off", "none"):
+        return None
+    if v in ("true", "1", "yes", "on"):
+        return "mmr"
+    if v not in STRATEGIES:
+        raise ValueError(f"Unknown diversity strategy {value!r}; expected true/false or one of {STRATEGIES}")
+    return v
+
+class _Caps:
+    """At most ``max_per_doc`` picks per group (doc_path); 0 = no cap."""
+    def __init__(self, groups: Sequence | None, max_per_doc: int):
+        self.active = bool(max_per_doc) and groups is not None
+        self.max_per_doc = max_per_doc
+        if self.active:
+            _, self.groups = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+            self.counts = np.zeros(self.groups.max() + 1, dtype=np.int64)
+
+    def take(self, j: int, avail: np.ndarray):
+        avail[j] = False
+        if self.active:
+            g = self.groups[j]
+            self.counts[g] += 1
+            if self.counts[g] >= self.max_per_doc:
+                avail[self.groups == g] = False
+
+def capped(order: Sequence[int], groups: Sequence | None, top_k: int, max_per_doc: int) -> List[int]:
+    """First ``top_k`` of a ranked list of positions, skipping groups already at ``max_per_doc``."""
+    order = list(order)
+    caps = _Caps(groups, max_per_doc)
+    if not caps.active:
+        return order[:top_k]
+    avail = np.ones(len(order), dtype=bool)
+    out = []
+    for j in order:
+        if len(out) == top_k:
+            break
+        if avail[j]:
+            out.append(j)
+            caps.take(j, avail)
+    return out
+
+def mmr_select(q: np.ndarray, E: np.ndarray, top_k: int, lambda_mult: float = 0.6,
+               groups: Sequence | None = None, max_per_doc: int = 0) -> List[int]:
+    """Greedy maximal marginal relevance; returns positions into ``E`` (normalized rows).
+
+    Each step picks ``argmax lambda * sim(q, c) - (1 - lambda) * max_s sim(c, s)``
+    over the unselected candidates. The running max-similarity vector is
+    updated with one similarity row per pick (``E @ E[j]``), so a selection
+    costs top_k matrix-vector products instead of a Python loop over
+    (candidate, selected) pairs.
+    """
+    n = len(E)
+    rel = E @ q
+    avail = np.ones(n, dtype=bool)
+    caps = _Caps(groups, max_per_doc)
+    max_sim = np.zeros(n, dtype=np.float32)  # no diversity penalty before the first pick
+    out = []
+    while len(out) < min(top_k, n) and avail.any():
+        score = np.where(avail, lambda_mult * rel - (1 - lambda_mult) * max_sim, -np.inf)
+        j = int(np.argmax(score))
+        out.append(j)
+        caps.take(j, avail)
+        sim = E @ E[j]
+        max_sim = sim if len(out) == 1 else np.maximum(max_sim, sim)
+    return out
+
+def dpp_select(q: np.ndarray, E: np.ndarray, top_k: int, lambda_mult: float = 0.6,
+               groups: Sequence | None = None, max_per_doc: int = 0) -> List[int]:
+    """Greedy MAP inference for a determinantal point process (Chen et al., 2018).
+
+    Kernel ``L = diag(r) E E^T diag(r)`` with quality ``r = exp(a * sim(q, c))``,
+    ``a = lambda / (2 (1 - lambda))``: lambda trades relevance against
+    diversity as in MMR. Each pick maximizes the gain in log det L_S, kept
+    as an incremental Cholesky factor (one similarity row per pick). When
+    the remaining candidates add no volume (near-duplicates of the picks),
+    the rest is filled by relevance.
+    """
+    n = len(E)
+    rel = E @ q
+    lam = min(max(lambda_mult, 0.0), 0.99)
+    r = np.exp(lam / (2 * (1 - lam)) * rel).astype(np.float64)
+    k = min(top_k, n)
+    C = np.zeros((k, n))
+    d2 = r ** 2  # diag(L), rows are normalized
+    avail = np.ones(n, dtype=bool)
+    caps = _Caps(groups, max_per_doc)
+    out = []
+    while len(out) < k:
+        # a residual this small relative to the candidate's own norm is float32 noise: no new volume
+        live = avail & (d2 > 1e-5 * r ** 2)
+        if not live.any():
+            break
+        j = int(np.argmax(np.where(live, d2, -np.inf)))
+        t = len(out)
+        out.append(j)
+        caps.take(j, avail)
+        L_j = r[j] * r * (E @ E[j])
+        e = (L_j - C[:t, j] @ C[:t]) / np.sqrt(d2[j])
+        C[t] = e
+        d2 = d2 - e ** 2
+    if len(out) < k:
+        for j in np.argsort(-rel, kind="stable").tolist():
+            if len(out) == k:
+                break
+            if avail[j]:
+                out.append(j)
+                caps.take(j, avail)
+    return out
+
+def facility_select(q: np.ndarray, E: np.ndarray, top_k: int, lambda_mult: float = 0.6,
+                    groups: Sequence | None = None, max_per_doc: int = 0) -> List[int]:
+    """Greedy facility location: relevance plus how well the picks cover the candidate set.
+
+    Each pick maximizes ``lambda * sim(q, c) + (1 - lambda) * gain(c)``, where
+    ``gain`` is the increase in coverage ``sum_i w_i max_s sim(i, s)`` of the
+    candidate pool, weighted by relevance ``w`` (clipped at 0) and scaled so
+    the step's best gain is 1. Picks thus stand in for the distinct relevant
+    regions of the pool. Uses the full candidate similarity matrix, computed
+    once, so cost grows with fetch_k squared.
+    """
+    n = len(E)
+    rel = E @ q
+    S = E @ E.T
+    w = np.maximum(rel, 0.0)
+    w = w / w.sum() if w.sum() > 0 else np.full(n, 1.0 / n)
+    w = w.astype(S.dtype)
+    cover = np.zeros(n, dtype=S.dtype)
+    buf = np.empty_like(S)
+    avail = np.ones(n, dtype=bool)
+    caps = _Caps(groups, max_per_doc)
+    out = []
+    while len(out) < min(top_k, n) and avail.any():
+        # coverage gain of adding each candidate j: sum_i w_i max(S_ij - cover_i, 0)
+        gain = w @ np.maximum(S, cover[:, None], out=buf) - w @ cover
+        # relative to this step's best gain, so lambda weighs it against cosine relevance as in MMR
+        gain /= max(float(gain[avail].max()), 1e-9)
+        score = np.where(avail, lambda_mult * rel + (1 - lambda_mult) * gain, -np.inf)
+        j = int(np.argmax(score))
+        out.append(j)
+        caps.take(j, avail)
+        cover = np.maximum(cover, S[:, j])
+    return out
+
+_SELECT = {"mmr": mmr_select, "dpp": dpp_select, "facility": facility_select}
+
+def select(name: str, q: np.ndarray, E: np.ndarray, top_k: int, lambda_mult: float = 0.6,
+           groups: Sequence | None = None, max_per_doc: int = 0) -> List[int]:
+    """Positions into ``E`` chosen by strategy ``name`` (see STRATEGIES), at most ``max_per_doc`` per group."""
+    q = np.asarray(q, dtype=np.float32)
+    E = np.asarray(E, dtype=np.float32)
+    return _SELECT[name](q, E, top_k, lambda_mult, groups, max_per_doc)
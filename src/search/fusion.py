@@ -0,0 +1,74 @@
+import os
+from typing import Tuple
+import numpy as np
+
+# fusion= values on Retriever.search and /search
+METHODS = ("minmax", "rrf", "zscore")
+# reciprocal rank fusion constant: 1 / (RRF_K + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+def fusion_method(value: str | None) -> str:
+    """Validate a ``fusion`` argument; None means minmax."""
+    m = (value or "minmax").lower()
+    if m not in METHODS:
+        raise ValueError(f"Unknown fusion {value!r}; expected one of {METHODS}")
+    return m
+
+def _minmax(s: np.ndarray) -> np.ndarray:
+    if not len(s):
+        return s
+    lo, hi = s.min(), s.max()
+    if hi - lo < 1e-9:
+        return np.ones_like(s)
+    return (s - lo) / (hi - lo)
+
+def _zscore(s: np.ndarray) -> np.ndarray:
+    if not len(s):
+        return s
+    sd = s.std()
+    if sd < 1e-9:
+        return np.zeros_like(s)
+    return (s - s.mean()) / sd
+
+def _rrf(s: np.ndarray, k: int) -> np.ndarray:
+    ranks = np.empty(len(s), dtype=np.float64)
+    ranks[np.argsort(-s, kind="stable")] = np.arange(1, len(s) + 1)
+    return 1.0 / (k + ranks)
+
+def fuse(vec_ids: np.ndarray, vec_scores: np.ndarray, bm_ids: np.ndarray, bm_scores: np.ndarray,
+         alpha: float, method: str = "minmax", rrf_k: int | None = None, top: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Union of two candidate lists scored ``alpha * vector + (1 - alpha) * bm25``; (ids, scores), best first.
+
+    Each list is mapped to a common scale first: ``minmax`` to [0, 1] over its
+    candidates, ``zscore`` to standard scores, ``rrf`` to ``1 / (rrf_k + rank)``.
+    A candidate missing from one list gets that list's lowest value there
+    (0 for minmax and rrf). Ties go to the lower id. With ``top`` only the
+    best ``top`` are returned, selected by partition rather than a full sort.
+    """
+    vec_ids = np.asarray(vec_ids, dtype=np.int64)
+    bm_ids = np.asarray(bm_ids, dtype=np.int64)
+    ids, inv = np.unique(np.concatenate([vec_ids, bm_ids]), return_inverse=True)
+    if not len(ids):
+        return ids, np.zeros(0, dtype=np.float64)
+    parts = []
+    for s in (np.asarray(vec_scores, dtype=np.float64), np.asarray(bm_scores, dtype=np.float64)):
+        if method == "rrf":
+            parts.append((_rrf(s, rrf_k or RRF_K), 0.0))
+        elif method == "zscore":
+            z = _zscore(s)
+            parts.append((z, float(z.min()) if len(z) else 0.0))
+        else:
+            parts.append((_minmax(s), 0.0))
+    (v, v_miss), (b, b_miss) = parts
+    vec_n = np.full(len(ids), v_miss)
+    vec_n[inv[:len(vec_ids)]] = v
+    bm_n = np.full(len(ids), b_miss)
+    bm_n[inv[len(vec_ids):]] = b
+    scores = alpha * vec_n + (1.0 - alpha) * bm_n
+    cand = np.arange(len(ids))
+    if top is not None and top < len(ids):
+        # everything scoring at least the top-th best, ties at the cut included
+        kth = np.partition(-scores, top - 1)[top - 1]
+        cand = np.flatnonzero(-scores <= kth)
+    order = cand[np.lexsort((ids[cand], -scores[cand]))][:top]
+    return ids[order], scores[order]
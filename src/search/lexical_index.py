@@ -0,0 +1,423 @@
+import json
+import math
+import os
+import shutil
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.search.bm25 import BM25Okapi, tokenize
+
+_SEGMENTS_DIR = "segments"
+_MANIFEST = "segments.json"
+_DELETED = "deleted.npy"
+
+class _Segment:
+    """A BM25Okapi over the contiguous doc id range [offset, offset + N)."""
+    def __init__(self, bm25: BM25Okapi, offset: int, name: str | None = None):
+        self.bm25 = bm25
+        self.offset = offset
+        # on-disk name: "" for the base stored at the index root, None if not saved yet
+        self.name = name
+        # postings of tombstoned docs stay until a merge; this tracks their df share
+        self.dead_df = np.zeros(len(bm25.vocab), dtype=np.int32)
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.bm25.N
+
+class LexicalIndex:
+    """Updatable BM25: an immutable base segment, appended delta segments and tombstones.
+
+    New chunks go into small delta segments and deleted ones are only
+    tombstoned, so an update never re-reads or re-tokenizes the corpus.
+    The live document count, total length and per-term document
+    frequencies are maintained incrementally and idf / avgdl are derived per
+    query, so scores always equal a fresh BM25 build over the live chunks.
+    ``merge`` folds segments together and drops tombstoned postings; it can
+    run in a background thread while queries and updates continue.
+
+    Doc ids are never reused or renumbered, so they stay aligned with the
+    rows of chunks.jsonl and the ids of the vector index.
+    """
+    MAX_DELTAS = 8
+    # postings (doc id, impact) pairs top_k_many keeps for reuse across the queries of one batch
+    SHARED_IMPACTS = 1 << 22
+
+    def __init__(self, base: BM25Okapi, path: str | None = None):
+        self.k1, self.b = base.k1, base.b
+        self.path = path
+        self.segments: List[_Segment] = [_Segment(base, 0)]
+        self.deleted = np.zeros(base.N, dtype=bool)
+        self.lock = threading.RLock()
+        self._merge_thread: threading.Thread | None = None
+        self._recount()
+
+    # ---------- persistence ----------
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "LexicalIndex":
+        """Open an index directory: a BM25Okapi base, plus deltas and tombstones if any were saved."""
+        self = cls(BM25Okapi.load(path, mmap=mmap), path)
+        self.segments[0].name = ""
+        manifest = os.path.join(path, _MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, "r", encoding="utf-8") as f:
+                entries = json.load(f)["segments"]
+            for e in entries:
+                seg = BM25Okapi.load(os.path.join(path, _SEGMENTS_DIR, e["name"]), mmap=mmap)
+                self.segments.append(_Segment(seg, e["offset"], e["name"]))
+            deleted = np.load(os.path.join(path, _DELETED))
+            self.deleted = np.zeros(self.N, dtype=bool)
+            self.deleted[:len(deleted)] = deleted[:self.N]
+        self._recount()
+        return self
+
+    def save(self, path: str | None = None):
+        """Persist new segments and tombstones; an unchanged base is not rewritten."""
+        path = path or self.path
+        with self.lock:
+            segs, deleted = list(self.segments), self.deleted.copy()
+            base = segs[0]
+            if base.name != "" or path != self.path:
+                # BM25Okapi.save replaces the whole directory, deltas included
+                base.bm25.save(path)
+                base.name = ""
+                for seg in segs[1:]:
+                    seg.name = None
+            seg_dir = os.path.join(path, _SEGMENTS_DIR)
+            os.makedirs(seg_dir, exist_ok=True)
+            for seg in segs[1:]:
+                if seg.name is None:
+                    seg.name = f"seg_{seg.offset:010d}_{seg.bm25.N}"
+                    seg.bm25.save(os.path.join(seg_dir, seg.name))
+            tmp = os.path.join(path, _DELETED + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, deleted)
+            os.replace(tmp, os.path.join(path, _DELETED))
+            tmp = os.path.join(path, _MANIFEST + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"segments": [{"name": s.name, "offset": s.offset} for s in segs[1:]]}, f)
+            os.replace(tmp, os.path.join(path, _MANIFEST))
+            # drop segment directories that were merged away
+            live = {s.name for s in segs[1:]}
+            for name in os.listdir(seg_dir):
+                if name not in live:
+                    shutil.rmtree(os.path.join(seg_dir, name), ignore_errors=True)
+            self.path = path
+
+    # ---------- statistics ----------
+    @property
+    def N(self) -> int:
+        """Size of the doc id space, tombstoned docs included."""
+        return self.segments[-1].end
+
+    def _recount(self):
+        """Recompute live totals and per-segment dead df from the tombstones."""
+        self.n_live = int(self.N - self.deleted.sum())
+        self.total_len = 0
+        for seg in self.segments:
+            dead = np.flatnonzero(self.deleted[seg.offset:seg.end])
+            seg.dead_df = np.zeros(len(seg.bm25.vocab), dtype=np.int32)
+            np.add.at(seg.dead_df, seg.bm25.doc_terms_many(dead)[0], 1)
+            live_len = np.asarray(seg.bm25.doc_len).sum() - np.asarray(seg.bm25.doc_len)[dead].sum()
+            self.total_len += int(live_len)
+
+    def _stats(self):
+        """Consistent snapshot for one query: segments, tombstones, live N and avgdl."""
+        with self.lock:
+            n_live, total_len = self.n_live, self.total_len
+            return self.segments, self.deleted, n_live, (total_len / n_live if n_live else 0.0)
+
+    def _df(self, segs: List[_Segment], term: str) -> int:
+        df = 0
+        for seg in segs:
+            t = seg.bm25.vocab.get(term)
+            if t is not None:
+                df += int(seg.bm25.doc_freq[t]) - int(seg.dead_df[t])
+        return df
+
+    def _idf(self, segs: List[_Segment], term: str, n_live: int) -> float:
+        return _idf(self._df(segs, term), n_live)
+
+    def term_stats(self, query_tokens: List[str]) -> Dict:
+        """This index's share of the collection statistics for a query (see ``merge_stats``)."""
+        with self.lock:
+            segs, n_live, total_len = self.segments, self.n_live, self.total_len
+        return {"n_live": n_live, "total_len": total_len,
+                "df": {term: self._df(segs, term) for term in set(query_tokens)}}
+
+    def _impacts(self, bm25: BM25Okapi, docs: np.ndarray, tf: np.ndarray, idf: float, avgdl: float) -> np.ndarray:
+        # same arithmetic as BM25Okapi, with corpus-wide avgdl instead of the segment's
+        dl = np.asarray(bm25.doc_len)[docs]
+        norm = self.k1 * (1.0 - self.b + self.b * np.where(dl > 0, dl, 1).astype(np.float64) / (avgdl or 1.0))
+        freq = tf.astype(np.float64)
+        return idf * (freq * (self.k1 + 1.0) / (freq + norm))
+
+    # ---------- updates ----------
+    def add(self, texts: List[str]) -> np.ndarray:
+        """Index new chunks as a delta segment; returns their doc ids."""
+        seg = BM25Okapi((tokenize(t) for t in texts), k1=self.k1, b=self.b)
+        with self.lock:
+            offset = self.N
+            self.segments = self.segments + [_Segment(seg, offset)]
+            self.deleted = np.concatenate([self.deleted, np.zeros(seg.N, dtype=bool)])
+            self.n_live += seg.N
+            self.total_len += int(seg.doc_len.sum())
+            n_deltas = len(self.segments) - 1
+        if n_deltas > self.MAX_DELTAS:
+            self.merge_in_background()
+        return np.arange(offset, offset + seg.N, dtype=np.int64)
+
+    def delete(self, ids) -> int:
+        """Tombstone doc ids; returns how many were live."""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        with self.lock:
+            ids = ids[(ids >= 0) & (ids < self.N)]
+            ids = ids[~self.deleted[ids]]
+            for seg in self.segments:
+                local = ids[(ids >= seg.offset) & (ids < seg.end)] - seg.offset
+                if len(local):
+                    np.add.at(seg.dead_df, seg.bm25.doc_terms_many(local)[0], 1)
+                    self.total_len -= int(np.asarray(seg.bm25.doc_len)[local].sum())
+            self.deleted[ids] = True
+            self.n_live -= len(ids)
+        return len(ids)
+
+    def merge(self, full: bool = False):
+        """Fold all delta segments into one; ``full`` also folds the base and purges tombstones."""
+        with self.lock:
+            segs, deleted = list(self.segments), self.deleted.copy()
+        start = 0 if full else 1
+        if len(segs) - start < (1 if full else 2):
+            return
+        merged = _Segment(_merge_segments(segs[start:], deleted, self.k1, self.b), segs[start].offset)
+        with self.lock:
+            # deltas appended during the merge stay after the merged segment
+            self.segments = self.segments[:start] + [merged] + self.segments[len(segs):]
+            # tombstones that landed during the merge still have postings in it
+            self._recount()
+
+    def merge_in_background(self, full: bool = False) -> threading.Thread:
+        with self.lock:
+            if self._merge_thread is None or not self._merge_thread.is_alive():
+                self._merge_thread = threading.Thread(target=self.merge, kwargs={"full": full}, daemon=True)
+                self._merge_thread.start()
+            return self._merge_thread
+
+    def wait_for_merge(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    # ---------- queries ----------
+    def overlap_counts(self, query_tokens: List[str], idxs: List[int]) -> np.ndarray:
+        """Number of distinct query terms occurring in each of ``idxs``."""
+        idxs = np.asarray(idxs, dtype=np.int64)
+        out = np.zeros(len(idxs), dtype=np.int64)
+        for seg in self.segments:
+            sel = np.flatnonzero((idxs >= seg.offset) & (idxs < seg.end))
+            if len(sel):
+                out[sel] = seg.bm25.overlap_counts(query_tokens, idxs[sel] - seg.offset)
+        return out
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        segs, deleted, n_live, avgdl = self._stats()
+        scores = np.zeros(len(deleted), dtype=np.float64)
+        for term in query_tokens:
+            idf = self._idf(segs, term, n_live)
+            for seg in segs:
+                t = seg.bm25.vocab.get(term)
+                if t is None:
+                    continue
+                lo, hi = seg.bm25.post_ptr[t], seg.bm25.post_ptr[t + 1]
+                docs = seg.bm25.post_docs[lo:hi]
+                scores[docs + seg.offset] += self._impacts(seg.bm25, docs, seg.bm25.post_tf[lo:hi], idf, avgdl)
+        scores[deleted] = 0.0
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int, stats: Dict | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over live docs; same contract and MaxScore pruning as ``BM25Okapi.top_k``.
+
+        ``stats`` (from ``merge_stats``) scores with collection-wide idf and
+        avgdl instead of this index's own, e.g. for one shard of a corpus.
+        """
+        return self.top_k_many([query_tokens], k, stats)[0]
+
+    def top_k_many(self, queries: List[List[str]], k: int, stats: Dict | None = None,
+                   overlap_docs: List[np.ndarray] | None = None) -> List[Tuple[np.ndarray, ...]]:
+        """``top_k`` for several tokenized queries, scored against one snapshot of the index.
+
+        Per-term work is shared by the batch: idf and impact bounds are
+        computed once per distinct term, the postings impacts of a term that
+        several queries use once (up to SHARED_IMPACTS entries), and one
+        score accumulator serves every query. ``stats`` must cover the terms
+        of all the queries.
+
+        With ``overlap_docs`` (doc ids per query, e.g. its first vector hits)
+        each result gets a third array, ``overlap_counts`` of those docs,
+        taken from the same postings lookups that rescore the candidates.
+        """
+        segs, deleted, n_live, avgdl = self._stats()
+        n = len(deleted)
+        k = min(int(k), n_live)
+        if k <= 0:
+            empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+            if overlap_docs is None:
+                return [empty for _ in queries]
+            return [empty + (self.overlap_counts(q, docs),) for q, docs in zip(queries, overlap_docs)]
+        used: Dict[str, int] = {}
+        for query_tokens in queries:
+            for term in set(query_tokens):
+                used[term] = used.get(term, 0) + 1
+        if stats is None:
+            idf = {term: self._idf(segs, term, n_live) for term in used}
+        else:
+            idf = {term: _idf(stats["df"].get(term, 0), stats["n_live"]) for term in used}
+            avgdl = stats["total_len"] / stats["n_live"] if stats["n_live"] else 0.0
+        # highest impact of one occurrence of each term, over all segments
+        best = {}
+        for term in used:
+            best[term] = 0.0
+            for seg in segs:
+                t = seg.bm25.vocab.get(term)
+                if t is not None:
+                    mt, md = float(seg.bm25.max_tf[t]), max(int(seg.bm25.min_dl[t]), 1)
+                    norm = self.k1 * (1.0 - self.b + self.b * md / (avgdl or 1.0))
+                    best[term] = max(best[term], idf[term] * (mt * (self.k1 + 1.0) / (mt + norm)))
+        shared: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        budget = self.SHARED_IMPACTS
+
+        def impacts(term: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+            """(global doc ids, impacts) of the term's postings, per segment."""
+            nonlocal budget
+            if term in shared:
+                return shared[term]
+            parts = []
+            for seg in segs:
+                t = seg.bm25.vocab.get(term)
+                if t is None:
+                    continue
+                lo, hi = seg.bm25.post_ptr[t], seg.bm25.post_ptr[t + 1]
+                docs = seg.bm25.post_docs[lo:hi]
+                parts.append((docs + seg.offset, self._impacts(seg.bm25, docs, seg.bm25.post_tf[lo:hi], idf[term], avgdl)))
+            size = sum(len(d) for d, _ in parts)
+            if used[term] > 1 and size <= budget:
+                shared[term] = parts
+                budget -= size
+            return parts
+
+        acc = np.zeros(n, dtype=np.float64)
+        out = []
+        for j, query_tokens in enumerate(queries):
+            counts: Dict[str, int] = {}
+            for term in query_tokens:
+                counts[term] = counts.get(term, 0) + 1
+            bound = {term: best[term] * c for term, c in counts.items() if best[term] > 0.0}
+            cand = np.zeros(0, dtype=np.int64)
+            if bound:
+                terms = sorted(bound, key=bound.get, reverse=True)
+                rest = np.append(np.cumsum([bound[t] for t in terms][::-1])[::-1], 0.0)
+                touched = np.zeros(0, dtype=np.int64)
+                theta = 0.0
+                for i, term in enumerate(terms):
+                    # tombstones are applied to the term's postings only, never to the whole accumulator
+                    live = [(docs[~deleted[docs]], imp[~deleted[docs]]) for docs, imp in impacts(term)]
+                    for docs, imp in live:
+                        acc[docs] += counts[term] * imp
+                    touched = np.union1d(touched, np.concatenate([docs for docs, _ in live]))
+                    if len(touched) >= k:
+                        theta = float(np.partition(acc[touched], len(touched) - k)[len(touched) - k])
+                    if rest[i + 1] < theta * (1.0 - 1e-9):
+                        break
+                cand = touched[acc[touched] + rest[i + 1] >= theta * (1.0 - 1e-9)]
+                # every nonzero entry is in touched: clear them for the next query
+                acc[touched] = 0.0
+            if overlap_docs is None:
+                scores = self._rescore(segs, query_tokens, cand, idf, avgdl)[0]
+            else:
+                # one rescoring pass over the candidates and the overlap docs together
+                extra = np.asarray(overlap_docs[j], dtype=np.int64)
+                docs = np.union1d(cand, extra)
+                scores, hits = self._rescore(segs, query_tokens, docs, idf, avgdl)
+                overlap = hits[np.searchsorted(docs, extra)]
+                scores = scores[np.searchsorted(docs, cand)]
+            if len(cand) > k:
+                kth = np.partition(scores, len(cand) - k)[len(cand) - k]
+                keep = scores >= kth
+                cand, scores = cand[keep], scores[keep]
+            order = np.lexsort((cand, -scores))[:k]
+            idxs, scores = cand[order], scores[order]
+            if len(idxs) < k:
+                pad = np.setdiff1d(np.flatnonzero(~deleted), idxs)[:k - len(idxs)]
+                idxs = np.concatenate([idxs, pad])
+                scores = np.concatenate([scores, np.zeros(len(pad), dtype=np.float64)])
+            out.append((idxs, scores) if overlap_docs is None else (idxs, scores, overlap))
+        return out
+
+    def _rescore(self, segs, query_tokens, docs, idf, avgdl) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact scores of ``docs`` (ascending) and how many distinct query terms each contains."""
+        scores = np.zeros(len(docs), dtype=np.float64)
+        hits = np.zeros(len(docs), dtype=np.int64)
+        if not len(docs):
+            return scores, hits
+        seen = set()
+        for term in query_tokens:
+            first = term not in seen
+            seen.add(term)
+            for seg in segs:
+                t = seg.bm25.vocab.get(term)
+                if t is None:
+                    continue
+                lo, hi = np.searchsorted(docs, [seg.offset, seg.end])
+                if lo == hi:
+                    continue
+                local = docs[lo:hi] - seg.offset
+                p0, p1 = seg.bm25.post_ptr[t], seg.bm25.post_ptr[t + 1]
+                pdocs = seg.bm25.post_docs[p0:p1]
+                pos = np.searchsorted(pdocs, local)
+                pos[pos == len(pdocs)] = 0
+                hit = pdocs[pos] == local
+                scores[lo:hi][hit] += self._impacts(seg.bm25, local[hit], seg.bm25.post_tf[p0:p1][pos[hit]], idf[term], avgdl)
+                if first:
+                    hits[lo:hi] += hit
+        return scores, hits
+
+def _idf(df: int, n_live: int) -> float:
+    return math.log(1 + (n_live - df + 0.5) / (df + 0.5))
+
+def merge_stats(parts: List[Dict]) -> Dict:
+    """Sum ``term_stats`` of disjoint indexes into statistics for their union."""
+    df: Dict[str, int] = {}
+    for p in parts:
+        for term, n in p["df"].items():
+            df[term] = df.get(term, 0) + n
+    return {"n_live": sum(p["n_live"] for p in parts), "total_len": sum(p["total_len"] for p in parts), "df": df}
+
+def _merge_segments(segs: List[_Segment], deleted: np.ndarray, k1: float, b: float) -> BM25Okapi:
+    """One BM25Okapi over the union of ``segs`` (contiguous), without tombstoned postings.
+
+    Tombstoned docs keep their ids but get length 0 and no postings.
+    """
+    offset0 = segs[0].offset
+    dead = deleted[offset0:segs[-1].end]
+    vocab: Dict[str, int] = {}
+    terms, docs, tfs = [], [], []
+    for seg in segs:
+        bm = seg.bm25
+        # vocab dicts iterate in term id order
+        remap = np.fromiter((vocab.setdefault(t, len(vocab)) for t in bm.vocab), dtype=np.int64, count=len(bm.vocab))
+        pd = np.asarray(bm.post_docs).astype(np.int64) + (seg.offset - offset0)
+        keep = ~dead[pd]
+        terms.append(np.repeat(remap, np.diff(bm.post_ptr))[keep])
+        docs.append(pd[keep])
+        tfs.append(np.asarray(bm.post_tf)[keep])
+    terms, docs, tfs = np.concatenate(terms), np.concatenate(docs), np.concatenate(tfs)
+    # drop terms whose postings were all tombstoned
+    used, terms = np.unique(terms, return_inverse=True)
+    names = list(vocab)
+    vocab = {names[u]: i for i, u in enumerate(used.tolist())}
+    order = np.lexsort((docs, terms))
+    doc_len = np.concatenate([np.asarray(s.bm25.doc_len) for s in segs]).astype(np.int64)
+    doc_len[dead] = 0
+    return BM25Okapi.from_postings(vocab, terms[order], docs[order], tfs[order], doc_len, k1, b)
@@ -0,0 +1,94 @@
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from src.search.lexical_index import LexicalIndex
+from src.search.vector_index import gather_vectors, open_index, open_vectors, search_live, search_params
+
+MANIFEST = "shards.json"
+
+def default_shards_path(index_path: str) -> str:
+    """Shards written by build_shards live next to the index: index/shards/shard_000, ..."""
+    return os.path.join(os.path.dirname(index_path) or ".", "shards")
+
+def shard_paths(shard_dir: str):
+    """(index_path, chunks_path, lexical_path) inside one shard directory."""
+    return (os.path.join(shard_dir, "faiss.index"), os.path.join(shard_dir, "chunks.jsonl"),
+            os.path.join(shard_dir, "bm25"))
+
+def load_manifest(shards_dir: str) -> List[Dict]:
+    """Shard entries in row order: {"name", "offset", "count"}; offset is the first global row id."""
+    with open(os.path.join(shards_dir, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)["shards"]
+
+class Shard:
+    """Vector index, lexical index and chunk rows for one contiguous slice of the corpus.
+
+    Takes global row ids in and out (``offset`` + local row). Query vectors
+    come from the caller, so a shard never loads the embedding model.
+    """
+    def __init__(self, shard_dir: str, offset: int):
+        index_path, chunks_path, lexical_path = shard_paths(shard_dir)
+        self.offset = offset
+        self.index = open_index(index_path)
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            self.rows = [json.loads(l) for l in f.read().splitlines()]
+        self.bm25 = LexicalIndex.load(lexical_path)
+        self.stored = open_vectors(index_path, self.index, len(self.rows))
+
+    def term_stats(self, q_tokens: List[str]) -> Dict:
+        return self.bm25.term_stats(q_tokens)
+
+    def search(self, q: np.ndarray | None, q_tokens: List[str], k: int, stats: Dict | None = None,
+               nprobe: int | None = None, ef_search: int | None = None, check_k: int = 0) -> Dict:
+        """Vector top-k for ``q`` and/or BM25 top-k under collection ``stats``, as (global id, score) lists.
+
+        ``overlap`` holds the lexical overlap counts of the first ``check_k``
+        vector hits, for the hybrid fallback test.
+        """
+        return self.search_many(q, [q_tokens], k, stats, nprobe, ef_search, check_k)[0]
+
+    def search_many(self, Q: np.ndarray | None, tokens: List[List[str]], k: int, stats: Dict | None = None,
+                    nprobe: int | None = None, ef_search: int | None = None, check_k: int = 0) -> List[Dict]:
+        """``search`` for a batch of queries (rows of ``Q``, ``tokens``): one index search, one BM25 pass."""
+        out = [{} for _ in tokens]
+        checks = [np.zeros(0, dtype=np.int64) for _ in tokens]
+        if Q is not None:
+            params = search_params(self.index, nprobe, ef_search)
+            D, I = search_live(lambda kk: self.index.search(Q, kk, params=params), k, self.bm25.deleted,
+                               self.bm25.N - self.bm25.n_live, self.index.ntotal)
+            for j, (o, q_tokens, Dq, Iq) in enumerate(zip(out, tokens, D, I)):
+                live = [(i, s) for i, s in zip(Iq.tolist(), Dq.tolist()) if i >= 0 and not self.bm25.deleted[i]][:k]
+                o["vector"] = [(i + self.offset, s) for i, s in live]
+                if check_k and q_tokens:
+                    checks[j] = np.array([i for i, _ in live[:check_k]], dtype=np.int64)
+        if stats is not None:
+            # the overlap counts come out of the same pass that rescores the BM25 candidates
+            for o, (idxs, scores, overlap) in zip(out, self.bm25.top_k_many(tokens, k, stats, overlap_docs=checks)):
+                o["bm25"] = [(i + self.offset, s) for i, s in zip(idxs.tolist(), scores.tolist())]
+                if len(overlap):
+                    o["overlap"] = overlap.tolist()
+        elif check_k:
+            for o, q_tokens, check in zip(out, tokens, checks):
+                if len(check):
+                    o["overlap"] = self.bm25.overlap_counts(q_tokens, check).tolist()
+        return out
+
+    def fetch(self, ids: List[int]) -> List[Dict]:
+        return [self.rows[i - self.offset] for i in ids]
+
+    def vectors(self, ids: List[int]) -> np.ndarray | None:
+        """Stored passage vectors of global row ids (for MMR); None if the shard has none."""
+        return gather_vectors(self.index, self.stored, [i - self.offset for i in ids])
+
+# ---------- worker process entry points (one shard per process) ----------
+_SHARD: Shard | None = None
+
+def init_worker(shard_dir: str, offset: int):
+    global _SHARD
+    _SHARD = Shard(shard_dir, offset)
+
+def call(method: str, *args):
+    return getattr(_SHARD, method)(*args)
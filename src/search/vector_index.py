@@ -0,0 +1,326 @@
+import math
+import os
+import time
+import weakref
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+# FAISS_INDEX_TYPE -> index_factory description; all use inner product over normalized vectors.
+# Vector ids are chunk row numbers; IDMap keeps them stable when flat/SQ vectors are removed
+# (IVF stores ids natively, HNSW cannot remove and relies on tombstones)
+INDEX_TYPES = {
+    "flat": "IDMap,Flat",
+    "ivf_flat": "IVF{nlist},Flat",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}x{pq_bits}",
+    "hnsw": "HNSW{hnsw_m},Flat",
+    # scalar quantized: 1 byte (sq8) / 2 bytes (sqfp16) per dimension instead of 4
+    "sq8": "IDMap,SQ8",
+    "sqfp16": "IDMap,SQfp16",
+    "ivf_sq8": "IVF{nlist},SQ8",
+}
+
+def default_embeddings_path(index_path: str) -> str:
+    """Float32 passage vectors (row = vector id) are saved next to the index as embeddings.npy."""
+    return os.path.join(os.path.dirname(index_path) or ".", "embeddings.npy")
+
+def default_ivfdata_path(index_path: str) -> str:
+    """Inverted lists of an on-disk IVF index (FAISS_ONDISK) live next to it: faiss.index -> faiss.ivfdata."""
+    return os.path.splitext(index_path)[0] + ".ivfdata"
+
+# indexes read with mapped, read-only storage: faiss crashes rather than raising when they are modified
+_READ_ONLY = weakref.WeakSet()
+_warned_mmap = False
+
+def is_read_only(index: faiss.Index) -> bool:
+    """True if ``index`` came from ``read_index`` memory-mapped or on-disk, so it must not be modified."""
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    return index in _READ_ONLY
+
+def _check_writable(index: faiss.Index):
+    if is_read_only(index):
+        raise ValueError("Index was opened memory-mapped and read-only; reopen it with read_index(path, mmap=False) to modify it")
+
+def read_index(index_path: str, mmap: bool | None = None) -> faiss.Index:
+    """Read a search-only index; with FAISS_MMAP (default on) its vectors stay in the page cache.
+
+    Memory-mapped codes are clean file-backed pages: open is near-instant and
+    every worker process serving the same file shares one physical copy
+    instead of holding a private heap copy each. The mapping is read-only,
+    so the returned index must not be modified.
+    """
+    if os.path.exists(default_ivfdata_path(index_path)):
+        # on-disk lists (FAISS_ONDISK) are always mapped; find them next to the index
+        index = faiss.read_index(index_path, faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY)
+        _READ_ONLY.add(index)
+        return index
+    if mmap is None:
+        mmap = os.getenv("FAISS_MMAP", "true").lower() == "true"
+    if not mmap:
+        return faiss.read_index(index_path)
+    # IO_FLAG_MMAP_IFC maps flat/SQ/PQ codes, HNSW storage and IVF lists in place;
+    # older faiss builds only have IO_FLAG_MMAP, which covers the IVF lists
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if flag is None:
+        global _warned_mmap
+        if not _warned_mmap:
+            print(f"[WARN] faiss {faiss.__version__} has no IO_FLAG_MMAP_IFC: only IVF lists are memory-mapped, "
+                  "flat/SQ/PQ codes and HNSW graphs are loaded into each process (needs faiss-cpu >= 1.11)")
+            _warned_mmap = True
+        flag = faiss.IO_FLAG_MMAP
+    index = faiss.read_index(index_path, flag | faiss.IO_FLAG_READ_ONLY)
+    _READ_ONLY.add(index)
+    return index
+
+def open_index(index_path: str, rescore: bool | None = None, rescore_factor: int | None = None, mmap: bool | None = None):
+    """Load the vector index; with FAISS_RESCORE=true wrap it in a RescoringIndex over embeddings.npy."""
+    index = read_index(index_path, mmap)
+    if rescore is None:
+        rescore = os.getenv("FAISS_RESCORE", "false").lower() == "true"
+    if not rescore:
+        return index
+    emb_path = default_embeddings_path(index_path)
+    if not os.path.exists(emb_path):
+        print(f"[WARN] FAISS_RESCORE is on but {emb_path} is missing; searching without exact re-scoring")
+        return index
+    factor = rescore_factor or int(os.getenv("FAISS_RESCORE_FACTOR", "4"))
+    return RescoringIndex(index, np.load(emb_path, mmap_mode="r"), factor)
+
+def open_vectors(index_path: str, index, rows: int) -> np.ndarray | None:
+    """Passage vectors saved at ingest (embeddings.npy, read-only memory map) if they cover ``rows`` chunks.
+
+    A RescoringIndex already holds the same map, which is reused.
+    """
+    if isinstance(index, RescoringIndex):
+        vectors = index.vectors
+    else:
+        emb_path = default_embeddings_path(index_path)
+        vectors = np.load(emb_path, mmap_mode="r") if os.path.exists(emb_path) else None
+    if vectors is not None and len(vectors) < rows:
+        print(f"[WARN] {default_embeddings_path(index_path)} has {len(vectors)} vectors, chunks have {rows}; not using it")
+        return None
+    return vectors
+
+def gather_vectors(index, vectors: np.ndarray | None, ids) -> np.ndarray | None:
+    """float32 vectors of row ids ``ids``: from ``vectors``, else reconstructed by ``index``.
+
+    Reconstruction works for HNSW and IVF indexes with a direct map (IVF
+    vectors come back decoded, so approximate); None when the index cannot.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if vectors is not None:
+        return np.asarray(vectors[ids], dtype=np.float32)
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    try:
+        return index.reconstruct_batch(ids)
+    except RuntimeError:
+        return None
+
+class RescoringIndex:
+    """Over-fetch from a compressed index, then re-rank by exact float inner product.
+
+    ``factor * k`` candidates come from the quantized index; their float32
+    vectors are gathered from a read-only memory map, so only the touched
+    rows are paged in and the full-precision copy never sits in the heap.
+    Exposes the ``search`` / ``ntotal`` / ``d`` subset of ``faiss.Index``
+    the Retriever uses.
+    """
+    def __init__(self, index: faiss.Index, vectors: np.ndarray, factor: int = 4):
+        self.index = index
+        self.vectors = vectors
+        self.factor = max(1, factor)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def search(self, q: np.ndarray, k: int, params=None):
+        _, I = self.index.search(q, k * self.factor, params=params)
+        D_out = np.full((len(q), k), -np.inf, dtype=np.float32)
+        I_out = np.full((len(q), k), -1, dtype=np.int64)
+        for r in range(len(q)):
+            # ascending ids keep the gather sequential in the memory map
+            ids = np.sort(I[r][I[r] >= 0])
+            exact = self.vectors[ids] @ q[r]
+            order = np.argsort(-exact, kind="stable")[:k]
+            D_out[r, :len(order)] = exact[order]
+            I_out[r, :len(order)] = ids[order]
+        return D_out, I_out
+
+def index_config(index_type: str | None = None, **overrides) -> Dict:
+    """Index build settings from FAISS_* env vars, with explicit overrides taking precedence."""
+    cfg = {
+        "index_type": (index_type or os.getenv("FAISS_INDEX_TYPE", "flat")).lower(),
+        "nlist": int(os.getenv("FAISS_NLIST", "0")),            # 0 = 4*sqrt(N)
+        "pq_m": int(os.getenv("FAISS_PQ_M", "0")),              # 0 = dim/8 sub-quantizers
+        "hnsw_m": int(os.getenv("FAISS_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("FAISS_EF_CONSTRUCTION", "200")),
+        "train_sample": int(os.getenv("FAISS_TRAIN_SAMPLE", "100000")),
+        # query-time defaults stored in the index; /search can override per request
+        "nprobe": int(os.getenv("FAISS_NPROBE", "16")),
+        "ef_search": int(os.getenv("FAISS_EF_SEARCH", "64")),
+        # IVF only: inverted lists in <index>.ivfdata, built FAISS_SHARD_SIZE vectors at a time
+        "ondisk": os.getenv("FAISS_ONDISK", "false").lower() == "true",
+        "shard_size": int(os.getenv("FAISS_SHARD_SIZE", "100000")),
+    }
+    cfg.update({k: v for k, v in overrides.items() if v is not None})
+    if cfg["index_type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {cfg['index_type']!r}; expected one of {sorted(INDEX_TYPES)}")
+    if cfg["ondisk"] and not cfg["index_type"].startswith("ivf_"):
+        raise ValueError(f"FAISS_ONDISK needs an IVF index type, got {cfg['index_type']!r}")
+    return cfg
+
+def make_index(dim: int, n: int, cfg: Dict) -> faiss.Index:
+    """Create an empty (untrained) index for ``n`` vectors of size ``dim``."""
+    nlist = cfg["nlist"] or int(4 * math.sqrt(max(n, 1)))
+    # k-means wants ~39 training points per centroid
+    nlist = max(1, min(nlist, n // 39 or 1))
+    pq_m = cfg["pq_m"] or max(1, dim // 8)
+    while dim % pq_m:
+        pq_m -= 1
+    # 8-bit codebooks need 256 training points; tiny corpora get smaller ones
+    pq_bits = 8 if n >= 256 else max(1, int(math.log2(max(n, 2))))
+    desc = INDEX_TYPES[cfg["index_type"]].format(nlist=nlist, pq_m=pq_m, pq_bits=pq_bits, hnsw_m=cfg["hnsw_m"])
+    index = faiss.index_factory(dim, desc, faiss.METRIC_INNER_PRODUCT)
+    set_defaults(index, cfg)
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = cfg["ef_construction"]
+    return index
+
+def set_defaults(index: faiss.Index, cfg: Dict):
+    """Store the query-time knobs in the index so they persist with it."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(cfg["nprobe"], ivf.nlist)
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = cfg["ef_search"]
+
+def train_sample(X: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Uniform sample of at most ``size`` rows for k-means / PQ training."""
+    if size <= 0 or len(X) <= size:
+        return X
+    rows = np.sort(np.random.default_rng(seed).choice(len(X), size, replace=False))
+    return np.ascontiguousarray(X[rows])
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def has_ids(index: faiss.Index) -> bool:
+    """True if ``index`` takes explicit ids, so vectors can be removed without renumbering the rest."""
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    index = faiss.downcast_index(index)
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) or faiss.try_extract_index_ivf(index) is not None
+
+def add_rows(index: faiss.Index, X: np.ndarray, start: int):
+    """Add ``X`` as vector ids ``start, start + 1, ...`` (their chunk rows)."""
+    _check_writable(index)
+    if has_ids(index):
+        index.add_with_ids(X, np.arange(start, start + len(X), dtype=np.int64))
+    elif index.ntotal == start:
+        index.add(X)
+    else:
+        raise ValueError(f"Index holds {index.ntotal} vectors, cannot append row {start} without explicit ids")
+
+def remove_rows(index: faiss.Index, ids) -> int:
+    """Remove vector ids from an index that supports it; returns how many were removed (0 for HNSW)."""
+    _check_writable(index)
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids) or not has_ids(index):
+        return 0
+    return int(index.remove_ids(ids))
+
+def search_live(search, k: int, deleted: np.ndarray, n_dead: int, ntotal: int):
+    """``search(k')`` -> (D, I), with k' raised until every row holds ``k`` ids not marked in ``deleted``.
+
+    Chunks tombstoned in the lexical index may still be in the vector index
+    (HNSW cannot remove them until the next full build), so the
+    first search over-fetches by min(n_dead, k) and later ones double the
+    margin up to n_dead, which always suffices. Rows may hold more than k
+    live ids; callers keep the first k.
+    """
+    extra = min(n_dead, k)
+    while True:
+        kk = min(k + extra, max(ntotal, k))
+        D, I = search(kk)
+        if extra >= n_dead or kk >= ntotal:
+            return D, I
+        live = I >= 0
+        live[live] = ~deleted[I[live]]
+        if live.sum(axis=1).min() >= k:
+            return D, I
+        extra = min(2 * extra, n_dead)
+
+def search_params(index: faiss.Index, nprobe: int | None = None, ef_search: int | None = None):
+    """Per-call SearchParameters for ``index.search``; None keeps the index defaults.
+
+    Parameters are passed per call rather than set on the shared index, so
+    concurrent requests with different knobs do not interfere.
+    """
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    if nprobe and faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search and isinstance(_unwrap(index), faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+def exact_search(X: np.ndarray, queries: np.ndarray, k: int, block: int = 65536):
+    """Exact inner-product top-k over ``X`` read ``block`` rows at a time (``X`` may be a memory map)."""
+    D = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    I = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(X), block):
+        part = np.ascontiguousarray(X[start:start + block], dtype=np.float32)
+        Db, Ib = faiss.knn(queries, part, min(k, len(part)), metric=faiss.METRIC_INNER_PRODUCT)
+        D, I = np.hstack([D, Db]), np.hstack([I, Ib + start])
+        order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+        D, I = np.take_along_axis(D, order, 1), np.take_along_axis(I, order, 1)
+    return D, I
+
+def ann_report(index: faiss.Index, X: np.ndarray, queries: np.ndarray, k: int = 10, flat_baseline: bool = True) -> Dict:
+    """Recall@k against exact search over ``X`` and per-query latency, sweeping the query knob.
+
+    ``flat_baseline`` also times an in-memory flat index over ``X``; turn it
+    off when ``X`` does not fit in RAM.
+    """
+    k = min(k, len(X))
+    _, truth = exact_search(X, queries, k)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        knob, values = "nprobe", sorted({v for v in (1, 4, 8, 16, 32, 64, 128) if v <= ivf.nlist} | {ivf.nprobe})
+    elif isinstance(_unwrap(index), faiss.IndexHNSW):
+        knob, values = "ef_search", sorted({16, 32, 64, 128, 256, _unwrap(index).hnsw.efSearch})
+    else:
+        knob, values = None, [None]
+    runs: List[Dict] = []
+    for v in values:
+        params = search_params(index, **({knob: v} if knob else {}))
+        t0 = time.perf_counter()
+        found = np.vstack([index.search(queries[i:i + 1], k, params=params)[1] for i in range(len(queries))])
+        ms = (time.perf_counter() - t0) / max(len(queries), 1) * 1000
+        recall = float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found.tolist(), truth.tolist())]))
+        runs.append({"knob": knob, "value": v, f"recall@{k}": recall, "ms_per_query": ms})
+    flat_ms = None
+    if flat_baseline:
+        exact = faiss.IndexFlatIP(X.shape[1])
+        exact.add(X)
+        t0 = time.perf_counter()
+        for i in range(len(queries)):
+            exact.search(queries[i:i + 1], k)
+        flat_ms = (time.perf_counter() - t0) / max(len(queries), 1) * 1000
+    return {"ntotal": int(index.ntotal), "n_queries": int(len(queries)), "k": k,
+            "flat_ms_per_query": flat_ms, "runs": runs}
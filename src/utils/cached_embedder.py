@@ -1,55 +1,120 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
-from typing import List
-from src.utils.embedding_cache import EmbeddingCache
-from src.ingest.embed import E5Embedder
+from typing import Dict, List
+from src.utils.embedding_cache import open_cache
+from src.ingest.embed import E5Embedder, embedder_id
 
 def _normalize(X: np.ndarray) -> np.ndarray:
     X = np.asarray(X, dtype="float32")
     n = np.linalg.norm(X, axis=1, keepdims=True) + 1e-12
     return X / n
 
+class LRUCache:
+    """Bounded in-memory map with least-recently-used eviction and an optional TTL (seconds, 0 = none).
+
+    Counts hits, misses, evictions (capacity) and expirations (TTL).
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and item[0] and item[0] < time.monotonic():
+                del self.data[key]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl if self.ttl > 0 else 0.0, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
 class CachedEmbedder:
     """Wraps E5Embedder with a disk cache.
-    Set EMB_CACHE=false to disable, EMB_CACHE_PATH to change location.
+    Set EMB_CACHE=false to disable, EMB_CACHE_PATH to change location,
+    EMB_CACHE_BACKEND=vlog for the memory-mapped vector log.
+    Query embeddings additionally go through an in-process LRU
+    (QUERY_CACHE_SIZE entries, QUERY_CACHE_TTL seconds), so repeated
+    queries skip both the model and SQLite.
     """
-    def __init__(self, model_name: str, cache_path: str | None = None):
+    def __init__(self, model_name: str, cache_path: str | None = None, inner=None):
         self.model_name = model_name
-        self.inner = E5Embedder(model_name)
-        if cache_path is None:
-            cache_path = os.getenv("EMB_CACHE_PATH", "./index/emb_cache.sqlite3")
-        self.cache = EmbeddingCache(cache_path)
+        # inner: anything with embed_passages / embed_queries, e.g. an ingest EmbedPool
+        self.inner = inner or E5Embedder(model_name)
+        # cache entries are per model and backend (EMBED_BACKEND)
+        self.cache_model = embedder_id(model_name)
+        self.cache = open_cache(cache_path)
+        self.query_cache = LRUCache(int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+                                    float(os.getenv("QUERY_CACHE_TTL", "3600")))
 
     def _embed_with_cache(self, texts: List[str], fn):
         texts = [t if isinstance(t, str) else str(t) for t in texts]
-        cached = self.cache.get_many(self.model_name, texts)
-        to_compute_idx = [i for i, v in enumerate(cached) if v is None]
-        computed_vectors = []
-        if to_compute_idx:
+        out, found = self.cache.get_array(self.cache_model, texts)
+        to_compute_idx = np.flatnonzero(~found)
+        if len(to_compute_idx):
             batch = [texts[i] for i in to_compute_idx]
-            arr = fn(batch)
-            arr = _normalize(arr)
-            computed_vectors = arr.tolist()
-            self.cache.put_many(self.model_name, batch, computed_vectors)
-        # stitch together
-        out = []
-        ci = 0
-        for i in range(len(texts)):
-            if cached[i] is not None:
-                out.append([float(x) for x in cached[i]])
-            else:
-                out.append(computed_vectors[ci])
-                ci += 1
-        return np.array(out, dtype="float32")
+            arr = _normalize(fn(batch))
+            self.cache.put_many(self.cache_model, batch, arr)
+            if out is None:
+                out = np.empty((len(texts), arr.shape[1]), dtype="float32")
+            # stitch computed rows in between the cached ones
+            out[to_compute_idx] = arr
+        if out is None:
+            return np.zeros((0, 0), dtype="float32")
+        return out
 
     def embed_queries(self, queries: List[str]) -> np.ndarray:
-        return self._embed_with_cache(queries, self.inner.embed_queries)
+        queries = [q if isinstance(q, str) else str(q) for q in queries]
+        # the LRU holds only queries, keyed like the model input; the disk cache keeps its plain-text keys,
+        # so rows written before the LRU existed stay valid
+        keys = [(self.cache_model, "query: " + q) for q in queries]
+        vecs = [self.query_cache.get(k) for k in keys]
+        miss = [i for i, v in enumerate(vecs) if v is None]
+        if miss:
+            E = self._embed_with_cache([queries[i] for i in miss], self.inner.embed_queries)
+            for j, i in enumerate(miss):
+                vecs[i] = E[j].copy()
+                vecs[i].setflags(write=False)
+                self.query_cache.put(keys[i], vecs[i])
+        if not vecs:
+            return np.zeros((0, 0), dtype="float32")
+        return np.vstack(vecs)
 
     def embed_passages(self, passages: List[str]) -> np.ndarray:
         return self._embed_with_cache(passages, self.inner.embed_passages)
 
-def get_embedder(model_name: str):
+def get_embedder(model_name: str, inner=None):
     use_cache = os.getenv("EMB_CACHE", "true").lower() != "false"
     if use_cache:
-        return CachedEmbedder(model_name)
-    return E5Embedder(model_name)
+        return CachedEmbedder(model_name, inner=inner)
+    return inner or E5Embedder(model_name)
@@ -1,21 +1,119 @@
 import os
+import sys
 import sqlite3
 import hashlib
 import zlib
 import json
 import threading
-from typing import List, Optional
+import atexit
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# vec formats: legacy zlib-compressed JSON, raw little-endian float32 / float16
+FMT_JSON, FMT_F32, FMT_F16 = 0, 1, 2
+_DTYPES = {FMT_F32: np.dtype("<f4"), FMT_F16: np.dtype("<f2")}
+_FORMATS = {"float32": FMT_F32, "float16": FMT_F16}
+# keys per SELECT ... IN (...), well under SQLite's bound-variable limit (999 before 3.32)
+LOOKUP_CHUNK = 500
+# eviction: which entries go first, and how far below the cap it trims (so it does not run on every commit)
+_POLICIES = ("lru", "lfu")
+EVICT_LOW_WATER = 0.9
+
+def _decode_json(blob: bytes) -> np.ndarray:
+    return np.asarray(json.loads(zlib.decompress(blob).decode("utf-8")), dtype=np.float32)
+
+_caches: "weakref.WeakSet[EmbeddingCache]" = weakref.WeakSet()
+
+def _after_fork():
+    # another thread of the parent may have held the lock at fork time; in the child it would never be released
+    for cache in list(_caches):
+        cache.lock = threading.Lock()
+        cache._timer = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
 
 class EmbeddingCache:
     """Lightweight SQLite-based cache for embedding vectors.
-    Stores (model, text) -> vector as compressed JSON in a BLOB.
+    Stores (model, text) -> vector as a raw little-endian BLOB, float32 or
+    float16 (EMB_CACHE_DTYPE), decoded with np.frombuffer. Rows written by
+    older versions (zlib-compressed JSON, fmt 0) are still read; ``migrate``
+    rewrites them in place.
+
+    Safe for many threads and processes at once: the database runs in WAL
+    mode, so readers never block the writer or each other. Every thread reads
+    through its own connection, without a lock. Writes are group-committed:
+    ``put_many`` buffers rows (visible to this process's lookups at once) and
+    commits them in one transaction every EMB_CACHE_COMMIT_ROWS rows or
+    EMB_CACHE_COMMIT_MS milliseconds, and at exit (``flush``).
+
+    Size cap: every hit bumps the entry's access time and hit count in a
+    small ``usage`` table (batched into the same group commit). Once the
+    database holds more than EMB_CACHE_MAX_MB or EMB_CACHE_MAX_ENTRIES, the
+    least recently (lru) or least frequently (lfu) used entries are deleted
+    down to 90% of the cap (EMB_CACHE_EVICTION). ``purge`` drops whole
+    models; ``compact`` also hands the freed pages back to the filesystem.
     """
-    def __init__(self, path: str = "./index/emb_cache.sqlite3"):
+    def __init__(self, path: str = "./index/emb_cache.sqlite3", dtype: str | None = None):
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        # allow multithreaded use by retriever
-        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.path = path
         self.lock = threading.Lock()
+        dtype = (dtype or os.getenv("EMB_CACHE_DTYPE", "float32")).lower()
+        if dtype not in _FORMATS:
+            raise ValueError(f"Unknown EMB_CACHE_DTYPE {dtype!r}; expected one of {sorted(_FORMATS)}")
+        self.fmt = _FORMATS[dtype]
+        self.commit_rows = int(os.getenv("EMB_CACHE_COMMIT_ROWS", "1024"))
+        self.commit_ms = float(os.getenv("EMB_CACHE_COMMIT_MS", "200"))
+        self.max_mb = float(os.getenv("EMB_CACHE_MAX_MB", "0"))
+        self.max_entries = int(os.getenv("EMB_CACHE_MAX_ENTRIES", "0"))
+        self.policy = os.getenv("EMB_CACHE_EVICTION", "lru").lower()
+        if self.policy not in _POLICIES:
+            raise ValueError(f"Unknown EMB_CACHE_EVICTION {self.policy!r}; expected one of {_POLICIES}")
+        self.pending: Dict[str, tuple] = {}
+        # key -> hits since the last commit
+        self.touched: Dict[str, int] = {}
+        self._entries: int | None = None
+        self._timer: threading.Timer | None = None
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._pid = os.getpid()
+        # writer connection, used under self.lock only
+        self.conn = self._connect()
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self._init_db()
+        _caches.add(self)
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0)
+        # WAL only needs the log fsynced at checkpoints; a cache can lose its last commits on power loss
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self.lock:
+                if self._pid != os.getpid():
+                    # connections must not cross a fork; the child starts with its own
+                    self._pid = os.getpid()
+                    self._local = threading.local()
+                    self._readers = []
+                    self.pending = {}
+                    self.touched = {}
+                    self._timer = None
+                    self.conn = self._connect()
+
+    def _reader(self) -> sqlite3.Connection:
+        """This thread's read connection."""
+        self._check_fork()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self.lock:
+                self._readers.append(conn)
+        return conn
 
     def _init_db(self):
         with self.conn:
@@ -24,52 +122,345 @@ class EmbeddingCache:
                     key TEXT PRIMARY KEY,
                     model TEXT NOT NULL,
                     dims INTEGER NOT NULL,
-                    vec  BLOB NOT NULL
+                    vec  BLOB NOT NULL,
+                    fmt  INTEGER NOT NULL DEFAULT 1
                 )"""
             )
             self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_model ON cache(model)")
+            # access stats live apart from the vectors: bumping them rewrites a few bytes, not the blob
+            if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'usage'").fetchone():
+                self.conn.execute(
+                    """CREATE TABLE usage (
+                        key   TEXT PRIMARY KEY,
+                        atime REAL NOT NULL,
+                        hits  INTEGER NOT NULL DEFAULT 0
+                    ) WITHOUT ROWID"""
+                )
+                # entries cached before access tracking start out as just used
+                self.conn.execute("INSERT INTO usage(key, atime) SELECT key, ? FROM cache", (time.time(),))
+            # user_version 1: no JSON rows left, nothing to check on open
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+                return
+            cols = {r[1] for r in self.conn.execute("PRAGMA table_info(cache)")}
+            if "fmt" not in cols:
+                # cache file from before binary vectors: existing rows are JSON
+                self.conn.execute(f"ALTER TABLE cache ADD COLUMN fmt INTEGER NOT NULL DEFAULT {FMT_JSON}")
+            if self.conn.execute("SELECT 1 FROM cache WHERE fmt = ? LIMIT 1", (FMT_JSON,)).fetchone():
+                print("[WARN] Embedding cache holds JSON vectors; run `python -m src.utils.embedding_cache migrate` to convert them")
+            else:
+                self.conn.execute("PRAGMA user_version = 1")
 
     @staticmethod
     def _hash(model: str, text: str) -> str:
         return hashlib.sha256((model + "\n" + text).encode("utf-8")).hexdigest()
 
-    def get_many(self, model: str, texts: List[str]):
-        if not texts:
-            return []
+    def _fetch(self, model: str, texts: List[str]):
         keys = [self._hash(model, t) for t in texts]
-        qmarks = ",".join(["?"] * len(keys))
-        sql = f"SELECT key, vec, dims FROM cache WHERE key IN ({qmarks})"
-        cur = self.conn.execute(sql, keys)
-        rows = {k: (blob, dims) for (k, blob, dims) in cur.fetchall()}
-        out = []
-        for k in keys:
-            if k in rows:
-                blob, dims = rows[k]
-                try:
-                    vec = json.loads(zlib.decompress(blob).decode("utf-8"))
-                except Exception:
-                    vec = None
-                out.append(vec)
-            else:
-                out.append(None)
-        return out
+        rows = {}
+        conn = self._reader()
+        if self.pending:
+            with self.lock:
+                for k in keys:
+                    row = self.pending.get(k)
+                    if row is not None:
+                        rows[k] = (row[3], row[2], row[4])
+        todo = list(dict.fromkeys(k for k in keys if k not in rows))
+        for i in range(0, len(todo), LOOKUP_CHUNK):
+            part = todo[i:i + LOOKUP_CHUNK]
+            qmarks = ",".join(["?"] * len(part))
+            sql = f"SELECT key, vec, dims, fmt FROM cache WHERE key IN ({qmarks})"
+            rows.update((k, (blob, dims, fmt)) for (k, blob, dims, fmt) in conn.execute(sql, part))
+        return keys, rows
+
+    def get_array(self, model: str, texts: List[str]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Cached vectors as one float32 matrix (rows of misses left unset) and a hit mask.
 
-    def put_many(self, model: str, texts: List[str], vectors: List[list]):
+        Blobs are decoded with np.frombuffer straight into the preallocated
+        output, one copy per row (with the float16 -> float32 cast folded in).
+        The matrix is None when nothing was cached.
+        """
+        found = np.zeros(len(texts), dtype=bool)
         if not texts:
-            return
-        rows = []
-        for t, v in zip(texts, vectors):
-            key = self._hash(model, t)
+            return None, found
+        keys, rows = self._fetch(model, texts)
+        out = None
+        for i, k in enumerate(keys):
+            row = rows.get(k)
+            if row is None:
+                continue
+            blob, dims, fmt = row
+            if out is None:
+                out = np.empty((len(texts), dims), dtype=np.float32)
             try:
-                blob = zlib.compress(json.dumps([float(x) for x in v]).encode("utf-8"))
+                out[i] = np.frombuffer(blob, dtype=_DTYPES[fmt]) if fmt in _DTYPES else _decode_json(blob)
             except Exception:
-                # best-effort: skip if not serializable
                 continue
-            dims = len(v)
-            rows.append((key, model, dims, blob))
+            found[i] = True
+        if found.any():
+            self._touch([k for k, f in zip(keys, found) if f])
+        return out, found
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        out, found = self.get_array(model, texts)
+        return [out[i] if found[i] else None for i in range(len(texts))]
+
+    def put_many(self, model: str, texts: List[str], vectors):
+        if not texts:
+            return
+        try:
+            V = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).astype(_DTYPES[self.fmt], copy=False))
+        except (TypeError, ValueError):
+            # best-effort: skip if not a matrix of numbers
+            return
+        dims = V.shape[1]
+        rows = [(self._hash(model, t), model, dims, V[i].tobytes(), self.fmt) for i, t in enumerate(texts)]
+        self._check_fork()
         with self.lock:
-            self.conn.executemany(
-                "INSERT OR REPLACE INTO cache(key, model, dims, vec) VALUES (?,?,?,?)",
-                rows
-            )
+            self.pending.update((r[0], r) for r in rows)
+            self._schedule_locked()
+
+    def _touch(self, keys: List[str]):
+        self._check_fork()
+        with self.lock:
+            for k in keys:
+                self.touched[k] = self.touched.get(k, 0) + 1
+            self._schedule_locked()
+
+    def _schedule_locked(self):
+        # access stats ride along with the timer rather than stall a lookup, unless they pile up
+        if len(self.pending) >= self.commit_rows or len(self.touched) >= 8 * self.commit_rows:
+            self._flush_locked()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.commit_ms / 1000.0, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Commit buffered rows now."""
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not (self.pending or self.touched) or self._pid != os.getpid():
+            return
+        now = time.time()
+        rows = list(self.pending.values())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO cache(key, model, dims, vec, fmt) VALUES (?,?,?,?,?)",
+            rows
+        )
+        self.conn.executemany(
+            "INSERT INTO usage(key, atime) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET atime = excluded.atime",
+            [(r[0], now) for r in rows]
+        )
+        # only entries still cached: another process may have evicted them since the lookup
+        self.conn.executemany(
+            "INSERT INTO usage(key, atime, hits) SELECT key, ?, ? FROM cache WHERE key = ? "
+            "ON CONFLICT(key) DO UPDATE SET atime = excluded.atime, hits = hits + excluded.hits",
+            [(now, n, k) for k, n in self.touched.items()]
+        )
+        self.conn.commit()
+        self.pending = {}
+        self.touched = {}
+        if self._entries is not None:
+            self._entries += len(rows)
+        if self.max_mb or self.max_entries:
+            self._evict_locked(self.max_mb, self.max_entries)
+
+    def _used_bytes(self) -> int:
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        free = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free) * self.conn.execute("PRAGMA page_size").fetchone()[0]
+
+    def _count(self) -> int:
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return self._entries
+
+    def _evict_locked(self, max_mb: float = 0, max_entries: int = 0, max_age_days: float = 0,
+                      policy: str | None = None) -> int:
+        """Delete entries until under the caps (with EVICT_LOW_WATER headroom) and older than max_age_days."""
+        evicted = 0
+        if max_age_days:
+            keys = [k for (k,) in self.conn.execute(
+                "SELECT key FROM usage WHERE atime < ?", (time.time() - max_age_days * 86400,))]
+            evicted += self._delete_locked(keys)
+        # the running count only grows (replaced rows count twice); recount when it looks over
+        if max_entries and (self._entries is None or self._entries > max_entries):
+            n = self._count()
+            if n > max_entries:
+                evicted += self._delete_locked(self._coldest(n - int(max_entries * EVICT_LOW_WATER), policy))
+        # a few passes: freed space only shows once whole pages are empty
+        for _ in range(3):
+            used = self._used_bytes()
+            if not max_mb or used <= max_mb * 2**20:
+                break
+            # rows are about the same size (one model's dims x dtype), so trim in proportion
+            n = self._count()
+            drop = int(n * (1 - max_mb * 2**20 * EVICT_LOW_WATER / used)) + 1
+            evicted += self._delete_locked(self._coldest(drop, policy))
+        return evicted
+
+    def _coldest(self, n: int, policy: str | None = None) -> List[str]:
+        order = "u.atime" if (policy or self.policy) == "lru" else "u.hits, u.atime"
+        return [k for (k,) in self.conn.execute(
+            f"SELECT c.key FROM cache c LEFT JOIN usage u ON u.key = c.key ORDER BY {order} LIMIT ?", (n,))]
+
+    def _delete_locked(self, keys: List[str]) -> int:
+        if not keys:
+            return 0
+        params = [(k,) for k in keys]
+        deleted = self.conn.executemany("DELETE FROM cache WHERE key = ?", params).rowcount
+        self.conn.executemany("DELETE FROM usage WHERE key = ?", params)
+        self.conn.commit()
+        if self._entries is not None:
+            self._entries -= deleted
+        return deleted
+
+    def evict(self, max_mb: float | None = None, max_entries: int | None = None, max_age_days: float = 0,
+              policy: str | None = None) -> int:
+        """Trim to the given caps (default: the configured ones) and drop entries unused for max_age_days; returns rows deleted."""
+        with self.lock:
+            self._flush_locked()
+            return self._evict_locked(self.max_mb if max_mb is None else max_mb,
+                                      self.max_entries if max_entries is None else max_entries,
+                                      max_age_days, policy)
+
+    def purge(self, models: List[str] | None = None, keep: List[str] | None = None) -> int:
+        """Delete every entry of ``models``, or of every model not in ``keep``; returns rows deleted."""
+        if not models and not keep:
+            return 0
+        names = list(models or keep)
+        qmarks = ",".join(["?"] * len(names))
+        with self.lock:
+            self._flush_locked()
+            deleted = self.conn.execute(
+                f"DELETE FROM cache WHERE model {'IN' if models else 'NOT IN'} ({qmarks})", names).rowcount
+            self.conn.execute("DELETE FROM usage WHERE key NOT IN (SELECT key FROM cache)")
             self.conn.commit()
+            self._entries = None
+        return deleted
+
+    def compact(self):
+        """Checkpoint the WAL and VACUUM, so the file shrinks to what the entries use."""
+        with self.lock:
+            self._flush_locked()
+            self.conn.execute("DELETE FROM usage WHERE key NOT IN (SELECT key FROM cache)")
+            self.conn.commit()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> Dict:
+        """Entries and stored megabytes per model, plus file size and the configured caps."""
+        self.flush()
+        models = {m: {"entries": n, "mb": b / 2**20} for m, n, b in self.conn.execute(
+            "SELECT model, COUNT(*), SUM(LENGTH(vec)) FROM cache GROUP BY model ORDER BY model")}
+        return {
+            "path": self.path,
+            "file_mb": os.path.getsize(self.path) / 2**20,
+            "used_mb": self._used_bytes() / 2**20,
+            "entries": sum(m["entries"] for m in models.values()),
+            "models": models,
+            "max_mb": self.max_mb,
+            "max_entries": self.max_entries,
+            "policy": self.policy,
+        }
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            for conn in self._readers + [self.conn]:
+                conn.close()
+            self._readers = []
+            self._local = threading.local()
+
+    def migrate(self, batch: int = 10000) -> int:
+        """Rewrite legacy JSON rows (and rows in another dtype) in this cache's format; returns rows converted."""
+        self.flush()
+        done = 0
+        while True:
+            cur = self.conn.execute("SELECT rowid, vec, fmt FROM cache WHERE fmt != ? LIMIT ?", (self.fmt, batch))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            updates = []
+            for rowid, blob, fmt in rows:
+                try:
+                    v = np.frombuffer(blob, dtype=_DTYPES[fmt]) if fmt in _DTYPES else _decode_json(blob)
+                except Exception:
+                    updates.append((None, None, rowid))
+                    continue
+                updates.append((v.astype(_DTYPES[self.fmt]).tobytes(), self.fmt, rowid))
+            with self.lock:
+                # undecodable rows are dropped rather than looped over forever
+                self.conn.executemany("DELETE FROM cache WHERE rowid = ?", [(r,) for b, _, r in updates if b is None])
+                self.conn.executemany("UPDATE cache SET vec = ?, fmt = ? WHERE rowid = ?", [u for u in updates if u[0] is not None])
+                self.conn.commit()
+            done += len(rows)
+        with self.lock:
+            self.conn.execute("PRAGMA user_version = 1")
+            self.conn.commit()
+        return done
+
+def open_cache(path: str | None = None, dtype: str | None = None):
+    """The embedding cache at ``path`` (default EMB_CACHE_PATH).
+
+    EMB_CACHE_BACKEND=vlog, or a path ending in .vlog, selects the memory-mapped
+    vector log (src.utils.vector_log); anything else is SQLite.
+    """
+    backend = os.getenv("EMB_CACHE_BACKEND", "").lower()
+    if path is None:
+        default = "./index/emb_cache.vlog" if backend == "vlog" else "./index/emb_cache.sqlite3"
+        path = os.getenv("EMB_CACHE_PATH", default)
+    if backend == "vlog" or (not backend and path.endswith(".vlog")):
+        from src.utils.vector_log import VectorLogCache
+        return VectorLogCache(path, dtype)
+    if backend not in ("", "sqlite"):
+        raise ValueError(f"Unknown EMB_CACHE_BACKEND {backend!r}; expected sqlite or vlog")
+    return EmbeddingCache(path, dtype)
+
+if __name__ == "__main__":
+    # Offline maintenance of a cache file, e.g.
+    #   python -m src.utils.embedding_cache migrate --dtype float16
+    #   python -m src.utils.embedding_cache purge --keep intfloat/multilingual-e5-base
+    #   python -m src.utils.embedding_cache compact --max-mb 512 --max-age-days 30
+    import argparse
+    p = argparse.ArgumentParser(description="Embedding cache maintenance")
+    p.add_argument("cmd", choices=["migrate", "stats", "purge", "compact"],
+                   help="migrate: convert vectors to raw float32/float16 blobs; stats: entries per model; "
+                        "purge: drop models; compact: evict to the caps, then VACUUM")
+    p.add_argument("--path", default=os.getenv("EMB_CACHE_PATH", "./index/emb_cache.sqlite3"))
+    p.add_argument("--dtype", choices=sorted(_FORMATS))
+    p.add_argument("--model", action="append", help="purge: model to drop (repeatable)")
+    p.add_argument("--keep", action="append", help="purge: drop every model except these (repeatable)")
+    p.add_argument("--max-mb", type=float, help="compact: size cap (default EMB_CACHE_MAX_MB)")
+    p.add_argument("--max-entries", type=int, help="compact: entry cap (default EMB_CACHE_MAX_ENTRIES)")
+    p.add_argument("--max-age-days", type=float, default=0, help="compact: also drop entries unused for this long")
+    p.add_argument("--policy", choices=_POLICIES, help="compact: eviction order (default EMB_CACHE_EVICTION)")
+    args = p.parse_args()
+    if not os.path.exists(args.path):
+        p.error(f"{args.path} does not exist")
+    t0 = time.time()
+    size = os.path.getsize(args.path)
+    cache = EmbeddingCache(args.path, args.dtype)
+    if args.cmd == "stats":
+        st = cache.stats()
+        print(f"{st['path']}: {st['entries']} entries, {st['used_mb']:.1f} MB used of {st['file_mb']:.1f} MB "
+              f"(cap {st['max_mb'] or '-'} MB / {st['max_entries'] or '-'} entries, {st['policy']})")
+        for model, m in st["models"].items():
+            print(f"  {model:<48} {m['entries']:>10} {m['mb']:>10.1f} MB")
+        sys.exit(0)
+    if args.cmd == "migrate":
+        print(f"Converted {cache.migrate()} vectors")
+    elif args.cmd == "purge":
+        if not args.model and not args.keep:
+            p.error("purge needs --model or --keep")
+        print(f"Purged {cache.purge(args.model, args.keep)} entries")
+    else:
+        print(f"Evicted {cache.evict(args.max_mb, args.max_entries, args.max_age_days, args.policy)} entries")
+    # reclaim the freed space
+    cache.compact()
+    print(f"{args.path}: {size / 2**20:.1f} MB -> {os.path.getsize(args.path) / 2**20:.1f} MB in {time.time() - t0:.1f}s")
@@ -0,0 +1,390 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only safe from one process
+    fcntl = None
+
+from src.utils.embedding_cache import _FORMATS
+
+# tail entries kept apart from the sorted main index before they are merged into it
+MERGE_TAIL = 65536
+# key file format, recorded per segment in segments.json
+KEY_DIGEST = "blake2b-128"
+
+def _digest(texts: List[str]) -> np.ndarray:
+    """128-bit blake2b of each text as (n, 2) uint64: a sort key and a check word."""
+    return np.frombuffer(b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts),
+                         dtype="<u8").reshape(-1, 2)
+
+def _segment_paths(root: str, slug: str, gen: int = 0) -> Tuple[str, str]:
+    """Vector and key file of one generation of a model's segment (0: the files as first created)."""
+    base = os.path.join(root, slug if not gen else f"{slug}.{gen}")
+    return base + ".vec", base + ".keys"
+
+def _lookup(keys: np.ndarray, rows: np.ndarray, h: np.ndarray) -> np.ndarray:
+    """Row of every hash in the sorted ``keys`` (-1 where absent)."""
+    out = np.full(len(h), -1, dtype=np.int64)
+    if len(keys):
+        pos = np.minimum(np.searchsorted(keys, h), len(keys) - 1)
+        hit = keys[pos] == h
+        out[hit] = rows[pos[hit]]
+    return out
+
+class _Segment:
+    """One model's vectors: ``<slug>.vec`` (fixed-width rows) and ``<slug>.keys`` (128-bit digest of row i's text).
+
+    The first 64 bits of the digests are sorted for lookups; a hit counts
+    only if the other 64 bits match too, so a collision of the sort keys is
+    a miss, never another text's vector. Lookups read an immutable snapshot
+    (``view``), swapped in whole after every append, so they need no lock.
+    A compacted segment is a new generation, ``<slug>.<gen>.vec/.keys``.
+    """
+    def __init__(self, root: str, slug: str, meta: Dict):
+        self.gen = meta.get("gen", 0)
+        self.vec_path, self.keys_path = _segment_paths(root, slug, self.gen)
+        self.dims = meta["dims"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.row_bytes = self.dims * self.dtype.itemsize
+        self.n = 0
+        # (main keys, main rows, tail keys, tail rows, check word per row, vectors)
+        self.view = None
+        self.reload()
+
+    def reload(self):
+        """Map the files from scratch."""
+        keys = np.fromfile(self.keys_path, dtype="<u8")
+        keys = keys[:len(keys) // 2 * 2].reshape(-1, 2)
+        # a torn append: keys only ever trail the vectors they name
+        n = min(len(keys), os.path.getsize(self.vec_path) // self.row_bytes)
+        keys = keys[:n]
+        order = np.argsort(keys[:, 0], kind="stable")
+        self.n = n
+        self.view = (keys[order, 0], order.astype(np.int64), np.empty(0, "<u8"), np.empty(0, np.int64),
+                     np.ascontiguousarray(keys[:, 1]), self._map(n))
+
+    def _map(self, n: int):
+        if not n:
+            return np.empty((0, self.dims), dtype=self.dtype)
+        return np.memmap(self.vec_path, dtype=self.dtype, mode="r", shape=(n, self.dims))
+
+    def refresh(self):
+        """Pick up rows appended by other processes since the last look.
+
+        Raises FileNotFoundError once the segment was compacted into a new
+        generation or purged.
+        """
+        st = os.stat(self.keys_path)
+        if st.st_size // 16 > self.n:
+            with open(self.keys_path, "rb") as f:
+                f.seek(self.n * 16)
+                new = np.frombuffer(f.read((st.st_size // 16 - self.n) * 16), dtype="<u8").reshape(-1, 2)
+            self._extend(new, self.n)
+
+    def _extend(self, new_keys: np.ndarray, start: int):
+        """Add the (k, 2) digests of rows ``start..``."""
+        mk, mr, tk, tr, checks, _ = self.view
+        n = start + len(new_keys)
+        checks = np.concatenate([checks[:start], new_keys[:, 1]])
+        tk = np.concatenate([tk, new_keys[:, 0]])
+        tr = np.concatenate([tr, np.arange(start, n, dtype=np.int64)])
+        if len(tk) > MERGE_TAIL:
+            mk, mr = np.concatenate([mk, tk]), np.concatenate([mr, tr])
+            order = np.argsort(mk, kind="stable")
+            mk, mr, tk, tr = mk[order], mr[order], tk[:0], tr[:0]
+        else:
+            order = np.argsort(tk, kind="stable")
+            tk, tr = tk[order], tr[order]
+        self.n = n
+        self.view = (mk, mr, tk, tr, checks, self._map(n))
+
+    def entries(self) -> int:
+        """Distinct texts stored (rows minus duplicates)."""
+        mk, mr, tk, tr, checks, _ = self.view
+        digests = np.column_stack([np.concatenate([mk, tk]), checks[np.concatenate([mr, tr])]])
+        return int(len(np.unique(digests, axis=0)))
+
+    def find(self, h: np.ndarray) -> np.ndarray:
+        """Row of each (n, 2) digest, -1 where absent."""
+        mk, mr, tk, tr, checks, _ = self.view
+        rows = _lookup(mk, mr, h[:, 0])
+        miss = rows < 0
+        if miss.any() and len(tk):
+            rows[miss] = _lookup(tk, tr, h[miss, 0])
+        hit = rows >= 0
+        rows[hit] = np.where(checks[rows[hit]] == h[hit, 1], rows[hit], -1)
+        return rows
+
+class VectorLogCache:
+    """Append-only, memory-mapped embedding cache (EMB_CACHE_BACKEND=vlog).
+
+    Every model gets a fixed-width vector file, float32 or float16
+    (EMB_CACHE_DTYPE), and a parallel file of 128-bit text digests. On open,
+    their first halves become a sorted array, with the row numbers and the
+    second halves that confirm a hit 24 bytes per entry.
+    A batch of hits is then a vectorized searchsorted plus one fancy-indexed
+    gather from the np.memmap of the vectors, sorted by row. SQLite instead
+    fetches and decodes one row at a time.
+
+    Appends from several processes are serialized with an flock; readers
+    notice new rows through the size of the key file. Nothing is ever
+    overwritten or evicted in place. ``compact`` writes a new generation of
+    the files without duplicates and purged models, switches segments.json
+    to it in one rename and only then deletes the old files, so a reader
+    maps either the old pair or the new one, never a mix; once the old key
+    file is gone it reopens the segment from segments.json.
+    """
+    def __init__(self, path: str = "./index/emb_cache.vlog", dtype: str | None = None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        dtype = (dtype or os.getenv("EMB_CACHE_DTYPE", "float32")).lower()
+        if dtype not in _FORMATS:
+            raise ValueError(f"Unknown EMB_CACHE_DTYPE {dtype!r}; expected one of {sorted(_FORMATS)}")
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self.segments: Dict[str, _Segment] = {}
+        self.meta_path = os.path.join(path, "segments.json")
+        if float(os.getenv("EMB_CACHE_MAX_MB", "0")) or int(os.getenv("EMB_CACHE_MAX_ENTRIES", "0")):
+            print("[WARN] EMB_CACHE_MAX_MB/EMB_CACHE_MAX_ENTRIES apply to the sqlite backend; "
+                  "shrink a vector log with `python -m src.utils.vector_log compact`")
+
+    @staticmethod
+    def _slug(model: str) -> str:
+        return hashlib.blake2b(model.encode("utf-8"), digest_size=8).hexdigest()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.path, ".lock"), "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _meta(self) -> Dict:
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.meta_path)
+
+    def _segment(self, model: str, dims: int | None = None) -> Optional[_Segment]:
+        """The model's segment; created (for ``dims``) under the file lock if it does not exist yet."""
+        seg = self.segments.get(model)
+        if seg is not None:
+            return seg
+        slug = self._slug(model)
+        meta = self._meta().get(slug)
+        if meta is not None and meta.get("keys") != KEY_DIGEST:
+            with self._file_lock():
+                all_meta = self._meta()
+                if all_meta.get(slug, {}).get("keys") != KEY_DIGEST:
+                    # 64-bit keys of earlier versions cannot be verified: start the model over
+                    print(f"[WARN] {model}: vector log segment has old 64-bit keys; discarding its {self.path} entries")
+                    all_meta.pop(slug, None)
+                    self._write_meta(all_meta)
+                    for p in _segment_paths(self.path, slug, meta.get("gen", 0)):
+                        if os.path.exists(p):
+                            os.remove(p)
+                meta = all_meta.get(slug)
+        if meta is None:
+            if dims is None:
+                return None
+            with self._file_lock():
+                all_meta = self._meta()
+                meta = all_meta.get(slug)
+                if meta is None:
+                    meta = all_meta[slug] = {"model": model, "dims": int(dims), "dtype": self.dtype, "keys": KEY_DIGEST}
+                    for p in _segment_paths(self.path, slug):
+                        open(p, "ab").close()
+                    self._write_meta(all_meta)
+        with self.lock:
+            seg = self.segments.get(model)
+            if seg is None:
+                try:
+                    seg = self.segments[model] = _Segment(self.path, slug, meta)
+                except FileNotFoundError:
+                    if self._meta().get(slug) == meta:
+                        raise
+        # compacted or purged between reading segments.json and opening the files: read it again
+        return seg or self._segment(model, dims)
+
+    def _refresh(self, model: str, seg: _Segment) -> Optional[_Segment]:
+        """``seg`` with other processes' appends; its current generation after a compaction, None once it was purged."""
+        with self.lock:
+            try:
+                seg.refresh()
+                return seg
+            except FileNotFoundError:
+                self.segments.pop(model, None)
+        return self._segment(model)
+
+    def get_array(self, model: str, texts: List[str]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Cached vectors as one float32 matrix (rows of misses left unset) and a hit mask."""
+        found = np.zeros(len(texts), dtype=bool)
+        seg = self._segment(model)
+        if not texts or seg is None:
+            return None, found
+        # one stat of the key file: new rows, a compaction (new inode) or a purge by another process
+        seg = self._refresh(model, seg)
+        if seg is None:
+            return None, found
+        rows = seg.find(_digest(texts))
+        found = rows >= 0
+        if not found.any():
+            return None, found
+        X = seg.view[5]
+        out = np.empty((len(texts), seg.dims), dtype=np.float32)
+        idx = np.flatnonzero(found)
+        # gather in file order, so the page cache is read front to back
+        order = np.argsort(rows[idx], kind="stable")
+        out[idx[order]] = X[rows[idx[order]]]
+        return out, found
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        out, found = self.get_array(model, texts)
+        return [out[i] if found[i] else None for i in range(len(texts))]
+
+    def put_many(self, model: str, texts: List[str], vectors):
+        if not texts:
+            return
+        try:
+            V = np.asarray(vectors, dtype=np.float32)
+        except (TypeError, ValueError):
+            # best-effort: skip if not a matrix of numbers
+            return
+        h = _digest(texts)
+        while True:
+            seg = self._segment(model, V.shape[1])
+            if V.shape[1] != seg.dims:
+                print(f"[WARN] {model}: {V.shape[1]}-dim vectors do not fit its {seg.dims}-dim vector log; not cached")
+                return
+            with self.lock, self._file_lock():
+                try:
+                    seg.refresh()
+                except FileNotFoundError:
+                    # compacted or purged since we opened it: append to what segments.json names now
+                    self.segments.pop(model, None)
+                    continue
+                self._append(seg, V, h)
+                return
+
+    def _append(self, seg: _Segment, V: np.ndarray, h: np.ndarray):
+        """Write the rows of texts ``seg`` does not hold yet; under both locks."""
+        # first occurrence of each text not cached yet
+        _, first = np.unique(h, axis=0, return_index=True)
+        first = np.sort(first)
+        new = first[seg.find(h[first]) < 0]
+        if not len(new):
+            return
+        start = seg.n
+        with open(seg.vec_path, "r+b") as f:
+            # past a torn append, if any
+            f.seek(start * seg.row_bytes)
+            f.write(np.ascontiguousarray(V[new].astype(seg.dtype)).tobytes())
+            f.truncate()
+        with open(seg.keys_path, "r+b") as f:
+            # vectors first, then the keys that make them visible
+            f.seek(start * 16)
+            f.write(np.ascontiguousarray(h[new]).tobytes())
+            f.truncate()
+        seg._extend(h[new], start)
+
+    def flush(self):
+        """Appends are written straight through; nothing to do."""
+
+    def close(self):
+        with self.lock:
+            self.segments = {}
+
+    def stats(self) -> Dict:
+        """Live entries, stored rows and megabytes per model."""
+        models = {}
+        for slug, meta in self._meta().items():
+            seg = self._refresh(meta["model"], self._segment(meta["model"]))
+            if seg is None:
+                continue
+            models[meta["model"]] = {"entries": seg.entries(),
+                                     "rows": seg.n, "dims": seg.dims, "dtype": meta["dtype"],
+                                     "mb": (os.path.getsize(seg.vec_path) + os.path.getsize(seg.keys_path)) / 2**20}
+        return {"path": self.path, "entries": sum(m["entries"] for m in models.values()),
+                "file_mb": sum(m["mb"] for m in models.values()), "models": models}
+
+    def compact(self, models: List[str] | None = None, keep: List[str] | None = None) -> int:
+        """Rewrite every segment without duplicate rows, dropping ``models`` (or all but ``keep``); returns rows dropped."""
+        dropped = 0
+        with self.lock, self._file_lock():
+            all_meta = self._meta()
+            for slug, meta in list(all_meta.items()):
+                old_keys = meta.get("keys") != KEY_DIGEST
+                # opened afresh: this process may still hold an older generation
+                self.segments.pop(meta["model"], None)
+                seg = _Segment(self.path, slug, meta)
+                # segments with unverifiable 64-bit keys are dropped too
+                if old_keys or (models and meta["model"] in models) or (keep and meta["model"] not in keep):
+                    dropped += seg.n
+                    del all_meta[slug]
+                    self._write_meta(all_meta)
+                    for p in (seg.keys_path, seg.vec_path):
+                        os.remove(p)
+                    continue
+                keys = np.fromfile(seg.keys_path, dtype="<u8", count=2 * seg.n).reshape(-1, 2)
+                _, first = np.unique(keys, axis=0, return_index=True)
+                first = np.sort(first)
+                if len(first) == seg.n:
+                    continue
+                X = seg.view[5]
+                gen = seg.gen + 1
+                vec_path, keys_path = _segment_paths(self.path, slug, gen)
+                with open(vec_path, "wb") as f:
+                    for i in range(0, len(first), MERGE_TAIL):
+                        f.write(np.ascontiguousarray(X[first[i:i + MERGE_TAIL]]).tobytes())
+                keys[first].tofile(keys_path)
+                # one rename publishes both new files; readers holding the old maps keep them,
+                # and find the old key file gone on their next look
+                all_meta[slug] = {**meta, "gen": gen}
+                self._write_meta(all_meta)
+                os.remove(seg.keys_path)
+                os.remove(seg.vec_path)
+                dropped += seg.n - len(first)
+            # leftovers of a compaction interrupted before or after its rename
+            live = {os.path.basename(p) for slug, meta in all_meta.items()
+                    for p in _segment_paths(self.path, slug, meta.get("gen", 0))}
+            for name in os.listdir(self.path):
+                if name.endswith((".vec", ".keys")) and name not in live:
+                    os.remove(os.path.join(self.path, name))
+        return dropped
+
+if __name__ == "__main__":
+    # Offline maintenance of a vector log, e.g.
+    #   python -m src.utils.vector_log compact --keep intfloat/multilingual-e5-base
+    import argparse
+    p = argparse.ArgumentParser(description="Vector log embedding cache maintenance")
+    p.add_argument("cmd", choices=["stats", "compact"],
+                   help="stats: entries per model; compact: drop duplicate rows and purged models")
+    p.add_argument("--path", default=os.getenv("EMB_CACHE_PATH", "./index/emb_cache.vlog"))
+    p.add_argument("--model", action="append", help="compact: model to drop (repeatable)")
+    p.add_argument("--keep", action="append", help="compact: drop every model except these (repeatable)")
+    args = p.parse_args()
+    if not os.path.isdir(args.path):
+        p.error(f"{args.path} does not exist")
+    cache = VectorLogCache(args.path)
+    if args.cmd == "compact":
+        print(f"Dropped {cache.compact(args.model, args.keep)} rows")
+    st = cache.stats()
+    print(f"{st['path']}: {st['entries']} entries, {st['file_mb']:.1f} MB")
+    for model, m in st["models"].items():
+        print(f"  {model:<48} {m['entries']:>10} of {m['rows']:>10} rows {m['mb']:>10.1f} MB ({m['dims']} x {m['dtype']})")
@@ -0,0 +1,54 @@
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Ensure project root on path
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+def zipf_texts(n_docs: int, vocab: int = 400, seed: int = 0):
+    """Chunk texts over a Zipf vocabulary ("w0" most frequent), a few with repeated and rare terms."""
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab + 1)
+    p /= p.sum()
+    lens = rng.integers(1, 40, n_docs)
+    return [" ".join(f"w{t}" for t in rng.choice(vocab, n, p=p)) for n in lens]
+
+def make_queries(n: int, vocab: int = 400, seed: int = 1):
+    """Token lists mixing frequent, mid-frequency and unknown terms, some repeated."""
+    rng = np.random.default_rng(seed)
+    qs = []
+    for _ in range(n):
+        q = [f"w{t}" for t in rng.integers(0, 20, rng.integers(0, 3))]
+        q += [f"w{t}" for t in rng.integers(20, vocab, rng.integers(1, 3))]
+        if rng.random() < 0.2:
+            q.append(q[0])
+        if rng.random() < 0.1:
+            q.append("unknownterm")
+        qs.append(q)
+    return qs
+
+DIM = 32
+
+class HashEmbedder:
+    """Deterministic stand-in for the E5 model: one unit vector per text, seeded by its crc32."""
+    def _embed(self, texts):
+        X = np.stack([np.random.default_rng(zlib.crc32(t.encode())).standard_normal(DIM) for t in texts]).astype("float32")
+        return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+    def embed_queries(self, queries):
+        return self._embed(queries)
+
+    def embed_passages(self, passages):
+        return self._embed(passages)
+
+@pytest.fixture
+def texts():
+    return zipf_texts(600)
+
+@pytest.fixture
+def queries():
+    return make_queries(40)
@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.search.batcher import QueryBatcher
+from tests.conftest import HashEmbedder
+
+X = HashEmbedder().embed_passages([f"doc {i}" for i in range(50)])
+
+class Recorder:
+    """embed_fn / search_fn pair over X that records every call; the first embed waits for ``gate``."""
+    def __init__(self):
+        self.entered, self.gate = threading.Event(), threading.Event()
+        self.embeds, self.searches = [], []
+
+    def embed(self, queries):
+        if not self.embeds:
+            self.entered.set()
+            self.gate.wait(10)
+        self.embeds.append(list(queries))
+        return HashEmbedder().embed_queries(queries)
+
+    def search(self, Q, k, nprobe, ef_search):
+        self.searches.append((len(Q), k, nprobe))
+        S = Q @ X.T
+        I = np.argsort(-S, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(S, I, axis=1), I
+
+def wait_for_queue(batcher, n):
+    deadline = time.monotonic() + 10
+    while batcher.queue.qsize() < n and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def submit_all(batcher, rec, calls):
+    """Submit ``calls`` (args tuples) from threads while the worker is held embedding the first one."""
+    with ThreadPoolExecutor(len(calls)) as pool:
+        futs = [pool.submit(batcher.submit, *calls[0])]
+        assert rec.entered.wait(10)
+        futs += [pool.submit(batcher.submit, *c) for c in calls[1:]]
+        wait_for_queue(batcher, len(calls) - 1)
+        rec.gate.set()
+        return [f.result(timeout=10) for f in futs]
+
+def test_concurrent_queries_share_one_embed_and_one_search_per_params():
+    rec = Recorder()
+    batcher = QueryBatcher(rec.embed, rec.search, max_batch=16, max_wait_ms=50)
+    calls = [("q0", 5)] + [(f"q{i}", 5) for i in range(1, 6)] + [("q6", 3, 8), ("q7", 3, 8), ("q8", 0)]
+    results = submit_all(batcher, rec, calls)
+    # the first query alone, then everything that queued behind it in one batch
+    assert [len(e) for e in rec.embeds] == [1, 8]
+    assert sorted(rec.searches[1:]) == [(2, 3, 8), (5, 5, None)]
+    for (q, k, *rest), (emb, D, I) in zip(calls, results):
+        ref = HashEmbedder().embed_queries([q])
+        assert np.allclose(emb, ref[0])
+        if not k:
+            assert D is None and I is None
+            continue
+        D_ref, I_ref = rec.search(ref, k, None, None)
+        assert np.array_equal(I, I_ref[0]) and np.allclose(D, D_ref[0])
+    st = batcher.stats()
+    assert (st["batches"], st["queries"], st["largest_batch"]) == (2, 9, 8)
+    batcher.close()
+
+def test_max_batch_splits_the_queue():
+    rec = Recorder()
+    batcher = QueryBatcher(rec.embed, rec.search, max_batch=3, max_wait_ms=50)
+    submit_all(batcher, rec, [(f"q{i}", 2) for i in range(8)])
+    assert [len(e) for e in rec.embeds] == [1, 3, 3, 1]
+    batcher.close()
+
+def test_errors_reach_every_query_in_the_batch():
+    rec = Recorder()
+    def search(Q, k, nprobe, ef_search):
+        raise RuntimeError("index gone")
+    batcher = QueryBatcher(rec.embed, search, max_wait_ms=50)
+    rec.gate.set()
+    with ThreadPoolExecutor(4) as pool:
+        futs = [pool.submit(batcher.submit, f"q{i}", 2) for i in range(4)]
+        for f in futs:
+            with pytest.raises(RuntimeError, match="index gone"):
+                f.result(timeout=10)
+    # the worker survives a failed batch
+    assert batcher.submit("q", 0)[1] is None
+    batcher.close()
+
+def test_close_answers_queued_queries_then_stops():
+    rec = Recorder()
+    batcher = QueryBatcher(rec.embed, rec.search, max_batch=4, max_wait_ms=50)
+    with ThreadPoolExecutor(6) as pool:
+        first = pool.submit(batcher.submit, "q0", 2)
+        assert rec.entered.wait(10)
+        rest = [pool.submit(batcher.submit, f"q{i}", 2) for i in range(1, 6)]
+        wait_for_queue(batcher, 5)
+        # the sentinel queues behind q1-q5 and ends the last batch's collection window
+        batcher.close()
+        rec.gate.set()
+        assert all(f.result(timeout=10)[2] is not None for f in [first] + rest)
+    batcher.worker.join(10)
+    assert not batcher.worker.is_alive()
+    assert batcher.stats()["queries"] == 6
@@ -0,0 +1,85 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from src.search.bm25 import BM25Okapi, tokenize
+
+def reference_scores(docs, q, k1=1.5, b=0.75):
+    """Textbook Okapi BM25 over token lists, one document at a time."""
+    n = len(docs)
+    avgdl = sum(len(d) for d in docs) / n
+    df = Counter(t for d in docs for t in set(d))
+    scores = np.zeros(n)
+    for i, d in enumerate(docs):
+        tf = Counter(d)
+        for term in q:
+            if tf[term]:
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                scores[i] += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * len(d) / avgdl))
+    return scores
+
+def test_tokenize():
+    assert tokenize("Hello, WORLD! a 42 x_y") == ["hello", "world", "42", "x_y"]
+
+def test_get_scores_matches_reference(texts, queries):
+    docs = [tokenize(t) for t in texts]
+    bm25 = BM25Okapi(docs)
+    assert bm25.N == len(docs)
+    for q in queries:
+        assert np.allclose(bm25.get_scores(q), reference_scores(docs, q), rtol=1e-12, atol=0)
+
+def test_score_matches_get_scores(texts, queries):
+    bm25 = BM25Okapi(tokenize(t) for t in texts)
+    for q in queries[:10]:
+        full = bm25.get_scores(q)
+        for idx in (0, 17, len(texts) - 1):
+            assert bm25.score(q, idx) == pytest.approx(full[idx], rel=1e-12)
+
+def test_empty_corpus_and_unknown_terms():
+    assert BM25Okapi([]).get_scores(["w1"]).shape == (0,)
+    bm25 = BM25Okapi([["w1", "w2"], [], ["w2"]])
+    assert not bm25.get_scores(["unknownterm"]).any()
+    assert bm25.get_scores(["w2"])[1] == 0.0
+
+def exhaustive(bm25: BM25Okapi, q, k):
+    """Reference top-k: score every document, full sort by score then doc id."""
+    scores = bm25.get_scores(q)
+    order = np.lexsort((np.arange(len(scores)), -scores))[:k]
+    return order, scores[order]
+
+@pytest.mark.parametrize("k", [1, 8, 64, 10_000])
+def test_top_k_matches_exhaustive(texts, queries, k):
+    bm25 = BM25Okapi(tokenize(t) for t in texts)
+    for q in queries:
+        idxs, scores = bm25.top_k(q, k)
+        ref_idxs, ref_scores = exhaustive(bm25, q, k)
+        assert np.array_equal(idxs, ref_idxs)
+        assert np.allclose(scores, ref_scores, rtol=1e-12, atol=0)
+
+def test_top_k_pads_with_zero_score_docs():
+    bm25 = BM25Okapi([["w1"], ["w2"], ["w3"], ["w1", "w2"]])
+    idxs, scores = bm25.top_k(["w3"], 3)
+    assert idxs.tolist() == [2, 0, 1]
+    assert scores[0] > 0 and not scores[1:].any()
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_roundtrip(tmp_path, texts, queries, mmap):
+    bm25 = BM25Okapi(tokenize(t) for t in texts)
+    path = str(tmp_path / "bm25")
+    bm25.save(path)
+    assert BM25Okapi.exists(path)
+    loaded = BM25Okapi.load(path, mmap=mmap)
+    assert loaded.N == bm25.N and loaded.vocab == bm25.vocab
+    for q in queries:
+        a, b = bm25.top_k(q, 10), loaded.top_k(q, 10)
+        assert np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1])
+        assert np.array_equal(bm25.overlap_counts(q, a[0]), loaded.overlap_counts(q, a[0]))
+
+def test_load_rejects_other_formats(tmp_path):
+    path = str(tmp_path / "bm25")
+    BM25Okapi([["w1"]]).save(path)
+    (tmp_path / "bm25" / "meta.json").write_text('{"format": 1}')
+    with pytest.raises(ValueError):
+        BM25Okapi.load(path)
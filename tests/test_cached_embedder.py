@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from src.utils.cached_embedder import CachedEmbedder, LRUCache
+from tests.conftest import HashEmbedder
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self):
+        self.calls = []
+
+    def embed_queries(self, queries):
+        self.calls.append(("query", list(queries)))
+        return self._embed(["query: " + q for q in queries])
+
+    def embed_passages(self, passages):
+        self.calls.append(("passage", list(passages)))
+        return self._embed(["passage: " + p for p in passages])
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None and lru.get("a") == 1 and lru.get("c") == 3
+    st = lru.stats()
+    assert (st["size"], st["hits"], st["misses"], st["evictions"]) == (2, 3, 1, 1)
+
+def test_lru_expires_after_ttl(monkeypatch):
+    import src.utils.cached_embedder as ce
+    now = [100.0]
+    monkeypatch.setattr(ce.time, "monotonic", lambda: now[0])
+    lru = LRUCache(maxsize=4, ttl=10)
+    lru.put("a", 1)
+    now[0] += 9
+    assert lru.get("a") == 1
+    now[0] += 2
+    assert lru.get("a") is None and lru.stats()["expirations"] == 1
+    assert LRUCache(maxsize=0).put("a", 1) is None and LRUCache(maxsize=0).get("a") is None
+
+@pytest.fixture
+def embedder(tmp_path, monkeypatch):
+    monkeypatch.delenv("EMB_CACHE_BACKEND", raising=False)
+    monkeypatch.delenv("EMBED_BACKEND", raising=False)
+    return CachedEmbedder("test-model", str(tmp_path / "emb_cache.sqlite3"), inner=CountingEmbedder())
+
+def test_repeated_queries_skip_model_and_disk(embedder):
+    first = embedder.embed_queries(["alpha", "beta", "alpha"])
+    assert embedder.inner.calls == [("query", ["alpha", "beta", "alpha"])]
+    assert np.allclose(first[0], first[2])
+    lookups = []
+    get_array = embedder.cache.get_array
+    embedder.cache.get_array = lambda model, texts: lookups.append(texts) or get_array(model, texts)
+    again = embedder.embed_queries(["beta", "alpha"])
+    assert np.array_equal(again, first[[1, 0]]) and not lookups and len(embedder.inner.calls) == 1
+
+def test_disk_cache_keeps_plain_query_keys(embedder):
+    # a query vector cached by an earlier version under its plain text is still a hit
+    V = np.eye(32, dtype="float32")[:1]
+    embedder.cache.put_many("test-model", ["gamma"], V)
+    assert np.array_equal(embedder.embed_queries(["gamma"]), V)
+    assert not embedder.inner.calls
+    embedder.embed_queries(["delta"])
+    _, found = embedder.cache.get_array("test-model", ["delta", "query: delta"])
+    assert found.tolist() == [True, False]
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from src.search import diversity
+
+def candidates(n=40, d=16, seed=0, dups=5):
+    """Normalized candidate rows (the first ``dups`` duplicated right behind themselves) and a query."""
+    rng = np.random.default_rng(seed)
+    E = rng.standard_normal((n, d)).astype("float32")
+    E[dups:2 * dups] = E[:dups]
+    E /= np.linalg.norm(E, axis=1, keepdims=True)
+    q = E[:8].mean(axis=0)
+    return q / np.linalg.norm(q), E
+
+def reference_mmr(q, E, k, lam):
+    out = []
+    while len(out) < min(k, len(E)):
+        best, best_score = None, -np.inf
+        for c in range(len(E)):
+            if c in out:
+                continue
+            penalty = max((float(E[c] @ E[s]) for s in out), default=0.0)
+            score = lam * float(E[c] @ q) - (1 - lam) * penalty
+            if score > best_score:
+                best, best_score = c, score
+        out.append(best)
+    return out
+
+def reference_dpp(q, E, k, lam):
+    """Greedy MAP by explicit log-determinants (candidates in general position)."""
+    a = lam / (2 * (1 - lam))
+    r = np.exp(a * (E @ q)).astype(np.float64)
+    L = r[:, None] * (E.astype(np.float64) @ E.T.astype(np.float64)) * r[None, :]
+    out = []
+    while len(out) < k:
+        logdet = {c: np.linalg.slogdet(L[np.ix_(out + [c], out + [c])])[1] for c in range(len(E)) if c not in out}
+        out.append(max(logdet, key=logdet.get))
+    return out
+
+def reference_facility(q, E, k, lam):
+    rel = E @ q
+    S = E @ E.T
+    w = np.maximum(rel, 0)
+    w = w / w.sum()
+    cover = np.zeros(len(E))
+    out = []
+    while len(out) < k:
+        gain = np.array([w @ np.maximum(S[:, c], cover) - w @ cover for c in range(len(E))])
+        rest = [c for c in range(len(E)) if c not in out]
+        gain /= max(gain[rest].max(), 1e-9)
+        j = max(rest, key=lambda c: lam * rel[c] + (1 - lam) * gain[c])
+        out.append(j)
+        cover = np.maximum(cover, S[:, j])
+    return out
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), (False, None), ("false", None), ("", None), ("off", None),
+    (True, "mmr"), ("true", "mmr"), ("1", "mmr"), ("MMR", "mmr"), (" dpp ", "dpp"), ("facility", "facility"),
+])
+def test_strategy_normalizes_flags_and_names(value, expected):
+    assert diversity.strategy(value) == expected
+
+def test_strategy_rejects_unknown_names():
+    with pytest.raises(ValueError, match="Unknown diversity strategy"):
+        diversity.strategy("random")
+
+@pytest.mark.parametrize("lam", [0.3, 0.6, 0.9])
+def test_mmr_matches_reference(lam):
+    q, E = candidates()
+    assert diversity.select("mmr", q, E, 10, lam) == reference_mmr(q, E, 10, lam)
+    # lambda 1: plain relevance order
+    assert diversity.select("mmr", q, E, 10, 1.0) == np.argsort(-(E @ q), kind="stable")[:10].tolist()
+
+@pytest.mark.parametrize("lam", [0.3, 0.6, 0.9])
+def test_dpp_matches_log_det_reference(lam):
+    q, E = candidates(n=30, dups=0)
+    assert diversity.select("dpp", q, E, 8, lam) == reference_dpp(q, E, 8, lam)
+
+def test_dpp_skips_duplicates_then_fills_by_relevance():
+    q, E = candidates(n=12, d=4, dups=0)
+    E = np.vstack([E[:3], E[:3]])
+    picks = diversity.select("dpp", q, E, 5, 0.6)
+    # three distinct rows span all the volume there is; the rest come by relevance, duplicates included
+    assert len(set(map(tuple, E[picks[:3]]))) == 3
+    rel_order = [j for j in np.argsort(-(E @ q), kind="stable") if j not in picks[:3]]
+    assert picks[3:] == rel_order[:2]
+
+@pytest.mark.parametrize("lam", [0.3, 0.6, 0.9])
+def test_facility_matches_reference(lam):
+    q, E = candidates()
+    assert diversity.select("facility", q, E, 10, lam) == reference_facility(q, E, 10, lam)
+
+@pytest.mark.parametrize("name", diversity.STRATEGIES)
+def test_diversifiers_avoid_exact_duplicates(name):
+    q, E = candidates()
+    picks = diversity.select(name, q, E, 10, 0.5)
+    assert len(picks) == 10 == len(set(picks))
+    assert len({tuple(E[j]) for j in picks}) == 10
+
+@pytest.mark.parametrize("name", diversity.STRATEGIES)
+@pytest.mark.parametrize("max_per_doc", [1, 2])
+def test_max_per_doc_caps_every_strategy(name, max_per_doc):
+    q, E = candidates()
+    groups = [f"d{i % 4}.txt" for i in range(len(E))]
+    picks = diversity.select(name, q, E, 10, 0.6, groups, max_per_doc)
+    counts = np.bincount([i % 4 for i in picks], minlength=4)
+    # four documents: the cap, not top_k, limits the picks
+    assert len(picks) == 4 * max_per_doc and (counts == max_per_doc).all()
+    assert diversity.select(name, q, E, 10, 0.6, groups, 0) == diversity.select(name, q, E, 10, 0.6)
+
+def test_capped_keeps_rank_order_within_the_cap():
+    order = [5, 1, 4, 0, 2, 3]
+    groups = ["a", "a", "b", "a", "b", "c"]
+    # positions 5, 1, 4 are the first of groups c, a, b
+    assert diversity.capped(order, groups, 4, 1) == [5, 1, 4]
+    assert diversity.capped(order, groups, 4, 2) == [5, 1, 4, 0]
+    assert diversity.capped(order, None, 4, 1) == order[:4]
+    assert diversity.capped(order, groups, 3, 0) == order[:3]
@@ -0,0 +1,212 @@
+import json
+import os
+import sqlite3
+import zlib
+
+import numpy as np
+import pytest
+
+from src.utils.embedding_cache import FMT_F16, FMT_F32, FMT_JSON, EmbeddingCache
+
+MODEL = "test-model"
+
+def vectors(n, d=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "emb_cache.sqlite3")
+
+def stored_formats(path):
+    with sqlite3.connect(path) as conn:
+        return {fmt for (fmt,) in conn.execute("SELECT fmt FROM cache")}
+
+@pytest.mark.parametrize("dtype, fmt, atol", [("float32", FMT_F32, 0), ("float16", FMT_F16, 1e-2)])
+def test_blob_round_trip(cache_path, dtype, fmt, atol):
+    texts = [f"text {i}" for i in range(7)]
+    V = vectors(len(texts))
+    cache = EmbeddingCache(cache_path, dtype)
+    cache.put_many(MODEL, texts, V)
+    cache.close()
+    cache = EmbeddingCache(cache_path, dtype)
+    out, found = cache.get_array(MODEL, texts + ["missing"])
+    assert found.tolist() == [True] * 7 + [False]
+    assert out.dtype == np.float32 and np.allclose(out[:7], V, atol=atol, rtol=0)
+    assert stored_formats(cache_path) == {fmt}
+    assert cache.get_many(MODEL, ["missing"]) == [None]
+    assert cache.get_array("other-model", texts)[0] is None
+
+def test_reads_legacy_json_rows_and_migrates_them(cache_path, capsys):
+    texts = ["a", "b", "c"]
+    V = vectors(3)
+    cache = EmbeddingCache(cache_path)
+    cache.close()
+    # rows as the zlib-compressed JSON format wrote them, plus one that no longer decodes
+    with sqlite3.connect(cache_path) as conn:
+        conn.executemany("INSERT INTO cache(key, model, dims, vec, fmt) VALUES (?,?,?,?,?)",
+                         [(EmbeddingCache._hash(MODEL, t), MODEL, 16, zlib.compress(json.dumps(v.tolist()).encode()),
+                           FMT_JSON) for t, v in zip(texts, V)])
+        conn.execute("INSERT INTO cache(key, model, dims, vec, fmt) VALUES (?,?,?,?,?)",
+                     (EmbeddingCache._hash(MODEL, "broken"), MODEL, 16, b"not zlib", FMT_JSON))
+        conn.execute("PRAGMA user_version = 0")
+    cache = EmbeddingCache(cache_path, "float16")
+    assert "migrate" in capsys.readouterr().out
+    out, found = cache.get_array(MODEL, texts + ["broken"])
+    assert found.tolist() == [True, True, True, False] and np.allclose(out[:3], V, atol=1e-6)
+    assert cache.migrate() == 4
+    assert stored_formats(cache_path) == {FMT_F16}
+    out, found = cache.get_array(MODEL, texts + ["broken"])
+    assert found.tolist() == [True, True, True, False] and np.allclose(out[:3], V, atol=1e-2)
+    cache.close()
+    EmbeddingCache(cache_path).close()
+    assert "migrate" not in capsys.readouterr().out
+
+def test_unknown_dtype_is_rejected(cache_path):
+    with pytest.raises(ValueError, match="EMB_CACHE_DTYPE"):
+        EmbeddingCache(cache_path, "int8")
+
+def test_lookups_span_several_chunks_and_see_pending_rows(cache_path, monkeypatch):
+    import src.utils.embedding_cache as ec
+    monkeypatch.setattr(ec, "LOOKUP_CHUNK", 7)
+    monkeypatch.setenv("EMB_CACHE_COMMIT_MS", "60000")
+    texts = [f"t{i}" for i in range(50)]
+    V = vectors(50)
+    cache = EmbeddingCache(cache_path)
+    cache.put_many(MODEL, texts[:30], V[:30])
+    cache.flush()
+    cache.put_many(MODEL, texts[30:], V[30:])
+    # the second batch is still buffered: visible here, not to another connection
+    other = EmbeddingCache(cache_path)
+    assert other.get_array(MODEL, texts)[1].sum() == 30
+    out, found = cache.get_array(MODEL, texts[::-1] + texts[:3])
+    assert found.all() and np.array_equal(out[:50], V[::-1])
+    cache.flush()
+    assert other.get_array(MODEL, texts)[1].all()
+    with sqlite3.connect(cache_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_concurrent_readers_and_writers(cache_path, monkeypatch):
+    import threading
+    monkeypatch.setenv("EMB_CACHE_COMMIT_ROWS", "16")
+    cache = EmbeddingCache(cache_path)
+    V = vectors(400)
+    errors = []
+    def work(t):
+        try:
+            for start in range(t * 100, (t + 1) * 100, 10):
+                texts = [f"t{i}" for i in range(start, start + 10)]
+                cache.put_many(MODEL, texts, V[start:start + 10])
+                out, found = cache.get_array(MODEL, texts)
+                assert found.all() and np.array_equal(out, V[start:start + 10])
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+    cache.close()
+    out, found = EmbeddingCache(cache_path).get_array(MODEL, [f"t{i}" for i in range(400)])
+    assert found.all() and np.array_equal(out, V)
+
+def _use_cache_in_child(cache, q):
+    V = vectors(2, seed=1)
+    cache.put_many(MODEL, ["child a", "child b"], V)
+    cache.flush()
+    q.put(bool(cache.get_array(MODEL, ["parent", "child a", "child b"])[1].all()))
+
+def test_forked_child_gets_a_fresh_lock(cache_path):
+    import multiprocessing
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("no fork on this platform")
+    cache = EmbeddingCache(cache_path)
+    cache.put_many(MODEL, ["parent"], vectors(1))
+    cache.flush()
+    cache.get_array(MODEL, ["parent"])
+    ctx = multiprocessing.get_context("fork")
+    q = ctx.Queue()
+    # fork while another thread holds the lock: the child must not wait for it
+    with cache.lock:
+        child = ctx.Process(target=_use_cache_in_child, args=(cache, q), daemon=True)
+        child.start()
+    child.join(10)
+    if child.is_alive():
+        child.kill()
+    assert child.exitcode == 0 and q.get(timeout=1)
+    assert cache.get_array(MODEL, ["child a", "child b"])[1].all()
+
+def filled_cache(path, n=100, monkeypatch=None, **env):
+    for k, v in env.items():
+        monkeypatch.setenv(k, str(v))
+    cache = EmbeddingCache(path)
+    texts = [f"t{i}" for i in range(n)]
+    cache.put_many(MODEL, texts, vectors(n))
+    cache.flush()
+    return cache, texts
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_entry_cap_evicts_coldest_to_low_water(cache_path, monkeypatch, policy):
+    import src.utils.embedding_cache as ec
+    now = [1000.0]
+    monkeypatch.setattr(ec.time, "time", lambda: now[0])
+    # old: cached, then hit three times; new: cached later, never hit
+    cache, old = filled_cache(cache_path, 10, monkeypatch, EMB_CACHE_MAX_ENTRIES=20, EMB_CACHE_EVICTION=policy)
+    for _ in range(3):
+        cache.get_array(MODEL, old)
+        cache.flush()
+    now[0] += 100
+    new = [f"new {i}" for i in range(10)]
+    cache.put_many(MODEL, new, vectors(10))
+    cache.flush()
+    now[0] += 100
+    cache.put_many(MODEL, ["one more"], vectors(1))
+    cache.flush()
+    # 21 entries over a cap of 20: trimmed to 18
+    assert cache.stats()["entries"] == 18
+    kept_old, kept_new = cache.get_array(MODEL, old)[1].sum(), cache.get_array(MODEL, new)[1].sum()
+    assert (kept_old, kept_new) == ((7, 10) if policy == "lru" else (10, 7))
+
+def test_size_cap_and_max_age(cache_path, monkeypatch):
+    import src.utils.embedding_cache as ec
+    now = [1000.0]
+    monkeypatch.setattr(ec.time, "time", lambda: now[0])
+    cache, texts = filled_cache(cache_path, 2000, monkeypatch)
+    used = cache.stats()["used_mb"]
+    now[0] += 3 * 86400
+    cache.get_array(MODEL, texts[:50])
+    assert cache.evict(max_age_days=2) == 1950
+    assert cache.get_array(MODEL, texts[:50])[1].all()
+    cache, texts = filled_cache(cache_path, 2000, monkeypatch)
+    cache.evict(max_mb=used / 2)
+    assert cache.stats()["used_mb"] <= used / 2
+    assert 0 < cache.stats()["entries"] < 1000
+
+def test_purge_and_compact(cache_path, monkeypatch):
+    cache, texts = filled_cache(cache_path, 500, monkeypatch)
+    cache.put_many("old-model", texts, vectors(500, seed=2))
+    cache.put_many("other-model", texts[:5], vectors(5, seed=3))
+    cache.flush()
+    assert cache.purge(["old-model"]) == 500
+    assert cache.purge(keep=[MODEL]) == 5
+    assert cache.purge() == 0
+    assert list(cache.stats()["models"]) == [MODEL]
+    size = lambda: sum(os.path.getsize(p) for p in (cache_path, cache_path + "-wal") if os.path.exists(p))
+    before = size()
+    cache.compact()
+    assert size() < before / 2 and cache.stats()["entries"] == 500
+    with sqlite3.connect(cache_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM usage").fetchone()[0] == 500
+
+def test_cli_purges_and_shrinks(cache_path, monkeypatch):
+    import subprocess
+    import sys
+    cache, texts = filled_cache(cache_path, 300, monkeypatch)
+    cache.put_many("old-model", texts, vectors(300))
+    cache.close()
+    out = subprocess.run([sys.executable, "-m", "src.utils.embedding_cache", "purge", "--keep", MODEL,
+                          "--path", cache_path], capture_output=True, text=True, check=True).stdout
+    assert "Purged 300 entries" in out
+    out = subprocess.run([sys.executable, "-m", "src.utils.embedding_cache", "stats", "--path", cache_path],
+                         capture_output=True, text=True, check=True).stdout
+    assert "300 entries" in out and "old-model" not in out
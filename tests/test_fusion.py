@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from src.search.fusion import METHODS, fuse, fusion_method
+
+def _normalize_scores(m: dict) -> dict:
+    if not m:
+        return {}
+    lo, hi = min(m.values()), max(m.values())
+    if hi - lo < 1e-9:
+        return {k: 1.0 for k in m}
+    return {k: (v - lo) / (hi - lo) for k, v in m.items()}
+
+def candidates(seed: int, n: int = 64):
+    rng = np.random.default_rng(seed)
+    vec_ids = rng.choice(1000, n, replace=False)
+    bm_ids = np.concatenate([vec_ids[:n // 3], rng.choice(np.setdiff1d(np.arange(1000), vec_ids), n - n // 3, replace=False)])
+    return vec_ids, np.sort(rng.uniform(0.2, 0.9, n))[::-1], rng.permutation(bm_ids), np.sort(rng.gamma(2.0, 3.0, n))[::-1]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_minmax_matches_dict_fusion(seed):
+    vec_ids, vec_scores, bm_ids, bm_scores = candidates(seed)
+    vec = _normalize_scores(dict(zip(vec_ids.tolist(), vec_scores.tolist())))
+    bm = _normalize_scores(dict(zip(bm_ids.tolist(), bm_scores.tolist())))
+    ref = {i: 0.6 * vec.get(i, 0.0) + 0.4 * bm.get(i, 0.0) for i in set(vec) | set(bm)}
+    ids, scores = fuse(vec_ids, vec_scores, bm_ids, bm_scores, 0.6, "minmax")
+    assert sorted(ids.tolist()) == sorted(ref)
+    assert np.allclose(scores, [ref[i] for i in ids.tolist()])
+    # best first, ties to the lower id
+    assert all((a > b) or (a == b and i < j) for a, b, i, j in zip(scores, scores[1:], ids, ids[1:]))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rrf_and_zscore_match_per_list_references(seed):
+    vec_ids, vec_scores, bm_ids, bm_scores = candidates(seed)
+    def rrf(ids, scores, k=60):
+        ranked = [i for _, i in sorted(zip(-scores, ids))]
+        return {i: 1.0 / (k + r) for r, i in enumerate(ranked, 1)}
+    def zscore(ids, scores):
+        return dict(zip(ids.tolist(), ((scores - scores.mean()) / scores.std()).tolist()))
+    for method, norm, fill in [("rrf", rrf, lambda m: 0.0), ("zscore", zscore, lambda m: min(m.values()))]:
+        vec, bm = norm(vec_ids, vec_scores), norm(bm_ids, bm_scores)
+        ref = {i: 0.3 * vec.get(i, fill(vec)) + 0.7 * bm.get(i, fill(bm)) for i in set(vec) | set(bm)}
+        ids, scores = fuse(vec_ids, vec_scores, bm_ids, bm_scores, 0.3, method, rrf_k=60)
+        assert sorted(ids.tolist()) == sorted(ref)
+        assert np.allclose(scores, [ref[i] for i in ids.tolist()])
+
+def test_degenerate_inputs():
+    ids, scores = fuse([], [], [], [], 0.5)
+    assert len(ids) == len(scores) == 0
+    # one list empty, the other flat: every candidate ties and the ids decide
+    ids, scores = fuse([7, 3, 5], [0.5, 0.5, 0.5], [], [], 0.5, "minmax")
+    assert ids.tolist() == [3, 5, 7] and np.allclose(scores, 0.5)
+    ids, _ = fuse([7, 3, 5], [0.5, 0.5, 0.5], [], [], 0.5, "zscore")
+    assert ids.tolist() == [3, 5, 7]
+
+@pytest.mark.parametrize("method", METHODS)
+def test_top_is_a_prefix_of_the_full_ranking(method):
+    c = candidates(7)
+    ids, scores = fuse(*c, 0.5, method)
+    top_ids, top_scores = fuse(*c, 0.5, method, top=8)
+    assert np.array_equal(top_ids, ids[:8]) and np.array_equal(top_scores, scores[:8])
+
+def test_fusion_method_validates():
+    assert fusion_method(None) == "minmax"
+    with pytest.raises(ValueError):
+        fusion_method("sum")
@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+faiss = pytest.importorskip("faiss")
+
+from tests.conftest import HashEmbedder, make_queries, zipf_texts
+
+class FakePool(HashEmbedder):
+    """EmbedPool stand-in: no worker processes, same interface."""
+    def __init__(self, model_name):
+        self.chunks = 0
+
+    def close(self):
+        pass
+
+    def report(self):
+        return ""
+
+def iter_file_chunks(paths):
+    """One chunk per non-empty file."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if text:
+            yield {"doc_path": path, "chunk_id": f"{path}::chunk_0", "text": text}
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    """run_ingest over the files of tmp_path/raw into out_dir (default tmp_path/out)."""
+    import src.ingest.incremental as inc
+    import src.retriever as r
+    for var in ("FAISS_INDEX_TYPE", "FAISS_ONDISK", "LEXICAL_INDEX_PATH", "SHARDS_DIR", "INDEX_SHARDS",
+                "FAISS_RESCORE"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("EMB_CACHE", "false")
+    monkeypatch.setattr(inc, "EmbedPool", FakePool)
+    monkeypatch.setattr(r, "get_embedder", lambda model: HashEmbedder())
+    (tmp_path / "raw").mkdir()
+
+    def run(out_dir=tmp_path / "out", full=False):
+        out_dir.mkdir(exist_ok=True)
+        paths = sorted(str(p) for p in (tmp_path / "raw").iterdir())
+        return inc.run_ingest(paths, iter_file_chunks, str(out_dir / "chunks.jsonl"), str(out_dir / "faiss.index"),
+                              str(out_dir / "bm25"), "test-model", str(out_dir / "manifest.json"), full=full)
+    return run
+
+def write_docs(raw, texts):
+    for i, t in enumerate(texts):
+        (raw / f"doc{i:02d}.txt").write_text(t, encoding="utf-8")
+
+def open_out(out_dir):
+    from src.retriever import Retriever
+    return Retriever(str(out_dir / "faiss.index"), str(out_dir / "chunks.jsonl"), "test-model")
+
+def test_plan_reasons_and_unchanged_files(ingest, tmp_path, monkeypatch):
+    import src.ingest.incremental as inc
+    raw = tmp_path / "raw"
+    write_docs(raw, zipf_texts(12, vocab=60))
+    plan = ingest()
+    assert plan.full and plan.reason == "no manifest yet"
+    plan = ingest()
+    assert not plan.full and plan.unchanged == 12 and not plan.changed and not plan.removed
+    # touched but identical: recognised by hash, and the new mtime is recorded
+    os.utime(raw / "doc03.txt", ns=(0, 10**18))
+    plan = ingest()
+    assert plan.unchanged == 12 and not plan.changed
+    manifest = inc.Manifest(str(tmp_path / "out" / "manifest.json"))
+    assert manifest.files[str(raw / "doc03.txt")]["mtime_ns"] == 10**18
+    assert ingest(full=True).reason == "requested"
+    monkeypatch.setattr(inc, "REBUILD_DEAD_RATIO", 0.0)
+    (raw / "doc00.txt").write_text("w1 w2 w3", encoding="utf-8")
+    plan = ingest()
+    assert plan.full and "would be tombstoned" in plan.reason
+
+def test_plan_lists_changed_and_removed_files(ingest, tmp_path):
+    import src.ingest.incremental as inc
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    write_docs(raw, zipf_texts(12, vocab=60))
+    ingest()
+    manifest = inc.Manifest(str(out / "manifest.json"))
+    ids = {p: e["ids"] for p, e in manifest.files.items()}
+    (raw / "doc02.txt").write_text("w5 w6", encoding="utf-8")
+    (raw / "doc07.txt").unlink()
+    (raw / "new.txt").write_text("w7", encoding="utf-8")
+    (raw / "empty.txt").write_text("", encoding="utf-8")
+    paths = sorted(str(p) for p in raw.iterdir())
+    settings = inc.ingest_settings("test-model")
+    plan = manifest.plan(paths, settings, str(out / "chunks.jsonl"), str(out / "faiss.index"), str(out / "bm25"))
+    assert not plan.full and plan.unchanged == 10
+    assert plan.changed == [str(raw / "doc02.txt"), str(raw / "empty.txt"), str(raw / "new.txt")]
+    assert plan.removed == [str(raw / "doc07.txt")]
+    assert sorted(plan.stale_ids) == sorted(ids[str(raw / "doc02.txt")] + ids[str(raw / "doc07.txt")])
+    # files that produced no chunks stay out of the manifest, so the next plan retries them
+    plan = ingest()
+    manifest = inc.Manifest(str(out / "manifest.json"))
+    assert str(raw / "empty.txt") not in manifest.files and str(raw / "doc07.txt") not in manifest.files
+    assert manifest.data["dead"] == 2 and manifest.data["rows"] == 14
+    assert str(raw / "empty.txt") in ingest().changed
+
+def test_incremental_ingest_matches_a_full_rebuild(ingest, tmp_path):
+    raw = tmp_path / "raw"
+    write_docs(raw, zipf_texts(20, vocab=60))
+    ingest()
+    (raw / "doc04.txt").write_text("w3 w3 w9 zebra", encoding="utf-8")
+    (raw / "doc11.txt").unlink()
+    (raw / "doc15.txt").unlink()
+    (raw / "new.txt").write_text("zebra w1", encoding="utf-8")
+    plan = ingest()
+    assert not plan.full and len(plan.stale_ids) == 3
+    ingest(out_dir=tmp_path / "fresh")
+    inc, fresh = open_out(tmp_path / "out"), open_out(tmp_path / "fresh")
+    live = [r for i, r in enumerate(inc.rows) if not inc.bm25.deleted[i]]
+    assert sorted(r["chunk_id"] for r in live) == sorted(r["chunk_id"] for r in fresh.rows)
+    # every manifest entry points at the rows of its own file
+    with open(tmp_path / "out" / "manifest.json", encoding="utf-8") as f:
+        files = json.load(f)["files"]
+    assert all(inc.rows[i]["doc_path"] == p for p, e in files.items() for i in e["ids"])
+    for q in [" ".join(q) for q in make_queries(10, vocab=60)] + ["zebra"]:
+        for mode in ("vector", "bm25"):
+            a = inc.search(q, top_k=5, mode=mode)
+            b = fresh.search(q, top_k=5, mode=mode)
+            assert [h["chunk_id"] for h in a] == [h["chunk_id"] for h in b]
+            assert np.allclose([h["score"] for h in a], [h["score"] for h in b], rtol=1e-5)
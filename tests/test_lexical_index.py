@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.search.bm25 import BM25Okapi, tokenize
+from src.search.lexical_index import LexicalIndex
+
+def updated_index(texts):
+    """A LexicalIndex built from half the texts, the rest added in two deltas, some rows deleted."""
+    half = len(texts) // 2
+    lex = LexicalIndex(BM25Okapi(tokenize(t) for t in texts[:half]))
+    assert lex.add(texts[half:half + 100]).tolist() == list(range(half, half + 100))
+    lex.add(texts[half + 100:])
+    deleted = np.arange(0, len(texts), 7)
+    assert lex.delete(deleted) == len(deleted)
+    assert lex.delete(deleted[:5]) == 0
+    return lex, np.setdiff1d(np.arange(len(texts)), deleted)
+
+def assert_same_ranking(lex: LexicalIndex, fresh: BM25Okapi, live: np.ndarray, q, k):
+    """``lex`` (global ids) ranks like ``fresh`` (built over the live texts only, ids ``live[i]``)."""
+    idxs, scores = lex.top_k(q, k)
+    full = fresh.get_scores(q)
+    ref = np.sort(full)[::-1][:len(idxs)]
+    assert np.allclose(scores, ref, rtol=1e-9, atol=1e-12)
+    # every hit is live and carries its fresh-build score
+    pos = np.searchsorted(live, idxs)
+    assert np.array_equal(live[pos], idxs)
+    assert np.allclose(full[pos], scores, rtol=1e-9, atol=1e-12)
+
+@pytest.mark.parametrize("merge", [None, "deltas", "full"])
+def test_updates_match_fresh_build(texts, queries, merge):
+    lex, live = updated_index(texts)
+    if merge == "deltas":
+        lex.merge()
+    elif merge == "full":
+        lex.merge(full=True)
+    fresh = BM25Okapi(tokenize(texts[i]) for i in live)
+    assert lex.n_live == fresh.N
+    for q in queries:
+        assert_same_ranking(lex, fresh, live, q, 10)
+        full = lex.get_scores(q)
+        assert np.allclose(full[live], fresh.get_scores(q), rtol=1e-9, atol=1e-12)
+        assert not full[~np.isin(np.arange(lex.N), live)].any()
+
+def test_background_merge_keeps_concurrent_updates(texts, queries):
+    lex, live = updated_index(texts)
+    lex.merge_in_background(full=True)
+    lex.delete(live[:3])
+    lex.wait_for_merge()
+    live = live[3:]
+    fresh = BM25Okapi(tokenize(texts[i]) for i in live)
+    for q in queries:
+        assert_same_ranking(lex, fresh, live, q, 10)
+
+def test_save_load_keeps_updates(tmp_path, texts, queries):
+    lex, live = updated_index(texts)
+    lex.save(str(tmp_path / "bm25"))
+    loaded = LexicalIndex.load(str(tmp_path / "bm25"))
+    assert loaded.N == lex.N and loaded.n_live == lex.n_live
+    for q in queries:
+        a, b = lex.top_k(q, 10), loaded.top_k(q, 10)
+        assert np.array_equal(a[0], b[0]) and np.allclose(a[1], b[1])
+
+@pytest.mark.parametrize("budget", [LexicalIndex.SHARED_IMPACTS, 0])
+def test_top_k_many_matches_top_k(texts, queries, budget):
+    lex, _ = updated_index(texts)
+    # budget 0: no impact arrays shared across the batch, every query scores on its own
+    lex.SHARED_IMPACTS = budget
+    for (idxs, scores), q in zip(lex.top_k_many(queries, 16), queries):
+        ref_idxs, ref_scores = lex.top_k(q, 16)
+        assert np.array_equal(idxs, ref_idxs)
+        assert np.array_equal(scores, ref_scores)
+
+def test_top_k_many_overlap_matches_overlap_counts(texts, queries):
+    lex, live = updated_index(texts)
+    rng = np.random.default_rng(3)
+    docs = [np.sort(rng.choice(live, 12, replace=False)) for _ in queries]
+    for q, d, (idxs, scores, overlap) in zip(queries, docs, lex.top_k_many(queries, 10, overlap_docs=docs)):
+        assert np.array_equal(overlap, lex.overlap_counts(q, d))
+        ref_idxs, ref_scores = lex.top_k(q, 10)
+        assert np.array_equal(idxs, ref_idxs) and np.array_equal(scores, ref_scores)
@@ -0,0 +1,180 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+faiss = pytest.importorskip("faiss")
+
+from tests.conftest import DIM, HashEmbedder, make_queries, zipf_texts
+
+def chunk_rows(texts, start=0):
+    return [{"doc_path": f"d{i // 4}.txt", "chunk_id": f"d{i // 4}.txt::chunk_{i % 4}", "text": t}
+            for i, t in enumerate(texts, start)]
+
+def write_corpus(dir_path, texts):
+    """chunks.jsonl, faiss.index (IDMap,Flat), embeddings.npy and the lexical index, as ingest lays them out."""
+    from src.search.bm25 import BM25Okapi, tokenize
+    from src.search.lexical_index import LexicalIndex
+    with open(dir_path / "chunks.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(row) + "\n" for row in chunk_rows(texts))
+    E = HashEmbedder().embed_passages(texts)
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(DIM))
+    index.add_with_ids(E, np.arange(len(texts), dtype="int64"))
+    faiss.write_index(index, str(dir_path / "faiss.index"))
+    np.save(dir_path / "embeddings.npy", E)
+    LexicalIndex(BM25Okapi(tokenize(t) for t in texts)).save(str(dir_path / "bm25"))
+    return str(dir_path / "faiss.index"), str(dir_path / "chunks.jsonl")
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    import src.retriever as r
+    for var in ("LEXICAL_INDEX_PATH", "SHARDS_DIR", "INDEX_SHARDS", "FAISS_RESCORE"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("EMB_CACHE", "false")
+    monkeypatch.setattr(r, "get_embedder", lambda model: HashEmbedder())
+    return write_corpus(tmp_path, zipf_texts(300, vocab=60))
+
+@pytest.fixture
+def retriever(corpus):
+    from src.retriever import Retriever
+    return Retriever(*corpus, "test-model")
+
+def chunk_ids(hits):
+    return [h["chunk_id"] for h in hits]
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_deleted_chunks_do_not_shrink_results(retriever, mode):
+    query = "w3 w17"
+    first = retriever.search(query, top_k=8, mode="vector")
+    row_of = {r["chunk_id"]: i for i, r in enumerate(retriever.rows)}
+    dead = [row_of[h["chunk_id"]] for h in first[:3]]
+    retriever.bm25.delete(np.array(dead))
+    hits = retriever.search(query, top_k=8, mode=mode)
+    assert len(hits) == 8
+    assert not set(chunk_ids(hits)) & {retriever.rows[i]["chunk_id"] for i in dead}
+    assert chunk_ids(retriever.search_many([query], top_k=8, mode=mode)[0]) == chunk_ids(hits)
+    retriever.start_batcher()
+    try:
+        assert chunk_ids(retriever.search(query, top_k=8, mode=mode)) == chunk_ids(hits)
+    finally:
+        retriever.close()
+
+PARAMS = [
+    {"mode": "vector"},
+    {"mode": "bm25"},
+    {"mode": "hybrid"},
+    {"mode": "hybrid", "fusion": "rrf", "alpha": 0.4},
+    {"mode": "hybrid", "fusion": "zscore", "lexical_fallback": False},
+    {"mode": "hybrid", "mmr": True, "max_per_doc": 1},
+    {"mode": "hybrid", "mmr": "dpp"},
+    {"mode": "vector", "mmr": "facility", "fetch_k": 16},
+]
+
+@pytest.mark.parametrize("params", PARAMS)
+def test_search_many_matches_search(retriever, params):
+    queries = [" ".join(q) for q in make_queries(12, vocab=60)] + ["", "unknownterm"]
+    many = retriever.search_many(queries, top_k=8, **params)
+    assert len(many) == len(queries)
+    for q, hits in zip(queries, many):
+        one = retriever.search(q, top_k=8, **params)
+        assert chunk_ids(hits) == chunk_ids(one)
+        assert [h["mode"] for h in hits] == [h["mode"] for h in one]
+        assert np.allclose([h["score"] for h in hits], [h["score"] for h in one], rtol=1e-5)
+    assert retriever.search_many([], top_k=8, **params) == []
+
+def test_reload_picks_up_update_indexes(corpus, tmp_path):
+    from src.ingest.incremental import update_indexes
+    from src.retriever import RetrieverReloader
+    index_path, chunks_path = corpus
+    reloader = RetrieverReloader(index_path, chunks_path, "test-model", check_s=0)
+    old = reloader.get()
+    victim = old.search("w3", top_k=1, mode="bm25")[0]["chunk_id"]
+    with open(tmp_path / "new.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps(chunk_rows(["zebra w3 zebra"], start=300)[0]) + "\n")
+    row_of = {r["chunk_id"]: i for i, r in enumerate(old.rows)}
+    update_indexes(str(tmp_path / "new.jsonl"), [row_of[victim]], chunks_path, index_path,
+                   str(tmp_path / "bm25"), "test-model", embedder=HashEmbedder())
+    # the old retriever still serves until the swap
+    assert reloader.get() is old and old.search("zebra", top_k=1, mode="bm25")[0]["score"] == 0.0
+    assert reloader.reload()
+    new = reloader.get()
+    assert new is not old and new.embedder is old.embedder
+    assert new.search("zebra", top_k=1, mode="bm25")[0]["chunk_id"] == "d75.txt::chunk_0"
+    assert victim not in chunk_ids(new.search("w3", top_k=20, mode="hybrid"))
+
+def test_reload_skips_half_written_update(corpus):
+    from src.retriever import RetrieverReloader
+    index_path, chunks_path = corpus
+    reloader = RetrieverReloader(index_path, chunks_path, "test-model", check_s=0)
+    old = reloader.get()
+    # chunks.jsonl appended, lexical index not saved yet
+    with open(chunks_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(chunk_rows(["zebra"], start=300)[0]) + "\n")
+    assert not reloader.reload()
+    assert reloader.get() is old
+
+def test_get_reloads_once_files_settle(corpus, tmp_path):
+    from src.retriever import RetrieverReloader
+    from src.search.lexical_index import LexicalIndex
+    index_path, chunks_path = corpus
+    reloader = RetrieverReloader(index_path, chunks_path, "test-model", check_s=1e-6)
+    old = reloader.get()
+    lex = LexicalIndex.load(str(tmp_path / "bm25"))
+    lex.delete([0])
+    lex.save()
+    time.sleep(0.01)
+    # first check sees the change, the next one (files unchanged since) reloads in the background
+    reloader.get()
+    assert reloader.reloads == 0
+    time.sleep(0.01)
+    reloader.get()
+    deadline = time.monotonic() + 10
+    while reloader.reloads == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reloader.get() is not old and reloader.get().bm25.deleted[0]
+
+SHARD_PARAMS = [
+    {"mode": "vector"},
+    {"mode": "bm25"},
+    {"mode": "hybrid"},
+    {"mode": "hybrid", "fusion": "rrf"},
+    {"mode": "hybrid", "lexical_fallback": False, "max_per_doc": 1},
+    {"mode": "hybrid", "mmr": "mmr"},
+]
+
+@pytest.mark.parametrize("params", SHARD_PARAMS)
+def test_sharded_matches_single_index(corpus, tmp_path, params):
+    from src.ingest.build_index import build_shards
+    from src.retriever import Retriever, ShardedRetriever
+    index_path, chunks_path = corpus
+    build_shards(chunks_path, str(tmp_path / "shards"), "test-model", 3, "flat", embedder=HashEmbedder(), report=False)
+    single = Retriever(index_path, chunks_path, "test-model")
+    sharded = ShardedRetriever(str(tmp_path / "shards"), "test-model", executor="thread", embedder=HashEmbedder())
+    try:
+        for q in [" ".join(q) for q in make_queries(12, vocab=60)]:
+            a = single.search(q, top_k=8, fetch_k=24, **params)
+            b = sharded.search(q, top_k=8, fetch_k=24, **params)
+            assert chunk_ids(a) == chunk_ids(b)
+            assert [h["mode"] for h in a] == [h["mode"] for h in b]
+            assert np.allclose([h["score"] for h in a], [h["score"] for h in b], rtol=1e-6)
+    finally:
+        sharded.close()
+
+def test_sharded_search_many_matches_search(corpus, tmp_path):
+    from src.ingest.build_index import build_shards
+    from src.retriever import ShardedRetriever
+    _, chunks_path = corpus
+    build_shards(chunks_path, str(tmp_path / "shards"), "test-model", 3, "flat", embedder=HashEmbedder(), report=False)
+    sharded = ShardedRetriever(str(tmp_path / "shards"), "test-model", executor="thread", embedder=HashEmbedder())
+    queries = [" ".join(q) for q in make_queries(12, vocab=60)]
+    try:
+        for params in SHARD_PARAMS:
+            many = sharded.search_many(queries, top_k=8, fetch_k=24, **params)
+            for q, hits in zip(queries, many):
+                one = sharded.search(q, top_k=8, fetch_k=24, **params)
+                assert chunk_ids(hits) == chunk_ids(one)
+                assert np.allclose([h["score"] for h in hits], [h["score"] for h in one], rtol=1e-5)
+    finally:
+        sharded.close()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from src.search.vector_index import (RescoringIndex, add_rows, index_config, is_read_only, make_index, open_index,
+                                     read_index, remove_rows, search_live)
+
+def flat_index(n=200, d=16, seed=0):
+    X = np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(d))
+    index.add_with_ids(X, np.arange(n, dtype="int64"))
+    return index, X
+
+@pytest.mark.parametrize("n_dead", [0, 3, 40, 195])
+def test_search_live_over_fetches_past_tombstones(n_dead):
+    index, X = flat_index()
+    Q = X[:5] + 0.01
+    _, full = index.search(Q, index.ntotal)
+    # tombstone the queries' nearest neighbours first, so a plain top-k is mostly dead
+    deleted = np.zeros(index.ntotal, dtype=bool)
+    deleted[list(dict.fromkeys(full.T.ravel().tolist()))[:n_dead]] = True
+    calls = []
+    def search(kk):
+        calls.append(kk)
+        return index.search(Q, kk)
+    k = 8
+    D, I = search_live(search, k, deleted, n_dead, index.ntotal)
+    for got, ref in zip(I, full):
+        # the same live ids, in the same order, as filtering an exhaustive search
+        assert [i for i in got if not deleted[i]][:k] == [i for i in ref if not deleted[i]][:k]
+        assert len([i for i in got if not deleted[i]]) >= min(k, index.ntotal - n_dead)
+    assert calls[0] == k + min(n_dead, k)
+
+def exact_top_k(X, Q, k):
+    return np.argsort(-(Q @ X.T), axis=1, kind="stable")[:, :k]
+
+@pytest.mark.parametrize("index_type", ["sq8", "sqfp16"])
+def test_scalar_quantized_index_removes_by_id(index_type):
+    _, X = flat_index()
+    index = make_index(X.shape[1], len(X), index_config(index_type))
+    index.train(X)
+    add_rows(index, X, 0)
+    assert remove_rows(index, [0, 1]) == 2
+    _, I = index.search(X[:2], 1)
+    assert not np.isin(I, [0, 1]).any()
+
+def test_rescoring_index_returns_exact_scores():
+    _, X = flat_index(n=500, d=32)
+    Q = X[:20] + 0.05
+    index = make_index(X.shape[1], len(X), index_config("sq8"))
+    index.train(X)
+    add_rows(index, X, 0)
+    rescoring = RescoringIndex(index, X, factor=4)
+    assert rescoring.ntotal == len(X) and rescoring.d == X.shape[1]
+    D, I = rescoring.search(Q, 5)
+    # scores are exact inner products, in descending order
+    assert np.allclose(D, np.take_along_axis(Q @ X.T, I, axis=1), rtol=1e-5)
+    assert (np.diff(D, axis=1) <= 0).all()
+    assert (I == exact_top_k(X, Q, 5)).mean() > 0.95
+
+def test_open_index_wraps_with_rescore(tmp_path):
+    index, X = flat_index()
+    faiss.write_index(index, str(tmp_path / "faiss.index"))
+    np.save(tmp_path / "embeddings.npy", X)
+    opened = open_index(str(tmp_path / "faiss.index"), rescore=True, rescore_factor=2)
+    assert isinstance(opened, RescoringIndex) and opened.factor == 2
+    assert not isinstance(open_index(str(tmp_path / "faiss.index"), rescore=False), RescoringIndex)
+
+def test_mapped_index_searches_like_a_loaded_one_and_refuses_writes(tmp_path):
+    index, X = flat_index()
+    path = str(tmp_path / "faiss.index")
+    faiss.write_index(index, path)
+    mapped, loaded = read_index(path, mmap=True), read_index(path, mmap=False)
+    assert is_read_only(mapped) and not is_read_only(loaded)
+    assert is_read_only(RescoringIndex(mapped, X))
+    Dm, Im = mapped.search(X[:10], 5)
+    Dl, Il = loaded.search(X[:10], 5)
+    assert np.array_equal(Im, Il) and np.array_equal(Dm, Dl)
+    with pytest.raises(ValueError, match="read-only"):
+        remove_rows(mapped, [0])
+    with pytest.raises(ValueError, match="read-only"):
+        add_rows(mapped, X[:1], len(X))
+    assert remove_rows(loaded, [0]) == 1
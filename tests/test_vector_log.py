@@ -0,0 +1,107 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.utils.vector_log import VectorLogCache, _digest
+
+MODEL = "test-model"
+
+def vectors(n, d=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    for var in ("EMB_CACHE_MAX_MB", "EMB_CACHE_MAX_ENTRIES", "EMB_CACHE_DTYPE"):
+        monkeypatch.delenv(var, raising=False)
+    return str(tmp_path / "emb_cache.vlog")
+
+def segment_files(path):
+    return sorted(n for n in os.listdir(path) if n.endswith((".vec", ".keys")))
+
+@pytest.mark.parametrize("dtype, atol", [("float32", 0), ("float16", 1e-2)])
+def test_round_trip_and_appends_from_another_instance(log_path, dtype, atol):
+    V = vectors(40)
+    texts = [f"t{i}" for i in range(40)]
+    a, b = VectorLogCache(log_path, dtype), VectorLogCache(log_path, dtype)
+    a.put_many(MODEL, texts[:25], V[:25])
+    assert b.get_array(MODEL, texts)[1].sum() == 25
+    # duplicates within and across batches are stored once
+    b.put_many(MODEL, texts[20:] + texts[30:35], np.vstack([V[20:], V[30:35]]))
+    out, found = a.get_array(MODEL, texts[::-1] + ["missing"])
+    assert found.tolist() == [True] * 40 + [False] and np.allclose(out[:40], V[::-1], atol=atol, rtol=0)
+    assert a.stats()["models"][MODEL]["rows"] == 40
+    assert a.get_array("other-model", texts)[0] is None
+
+def test_check_word_rejects_sort_key_collisions(log_path):
+    cache = VectorLogCache(log_path)
+    cache.put_many(MODEL, ["a"], vectors(1))
+    seg = cache.segments[MODEL]
+    h = _digest(["a"]).copy()
+    h[0, 1] ^= 1
+    assert seg.find(h).tolist() == [-1] and seg.find(_digest(["a"])).tolist() == [0]
+
+def append_duplicates(cache, texts, V):
+    """Rows an earlier version could leave behind: texts stored twice."""
+    seg = cache.segments[MODEL]
+    with open(seg.vec_path, "ab") as f:
+        f.write(V.tobytes())
+    with open(seg.keys_path, "ab") as f:
+        f.write(_digest(texts).tobytes())
+
+def test_compact_publishes_a_new_generation(log_path):
+    V = vectors(30)
+    texts = [f"t{i}" for i in range(30)]
+    writer, reader = VectorLogCache(log_path), VectorLogCache(log_path)
+    writer.put_many(MODEL, texts, V)
+    writer.put_many("old-model", texts[:5], V[:5])
+    append_duplicates(writer, texts[:10], V[:10])
+    out, found = reader.get_array(MODEL, texts)
+    assert found.all() and reader.stats()["models"][MODEL]["rows"] == 40
+    old_view = reader.segments[MODEL].view
+    assert VectorLogCache(log_path).compact(models=["old-model"]) == 10 + 5
+    with open(os.path.join(log_path, "segments.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    slug = VectorLogCache._slug(MODEL)
+    assert list(meta) == [slug] and meta[slug]["gen"] == 1
+    assert segment_files(log_path) == [f"{slug}.1.keys", f"{slug}.1.vec"]
+    # maps taken before the compaction still read the old files
+    assert np.array_equal(np.asarray(old_view[5][:30]), V)
+    # the next lookup finds the old key file gone and reopens the new generation
+    out, found = reader.get_array(MODEL, texts)
+    assert found.all() and np.array_equal(out, V)
+    assert reader.segments[MODEL].gen == 1 and reader.segments[MODEL].n == 30
+    assert reader.get_array("old-model", texts)[0] is None
+    # a writer still holding the old generation appends to the new one
+    writer.put_many(MODEL, ["new"], vectors(1, seed=1))
+    assert segment_files(log_path) == [f"{slug}.1.keys", f"{slug}.1.vec"]
+    assert reader.get_array(MODEL, ["new"])[1].all() and reader.segments[MODEL].n == 31
+    assert VectorLogCache(log_path).compact() == 0
+
+def test_compact_removes_leftovers_of_an_interrupted_compaction(log_path):
+    cache = VectorLogCache(log_path)
+    cache.put_many(MODEL, ["a", "b"], vectors(2))
+    slug = VectorLogCache._slug(MODEL)
+    for name in (f"{slug}.1.vec", f"{slug}.1.keys"):
+        open(os.path.join(log_path, name), "wb").close()
+    assert cache.compact() == 0
+    assert segment_files(log_path) == [f"{slug}.keys", f"{slug}.vec"]
+    assert VectorLogCache(log_path).get_array(MODEL, ["a", "b"])[1].all()
+
+def test_segments_with_64_bit_keys_are_discarded(log_path, capsys):
+    cache = VectorLogCache(log_path)
+    cache.put_many(MODEL, ["a"], vectors(1))
+    meta_path = os.path.join(log_path, "segments.json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    for m in meta.values():
+        m.pop("keys")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    fresh = VectorLogCache(log_path)
+    assert not fresh.get_array(MODEL, ["a"])[1].any()
+    assert "64-bit keys" in capsys.readouterr().out
+    assert segment_files(log_path) == []
+    fresh.put_many(MODEL, ["a"], vectors(1))
+    assert fresh.get_array(MODEL, ["a"])[1].all()
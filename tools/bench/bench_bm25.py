@@ -0,0 +1,78 @@
+import os, json, sys, time
+from pathlib import Path
+import numpy as np
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.search.bm25 import BM25Okapi, tokenize
+from src.search.lexical_index import LexicalIndex
+
+def load_corpus(chunks_path: str, synthetic_docs: int, seed: int = 0):
+    if chunks_path and os.path.exists(chunks_path):
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            return [tokenize(json.loads(l).get("text", "")) for l in f if l.strip()]
+    # Zipf-distributed synthetic corpus: a few very frequent terms, a long tail
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"t{i}" for i in range(50000)])
+    lens = rng.integers(50, 200, size=synthetic_docs)
+    ranks = np.minimum(rng.zipf(1.1, size=int(lens.sum())), len(vocab)) - 1
+    words = vocab[ranks].tolist()
+    out, pos = [], 0
+    for n in lens.tolist():
+        out.append(words[pos:pos + n])
+        pos += n
+    return out
+
+def make_queries(bm25: BM25Okapi, n: int, seed: int = 0):
+    """Multi-term queries mixing 2-3 of the most frequent terms with 1-2 mid-frequency ones."""
+    rng = np.random.default_rng(seed)
+    terms = np.array(list(bm25.vocab.keys()))
+    by_df = np.argsort(-bm25.doc_freq)
+    frequent, mid = terms[by_df[:20]], terms[by_df[100:2000]]
+    return [list(rng.choice(frequent, rng.integers(2, 4), replace=False)) + list(rng.choice(mid, rng.integers(1, 3), replace=False))
+            for _ in range(n)]
+
+def exhaustive(bm25: BM25Okapi, q, k):
+    """Reference ranking: score everything, full sort (ties by doc id)."""
+    scores = bm25.get_scores(q)
+    order = np.lexsort((np.arange(len(scores)), -scores))[:k]
+    return order, scores[order]
+
+def full_sort(bm25: BM25Okapi, q, k):
+    """What the Retriever did before top_k: score everything, argsort all N."""
+    scores = bm25.get_scores(q)
+    order = np.argsort(scores)[::-1][:k]
+    return order, scores[order]
+
+def main(chunks_path: str, synthetic_docs: int, n_queries: int, k: int):
+    corpus = load_corpus(chunks_path, synthetic_docs)
+    t0 = time.time()
+    bm25 = BM25Okapi(corpus)
+    print(f"Built BM25 over {bm25.N} docs / {len(bm25.vocab)} terms in {time.time() - t0:.2f}s")
+    lexical = LexicalIndex(bm25)
+    queries = make_queries(bm25, n_queries)
+    for q in queries:
+        a, sa = exhaustive(bm25, q, k)
+        for b, sb in (bm25.top_k(q, k), lexical.top_k(q, k)):
+            assert np.array_equal(a, b) and np.array_equal(sa, sb), f"top_k differs from exhaustive for {q}"
+    timings = {}
+    for name, fn in [("full_sort", lambda q: full_sort(bm25, q, k)),
+                     ("top_k", lambda q: bm25.top_k(q, k)),
+                     ("lexical", lambda q: lexical.top_k(q, k))]:
+        t0 = time.perf_counter()
+        for q in queries:
+            fn(q)
+        timings[name] = (time.perf_counter() - t0) / len(queries) * 1000
+    print(f"k={k}  full sort {timings['full_sort']:.2f} ms/query  BM25Okapi.top_k {timings['top_k']:.2f} ms/query  "
+          f"LexicalIndex.top_k {timings['lexical']:.2f} ms/query  speedup x{timings['full_sort'] / timings['lexical']:.1f}")
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument("--chunks_path", default="", help="chunks.jsonl to benchmark on (default: synthetic corpus)")
+    p.add_argument("--synthetic_docs", type=int, default=200000)
+    p.add_argument("--n_queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=64)
+    args = p.parse_args()
+    main(args.chunks_path, args.synthetic_docs, args.n_queries, args.k)
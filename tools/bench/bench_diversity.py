@@ -0,0 +1,123 @@
+import os, json, sys, time
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.search import diversity
+from src.search.vector_index import default_embeddings_path
+
+load_dotenv()
+INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
+
+def mmr_reference(q_emb: np.ndarray, cand_embs: np.ndarray, top_k: int, lambda_mult: float):
+    """The original loop MMR (pairwise np.dot, list membership), as the correctness and speed baseline."""
+    selected_idx = []
+    def sim(a, b):
+        return float(np.dot(a, b))
+    while len(selected_idx) < min(top_k, len(cand_embs)):
+        best_j = None
+        best_score = -1e9
+        for j in range(len(cand_embs)):
+            if j in selected_idx:
+                continue
+            relevance = sim(q_emb, cand_embs[j])
+            diversity_ = 0.0
+            if selected_idx:
+                diversity_ = max(sim(cand_embs[j], cand_embs[k]) for k in selected_idx)
+            mmr = lambda_mult * relevance - (1 - lambda_mult) * diversity_
+            if mmr > best_score:
+                best_score = mmr
+                best_j = j
+        selected_idx.append(best_j)
+    return selected_idx
+
+def load_corpus(n_synth: int, dim: int, seed: int):
+    """Stored passage vectors and doc_path per row; clustered synthetic vectors if there is no index."""
+    emb_path = default_embeddings_path(INDEX_PATH)
+    if os.path.exists(emb_path) and os.path.exists(CHUNKS_PATH):
+        X = np.load(emb_path, mmap_mode="r")
+        with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
+            docs = [json.loads(l)["doc_path"] for l in f if l.strip()]
+        return np.asarray(X[:len(docs)], dtype=np.float32), docs, emb_path
+    # topics -> documents -> chunks: a query's candidates span several documents of its topic
+    rng = np.random.default_rng(seed)
+    n_docs = max(1, n_synth // 20)
+    topics = rng.standard_normal((max(1, n_docs // 25), dim)).astype(np.float32)
+    docs = topics[rng.integers(0, len(topics), n_docs)] + rng.standard_normal((n_docs, dim)).astype(np.float32)
+    doc = rng.integers(0, n_docs, n_synth)
+    X = docs[doc] + rng.standard_normal((n_synth, dim)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    return X, [f"doc_{d}" for d in doc.tolist()], "synthetic"
+
+def quality(q: np.ndarray, E: np.ndarray, picks, groups) -> dict:
+    P = E[picks]
+    S = P @ P.T
+    k = len(picks)
+    return {"relevance": float((P @ q).mean()),
+            "intra_sim": float((S.sum() - np.trace(S)) / max(k * (k - 1), 1)),
+            "docs": len({groups[j] for j in picks})}
+
+def main(args):
+    X, docs, source = load_corpus(args.synthetic, args.dim, args.seed)
+    rng = np.random.default_rng(args.seed)
+    print(f"{source}: {len(X)} vectors, d={X.shape[1]}; top_k={args.top_k}, lambda={args.lambda_mult}, {args.queries} queries")
+    runs = {
+        "mmr_loop": lambda q, E, g: mmr_reference(q, E, args.top_k, args.lambda_mult),
+        "mmr": lambda q, E, g: diversity.select("mmr", q, E, args.top_k, args.lambda_mult),
+        f"mmr+cap{args.max_per_doc}": lambda q, E, g: diversity.select("mmr", q, E, args.top_k, args.lambda_mult, g, args.max_per_doc),
+        "dpp": lambda q, E, g: diversity.select("dpp", q, E, args.top_k, args.lambda_mult),
+        "facility": lambda q, E, g: diversity.select("facility", q, E, args.top_k, args.lambda_mult),
+        f"cap{args.max_per_doc}": lambda q, E, g: diversity.capped(range(len(E)), g, args.top_k, args.max_per_doc),
+    }
+    report = {"source": source, "vectors": len(X), "top_k": args.top_k, "lambda_mult": args.lambda_mult,
+              "max_per_doc": args.max_per_doc, "queries": args.queries, "fetch_k": {}}
+    print(f"{'fetch_k':>8} {'strategy':<12}{'ms/query':>10}{'speedup':>9}{'relevance':>10}{'intra sim':>10}{'docs':>6}")
+    for fetch_k in args.fetch_k:
+        fetch_k = min(fetch_k, len(X))
+        # queries near corpus vectors; candidates are their exact top fetch_k, most relevant first
+        qs = X[rng.integers(0, len(X), args.queries)] + rng.standard_normal((args.queries, X.shape[1])).astype(np.float32) / np.sqrt(X.shape[1])
+        qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+        cands = []
+        for q in qs:
+            s = X @ q
+            top = np.argpartition(-s, fetch_k - 1)[:fetch_k]
+            top = top[np.argsort(-s[top], kind="stable")]
+            cands.append((q, np.ascontiguousarray(X[top]), [docs[i] for i in top.tolist()]))
+        rows = {}
+        picks = {}
+        for name, fn in runs.items():
+            t0 = time.perf_counter()
+            picks[name] = [fn(q, E, g) for q, E, g in cands]
+            ms = (time.perf_counter() - t0) / len(cands) * 1000
+            qual = [quality(q, E, p, g) for (q, E, g), p in zip(cands, picks[name])]
+            rows[name] = {"ms_per_query": ms, **{m: float(np.mean([x[m] for x in qual])) for m in qual[0]}}
+        mismatches = sum(a != b for a, b in zip(picks["mmr"], picks["mmr_loop"]))
+        if mismatches:
+            print(f"[WARN] fetch_k={fetch_k}: vectorized MMR differs from the loop on {mismatches} queries (ties / float order)")
+        for name, r in rows.items():
+            r["speedup_vs_loop"] = rows["mmr_loop"]["ms_per_query"] / r["ms_per_query"]
+            print(f"{fetch_k:>8} {name:<12}{r['ms_per_query']:>10.3f}{r['speedup_vs_loop']:>9.1f}"
+                  f"{r['relevance']:>10.3f}{r['intra_sim']:>10.3f}{r['docs']:>6.1f}")
+        report["fetch_k"][str(fetch_k)] = {"mmr_mismatches": mismatches, "strategies": rows}
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {args.out}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Diversification strategies: loop vs vectorized MMR, DPP, facility location, per-document caps")
+    ap.add_argument("--fetch_k", type=int, nargs="+", default=[64, 256, 1024])
+    ap.add_argument("--top_k", type=int, default=8)
+    ap.add_argument("--lambda_mult", type=float, default=0.6)
+    ap.add_argument("--max_per_doc", type=int, default=2)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--synthetic", type=int, default=20000, help="vectors to generate when INDEX_PATH has no embeddings.npy")
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="eval_out/diversity_report.json")
+    main(ap.parse_args())
@@ -0,0 +1,106 @@
+import os, json, sys, time, zlib, tempfile
+from pathlib import Path
+import numpy as np
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.utils.embedding_cache import FMT_JSON, EmbeddingCache
+from src.utils.vector_log import VectorLogCache
+
+MODEL = "bench-model"
+# SQLite: legacy JSON rows, raw float32 / float16 blobs; then the memory-mapped vector log
+FORMATS = ("json", "float32", "float16", "vlog-float32", "vlog-float16")
+
+def legacy_get(cache: EmbeddingCache, texts):
+    """The hit path before binary blobs: JSON rows, json.loads, then float() per element in CachedEmbedder."""
+    keys = [cache._hash(MODEL, t) for t in texts]
+    cur = cache.conn.execute(f"SELECT key, vec, dims FROM cache WHERE key IN ({','.join('?' * len(keys))})", keys)
+    rows = {k: blob for k, blob, _ in cur.fetchall()}
+    cached = [json.loads(zlib.decompress(rows[k]).decode("utf-8")) for k in keys]
+    return np.array([[float(x) for x in v] for v in cached], dtype="float32")
+
+def fill(path: str, fmt: str, texts, X: np.ndarray, chunk: int = 1000):
+    if fmt == "json":
+        cache = EmbeddingCache(path)
+        for s in range(0, len(texts), chunk):
+            rows = [(cache._hash(MODEL, t), MODEL, X.shape[1],
+                     zlib.compress(json.dumps([float(x) for x in v]).encode("utf-8")), FMT_JSON)
+                    for t, v in zip(texts[s:s + chunk], X[s:s + chunk])]
+            cache.conn.executemany("INSERT OR REPLACE INTO cache(key, model, dims, vec, fmt) VALUES (?,?,?,?,?)", rows)
+        cache.conn.commit()
+        return cache
+    if fmt.startswith("vlog-"):
+        cache = VectorLogCache(path, fmt[len("vlog-"):])
+    else:
+        cache = EmbeddingCache(path, fmt)
+    for s in range(0, len(texts), chunk):
+        cache.put_many(MODEL, texts[s:s + chunk], X[s:s + chunk])
+    # time lookups against the database, not the write buffer
+    cache.flush()
+    return cache
+
+def disk_mb(path: str) -> float:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2**20
+    return os.path.getsize(path) / 2**20
+
+def time_hits(lookup, texts, batch: int, seconds: float = 1.0, seed: int = 0) -> float:
+    """Mean ms per lookup of ``batch`` random cached texts."""
+    rng = np.random.default_rng(seed)
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        lookup([texts[i] for i in rng.integers(0, len(texts), batch)])
+        n += 1
+    return (time.perf_counter() - t0) / n * 1000
+
+def main(n: int, dims: int, batches, seconds: float, out_path: str):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((n, dims)).astype("float32")
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    texts = [f"passage: synthetic chunk {i}" for i in range(n)]
+    report = {"n": n, "dims": dims, "formats": {}}
+    print(f"{n} cached vectors of {dims} dims")
+    print(f"{'format':<12} {'DB MB':>8} {'max err':>9} " + " ".join(f"{f'ms/{b}':>9}" for b in batches))
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in FORMATS:
+            path = os.path.join(tmp, f"{fmt}.vlog" if fmt.startswith("vlog-") else f"{fmt}.sqlite3")
+            cache = fill(path, fmt, texts, X)
+            if fmt == "json":
+                lookup = legacy_get
+                got = legacy_get(cache, texts[:1000])
+            else:
+                lookup = lambda c, t: c.get_array(MODEL, t)[0]
+                got = lookup(cache, texts[:1000])
+            err = float(np.abs(got - X[:1000]).max())
+            ms = {b: time_hits(lambda t: lookup(cache, t), texts, b, seconds) for b in batches}
+            # closing checkpoints the WAL into the main file
+            cache.close()
+            size = disk_mb(path)
+            report["formats"][fmt] = {"db_mb": size, "max_abs_err": err, "ms_per_lookup": ms}
+            print(f"{fmt:<12} {size:>8.1f} {err:>9.2e} " + " ".join(f"{ms[b]:>9.3f}" for b in batches))
+    base = report["formats"]["json"]["ms_per_lookup"]
+    for fmt in FORMATS[1:]:
+        speedup = {b: base[b] / report["formats"][fmt]["ms_per_lookup"][b] for b in batches}
+        report["formats"][fmt]["speedup_vs_json"] = speedup
+        print(f"{fmt:<12} hit path speedup vs json: " + ", ".join(f"batch {b} x{s:.1f}" for b, s in speedup.items()))
+    for dtype in ("float32", "float16"):
+        sqlite = report["formats"][dtype]["ms_per_lookup"]
+        speedup = {b: sqlite[b] / report["formats"]["vlog-" + dtype]["ms_per_lookup"][b] for b in batches}
+        report["formats"]["vlog-" + dtype]["speedup_vs_sqlite"] = speedup
+        print(f"vlog-{dtype:<7} hit path speedup vs sqlite {dtype}: " + ", ".join(f"batch {b} x{s:.1f}" for b, s in speedup.items()))
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {out_path}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Embedding cache hit path: SQLite JSON rows vs float32/float16 blobs vs the vector log")
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--dims", type=int, default=768)
+    ap.add_argument("--batches", type=int, nargs="+", default=[1, 32, 256, 4096])
+    ap.add_argument("--seconds", type=float, default=1.0, help="time spent per format and batch size")
+    ap.add_argument("--out", default="eval_out/emb_cache_report.json")
+    args = ap.parse_args()
+    main(args.n, args.dims, args.batches, args.seconds, args.out)
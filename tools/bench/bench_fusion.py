@@ -0,0 +1,85 @@
+import os, json, sys, time
+from pathlib import Path
+import numpy as np
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.search.fusion import METHODS, fuse
+
+def _normalize_scores(m: dict) -> dict:
+    if not m:
+        return {}
+    vals = list(m.values())
+    lo, hi = min(vals), max(vals)
+    if hi - lo < 1e-9:
+        return {k: 1.0 for k in m}
+    return {k: (v - lo)/(hi - lo) for k, v in m.items()}
+
+def fuse_reference(vec_ids, vec_scores, bm_ids, bm_scores, alpha: float):
+    """The original dict-based min-max fusion and sort, as the correctness and speed baseline."""
+    vec = {int(i): float(s) for i, s in zip(vec_ids.tolist(), vec_scores.tolist())}
+    bm = {int(i): float(s) for i, s in zip(bm_ids.tolist(), bm_scores.tolist())}
+    vec_n = _normalize_scores(vec)
+    bm_n = _normalize_scores(bm)
+    cand_idxs = list(set(list(vec.keys()) + list(bm.keys())))
+    combined = {i: alpha * vec_n.get(i, 0.0) + (1.0 - alpha) * bm_n.get(i, 0.0) for i in cand_idxs}
+    return sorted(combined.keys(), key=lambda k: combined[k], reverse=True), combined
+
+def candidates(rng, n: int, fetch_k: int, overlap: float):
+    """Vector and BM25 top-fetch_k lists over ``n`` rows sharing about ``overlap`` of their ids, best first."""
+    vec_ids = rng.choice(n, fetch_k, replace=False)
+    shared = vec_ids[:int(fetch_k * overlap)]
+    rest = np.setdiff1d(rng.choice(n, 2 * fetch_k, replace=False), vec_ids)[:fetch_k - len(shared)]
+    bm_ids = rng.permutation(np.concatenate([shared, rest]))
+    vec_scores = np.sort(rng.uniform(0.2, 0.9, fetch_k).astype(np.float32))[::-1]
+    bm_scores = np.sort(rng.gamma(2.0, 3.0, len(bm_ids)))[::-1]
+    return vec_ids, vec_scores, bm_ids, bm_scores
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    report = {"alpha": args.alpha, "overlap": args.overlap, "queries": args.queries, "fetch_k": {}}
+    print(f"alpha={args.alpha}, {args.overlap:.0%} shared candidates, {args.queries} queries")
+    print(f"{'fetch_k':>8} {'fusion':<10}{'us/query':>10}{'speedup':>9}")
+    for fetch_k in args.fetch_k:
+        qs = [candidates(rng, args.rows, fetch_k, args.overlap) for _ in range(args.queries)]
+        t0 = time.perf_counter()
+        ref = [fuse_reference(*c, args.alpha) for c in qs]
+        ref_us = (time.perf_counter() - t0) / len(qs) * 1e6
+        rows = {"dict_minmax": {"us_per_query": ref_us, "speedup": 1.0}}
+        print(f"{fetch_k:>8} {'dict':<10}{ref_us:>10.1f}{1.0:>9.1f}")
+        # same score per id, and the same order up to ties
+        out = [fuse(*c, args.alpha, "minmax") for c in qs]
+        bad = sum(any(abs(combined[i] - s) > 1e-9 for i, s in zip(ids.tolist(), scores.tolist()))
+                  or not np.allclose([combined[i] for i in order], scores)
+                  for (order, combined), (ids, scores) in zip(ref, out))
+        if bad:
+            print(f"[WARN] fetch_k={fetch_k}: array min-max fusion differs from the dict version on {bad} queries")
+        for method in METHODS:
+            for top in (None, args.top_k):
+                t0 = time.perf_counter()
+                for c in qs:
+                    fuse(*c, args.alpha, method, top=top)
+                us = (time.perf_counter() - t0) / len(qs) * 1e6
+                name = method if top is None else f"{method}@{top}"
+                rows[name] = {"us_per_query": us, "speedup": ref_us / us}
+                print(f"{fetch_k:>8} {name:<10}{us:>10.1f}{ref_us / us:>9.1f}")
+        rows["minmax"]["mismatches"] = bad
+        report["fetch_k"][str(fetch_k)] = rows
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {args.out}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Hybrid score fusion: dict min-max vs array min-max, RRF and z-score")
+    ap.add_argument("--fetch_k", type=int, nargs="+", default=[64, 256, 1024, 4096])
+    ap.add_argument("--top_k", type=int, default=8, help="also time keeping only the best top_k (hybrid search without mmr)")
+    ap.add_argument("--alpha", type=float, default=0.65)
+    ap.add_argument("--overlap", type=float, default=0.3, help="share of candidates found by both retrievers")
+    ap.add_argument("--rows", type=int, default=1_000_000, help="corpus size the ids are drawn from")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="eval_out/fusion_report.json")
+    main(ap.parse_args())
@@ -0,0 +1,96 @@
+import os, json, sys, time
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.ingest.embed import E5Embedder
+from tools.eval.metrics import recall_at_k, mrr_at_k, ndcg_at_k_from_binary
+
+load_dotenv()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
+
+def cosine_stats(A: np.ndarray, B: np.ndarray) -> dict:
+    """Row-wise cosine between two normalized embedding matrices of the same texts."""
+    cos = np.sum(A * B, axis=1)
+    return {"mean": float(cos.mean()), "min": float(cos.min()), "p01": float(np.percentile(cos, 1))}
+
+def run_backend(backend: str, passages, questions, batch: int) -> dict:
+    t0 = time.perf_counter()
+    embedder = E5Embedder(EMBED_MODEL, backend)
+    load_s = time.perf_counter() - t0
+    # one warm-up batch: session / kernel initialization is not throughput
+    embedder.embed_passages(passages[:batch])
+    t0 = time.perf_counter()
+    P = np.vstack([embedder.embed_passages(passages[i:i + batch]) for i in range(0, len(passages), batch)])
+    passage_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    Q = np.vstack([embedder.embed_queries([q]) for q in questions])
+    query_s = time.perf_counter() - t0
+    return {"load_s": load_s, "passages_per_s": len(passages) / passage_s,
+            "ms_per_query": query_s / max(len(questions), 1) * 1000, "P": P, "Q": Q}
+
+def retrieval(P: np.ndarray, Q: np.ndarray, chunk_ids, relevant, k: int):
+    I = np.argsort(-(Q @ P.T), axis=1)[:, :k]
+    got = [[chunk_ids[j] for j in row] for row in I.tolist()]
+    return I, {
+        f"R@{k}": float(np.mean([recall_at_k(r, g, k) for r, g in zip(relevant, got)])),
+        f"MRR@{k}": float(np.mean([mrr_at_k(r, g, k) for r, g in zip(relevant, got)])),
+        f"nDCG@{k}": float(np.mean([ndcg_at_k_from_binary(r, g, k) for r, g in zip(relevant, got)])),
+    }
+
+def main(eval_path: str, k: int, batch: int, limit: int, out_path: str):
+    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
+        rows = [json.loads(l) for l in f if l.strip()]
+    if limit:
+        rows = rows[:limit]
+    passages = [r["text"] for r in rows]
+    chunk_ids = [r["chunk_id"] for r in rows]
+    with open(eval_path, "r", encoding="utf-8") as f:
+        items = [json.loads(l) for l in f if l.strip()]
+    questions = [it["question"] for it in items]
+    relevant = [set(it.get("relevant_chunk_ids") or []) for it in items]
+    print(f"{EMBED_MODEL}: {len(passages)} chunks, {len(questions)} eval questions, k={k}")
+
+    runs = {b: run_backend(b, passages, questions, batch) for b in ("torch", "onnx")}
+    report = {"model": EMBED_MODEL, "chunks": len(passages), "questions": len(questions), "k": k, "backends": {}}
+    ids = {}
+    for b, r in runs.items():
+        ids[b], metrics = retrieval(r["P"], r["Q"], chunk_ids, relevant, k)
+        report["backends"][b] = {key: r[key] for key in ("load_s", "passages_per_s", "ms_per_query")} | metrics
+    ref, onnx = runs["torch"], runs["onnx"]
+    report["parity"] = {
+        "passage_cosine": cosine_stats(ref["P"], onnx["P"]),
+        "query_cosine": cosine_stats(ref["Q"], onnx["Q"]),
+        f"overlap@{k}": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ids["torch"].tolist(), ids["onnx"].tolist())])),
+        **{f"delta_{m}": report["backends"]["onnx"][m] - report["backends"]["torch"][m] for m in (f"R@{k}", f"MRR@{k}", f"nDCG@{k}")},
+    }
+    report["speedup"] = {"passages": onnx["passages_per_s"] / ref["passages_per_s"],
+                         "queries": ref["ms_per_query"] / onnx["ms_per_query"]}
+
+    print(f"{'backend':<8}{'load s':>8}{'chunks/s':>10}{'ms/query':>10}{'R@k':>7}{'MRR@k':>7}{'nDCG@k':>8}")
+    for b, r in report["backends"].items():
+        print(f"{b:<8}{r['load_s']:>8.1f}{r['passages_per_s']:>10.1f}{r['ms_per_query']:>10.2f}"
+              f"{r[f'R@{k}']:>7.3f}{r[f'MRR@{k}']:>7.3f}{r[f'nDCG@{k}']:>8.3f}")
+    p = report["parity"]
+    print(f"cosine torch vs onnx: passages mean {p['passage_cosine']['mean']:.4f} min {p['passage_cosine']['min']:.4f}, "
+          f"queries mean {p['query_cosine']['mean']:.4f} min {p['query_cosine']['min']:.4f}; top-{k} overlap {p[f'overlap@{k}']:.3f}")
+    print(f"speedup: passages x{report['speedup']['passages']:.2f}, queries x{report['speedup']['queries']:.2f}")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {out_path}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="ONNX Runtime int8 vs PyTorch embeddings: parity, retrieval metrics and throughput")
+    ap.add_argument("--eval_path", default="data/eval/qa.jsonl")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--batch", type=int, default=int(os.getenv("EMB_BATCH", "256")), help="passages per embed call")
+    ap.add_argument("--limit", type=int, default=0, help="only the first N chunks (metrics then only see those)")
+    ap.add_argument("--out", default="eval_out/onnx_report.json")
+    args = ap.parse_args()
+    main(args.eval_path, args.k, args.batch, args.limit, args.out)
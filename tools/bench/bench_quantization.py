@@ -0,0 +1,89 @@
+import os, json, sys, time
+from pathlib import Path
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.search.vector_index import RescoringIndex, add_rows, default_embeddings_path, index_config, make_index, train_sample
+from tools.eval.metrics import recall_at_k, mrr_at_k, ndcg_at_k_from_binary
+
+load_dotenv()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
+INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
+
+# (label, FAISS_INDEX_TYPE, exact re-scoring)
+SETTINGS = [
+    ("flat (float32)", "flat", False),
+    ("sqfp16", "sqfp16", False),
+    ("sq8", "sq8", False),
+    ("sq8 + rescore", "sq8", True),
+    ("ivf_sq8", "ivf_sq8", False),
+    ("ivf_sq8 + rescore", "ivf_sq8", True),
+]
+
+def load_vectors():
+    path = default_embeddings_path(INDEX_PATH)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+    from src.utils.cached_embedder import get_embedder
+    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
+        texts = [json.loads(l)["text"] for l in f if l.strip()]
+    return get_embedder(EMBED_MODEL).embed_passages(texts)
+
+def main(eval_path: str, k: int, factor: int):
+    from src.utils.cached_embedder import get_embedder
+    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
+        chunk_ids = [json.loads(l)["chunk_id"] for l in f if l.strip()]
+    with open(eval_path, "r", encoding="utf-8") as f:
+        items = [json.loads(l) for l in f if l.strip()]
+    vectors = load_vectors()
+    X = np.ascontiguousarray(vectors, dtype="float32")
+    Q = get_embedder(EMBED_MODEL).embed_queries([it["question"] for it in items]).astype("float32")
+    relevant = [set(it.get("relevant_chunk_ids") or []) for it in items]
+
+    results = []
+    for label, index_type, rescore in SETTINGS:
+        index = make_index(X.shape[1], len(X), index_config(index_type))
+        if not index.is_trained:
+            index.train(train_sample(X, 100000))
+        add_rows(index, X, 0)
+        mem = len(faiss.serialize_index(index))
+        searcher = RescoringIndex(index, vectors, factor) if rescore else index
+        t0 = time.perf_counter()
+        I = np.vstack([searcher.search(Q[i:i + 1], k)[1] for i in range(len(Q))])
+        ms = (time.perf_counter() - t0) / len(Q) * 1000
+        got = [[chunk_ids[j] for j in row if j >= 0] for row in I.tolist()]
+        results.append({
+            "setting": label,
+            "index_bytes": mem,
+            "bytes_per_vector": mem / max(len(X), 1),
+            "ms_per_query": ms,
+            f"R@{k}": float(np.mean([recall_at_k(r, g, k) for r, g in zip(relevant, got)])),
+            f"MRR@{k}": float(np.mean([mrr_at_k(r, g, k) for r, g in zip(relevant, got)])),
+            f"nDCG@{k}": float(np.mean([ndcg_at_k_from_binary(r, g, k) for r, g in zip(relevant, got)])),
+            "ids": I,
+        })
+    flat_ids = results[0].pop("ids")
+    print(f"{len(X)} vectors x {X.shape[1]} dims, {len(Q)} eval questions, k={k}, rescore factor {factor}")
+    print(f"{'setting':<20}{'MB':>9}{'B/vec':>8}{'ms/q':>8}{'R@k':>7}{'MRR@k':>7}{'nDCG@k':>8}{'=flat@k':>9}")
+    for r in results:
+        ids = r.pop("ids", flat_ids)
+        r[f"overlap_with_flat@{k}"] = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ids.tolist(), flat_ids.tolist())]))
+        print(f"{r['setting']:<20}{r['index_bytes'] / 2**20:>9.2f}{r['bytes_per_vector']:>8.0f}{r['ms_per_query']:>8.3f}"
+              f"{r[f'R@{k}']:>7.3f}{r[f'MRR@{k}']:>7.3f}{r[f'nDCG@{k}']:>8.3f}{r[f'overlap_with_flat@{k}']:>9.3f}")
+    out = Path("eval_out"); out.mkdir(exist_ok=True)
+    (out / "quantization_report.json").write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print("Saved to eval_out/quantization_report.json")
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument("--eval_path", default="data/eval/qa.jsonl")
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--rescore_factor", type=int, default=4)
+    args = p.parse_args()
+    main(args.eval_path, args.k, args.rescore_factor)
@@ -0,0 +1,61 @@
+import os, json, sys, time
+from pathlib import Path
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+load_dotenv()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
+INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
+
+def load_queries(path: str, n: int):
+    with open(path, "r", encoding="utf-8") as f:
+        qs = [json.loads(l)["question"] for l in f if l.strip()]
+    # cycle the eval questions up to n; the embedding cache is off, so repeats cost the same
+    return [qs[i % len(qs)] for i in range(n)]
+
+def main(args):
+    # measure the model and the index, not embedding cache hits
+    os.environ["EMB_CACHE"] = "false"
+    from src.retriever import open_retriever
+    retriever = open_retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
+    queries = load_queries(args.qa, args.queries)
+    retriever.search(queries[0])
+    report = {"queries": len(queries), "batch_size": args.batch_size, "top_k": args.top_k, "fetch_k": args.fetch_k, "modes": {}}
+    print(f"{len(queries)} queries, batches of {args.batch_size}, top_k={args.top_k}, fetch_k={args.fetch_k}")
+    print(f"{'mode':<8}{'loop qps':>10}{'batch qps':>11}{'speedup':>9}{'mismatches':>12}")
+    for mode in args.modes:
+        params = {"top_k": args.top_k, "mode": mode, "fetch_k": args.fetch_k, "alpha": args.alpha}
+        t0 = time.perf_counter()
+        one = [retriever.search(q, **params) for q in queries]
+        loop_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        many = []
+        for i in range(0, len(queries), args.batch_size):
+            many.extend(retriever.search_many(queries[i:i + args.batch_size], **params))
+        batch_s = time.perf_counter() - t0
+        mismatches = sum([h["chunk_id"] for h in a] != [h["chunk_id"] for h in b] for a, b in zip(one, many))
+        if mismatches:
+            print(f"[WARN] {mode}: search_many differs from search on {mismatches} queries (batched embedding rounding)")
+        row = {"loop_qps": len(queries) / loop_s, "batch_qps": len(queries) / batch_s, "speedup": loop_s / batch_s, "mismatches": mismatches}
+        report["modes"][mode] = row
+        print(f"{mode:<8}{row['loop_qps']:>10.1f}{row['batch_qps']:>11.1f}{row['speedup']:>9.1f}{mismatches:>12}")
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {args.out}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Retriever.search per query vs search_many in batches")
+    ap.add_argument("--qa", default="data/eval/qa.jsonl")
+    ap.add_argument("--queries", type=int, default=512)
+    ap.add_argument("--batch_size", type=int, default=64)
+    ap.add_argument("--modes", nargs="+", default=["vector", "bm25", "hybrid"], choices=["vector", "bm25", "hybrid"])
+    ap.add_argument("--top_k", type=int, default=10)
+    ap.add_argument("--fetch_k", type=int, default=64)
+    ap.add_argument("--alpha", type=float, default=0.65)
+    ap.add_argument("--out", default="eval_out/search_many_report.json")
+    main(ap.parse_args())
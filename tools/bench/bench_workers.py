@@ -0,0 +1,96 @@
+import os, json, sys, time
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+load_dotenv()
+INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+
+def smaps(pid="self") -> dict:
+    """Rss / Pss / Uss (private pages) of a process in MB, from /proc/<pid>/smaps_rollup."""
+    kb = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[0].endswith(":"):
+                kb[parts[0][:-1]] = int(parts[1])
+    return {"rss_mb": kb.get("Rss", 0) / 1024, "pss_mb": kb.get("Pss", 0) / 1024,
+            "uss_mb": (kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024}
+
+def worker(index_path: str, mmap: bool, queries: int, k: int, barrier, results):
+    from src.search.vector_index import read_index
+    base = smaps()
+    t0 = time.perf_counter()
+    index = read_index(index_path, mmap=mmap)
+    open_ms = (time.perf_counter() - t0) * 1000
+    q = np.random.default_rng(os.getpid()).standard_normal((queries, index.d)).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    t0 = time.perf_counter()
+    for i in range(queries):
+        index.search(q[i:i + 1], k)
+    search_ms = (time.perf_counter() - t0) / max(queries, 1) * 1000
+    # measure while every worker holds the index
+    barrier.wait()
+    m = smaps()
+    results.put({"pid": os.getpid(), "open_ms": open_ms, "ms_per_query": search_ms,
+                 **{key: m[key] - base[key] for key in m}})
+    barrier.wait()
+
+def run(index_path: str, mmap: bool, workers: int, queries: int, k: int) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(index_path, mmap, queries, k, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return {"mode": "mmap" if mmap else "heap", "workers": workers, "per_worker": rows,
+            "total_pss_mb": sum(r["pss_mb"] for r in rows),
+            "open_ms": float(np.mean([r["open_ms"] for r in rows])),
+            "ms_per_query": float(np.mean([r["ms_per_query"] for r in rows]))}
+
+def report_pids(pids):
+    """Memory of already running processes, e.g. ``--pids $(pgrep -f 'uvicorn app.server')``."""
+    rows = [{"pid": p, **smaps(p)} for p in pids]
+    for r in rows:
+        print(f"pid {r['pid']:>7}  rss {r['rss_mb']:8.1f} MB  pss {r['pss_mb']:8.1f} MB  uss {r['uss_mb']:8.1f} MB")
+    print(f"total pss {sum(r['pss_mb'] for r in rows):.1f} MB over {len(rows)} processes")
+
+def main(index_path: str, workers: int, queries: int, k: int, out_path: str):
+    size_mb = os.path.getsize(index_path) / 2**20
+    print(f"{index_path}: {size_mb:.1f} MB on disk, {workers} workers, {queries} queries each")
+    report = {"index_path": index_path, "index_mb": size_mb, "runs": []}
+    print(f"{'mode':<6} {'open ms':>9} {'ms/query':>9} {'PSS 1 worker':>13} {f'PSS {workers} workers':>15} {'+MB/worker':>11}")
+    for mmap in (False, True):
+        one = run(index_path, mmap, 1, queries, k)
+        many = run(index_path, mmap, workers, queries, k) if workers > 1 else one
+        # memory added by each worker beyond the first
+        marginal = (many["total_pss_mb"] - one["total_pss_mb"]) / max(workers - 1, 1)
+        report["runs"] += [one, many]
+        report[f"{one['mode']}_mb_per_extra_worker"] = marginal
+        print(f"{one['mode']:<6} {one['open_ms']:>9.1f} {many['ms_per_query']:>9.2f} {one['total_pss_mb']:>13.1f} "
+              f"{many['total_pss_mb']:>15.1f} {marginal:>11.1f}")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {out_path}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Per-worker memory of heap-loaded vs memory-mapped FAISS index")
+    ap.add_argument("--index_path", default=INDEX_PATH)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--out", default="eval_out/workers_report.json")
+    ap.add_argument("--pids", type=int, nargs="*", help="only report memory of these running processes")
+    args = ap.parse_args()
+    if args.pids:
+        report_pids(args.pids)
+    else:
+        main(args.index_path, args.workers, args.queries, args.k, args.out)
@@ -0,0 +1,128 @@
+import os, json, sys, time, threading
+import urllib.parse
+import urllib.request
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+load_dotenv()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
+INDEX_PATH = os.getenv("INDEX_PATH", "./index/faiss.index")
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", "./index/chunks.jsonl")
+
+def load_queries(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(l)["question"] for l in f if l.strip()]
+
+def drive(search, queries, concurrency: int, seconds: float) -> dict:
+    """``concurrency`` closed-loop clients calling ``search(query)`` for ``seconds``; latency percentiles and QPS."""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    stop = time.perf_counter() + seconds
+
+    def client(c: int):
+        i = c
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                search(queries[i % len(queries)])
+            except Exception:
+                errors[c] += 1
+            latencies[c].append(time.perf_counter() - t0)
+            i += concurrency
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    ms = np.array([x for l in latencies for x in l]) * 1000
+    return {"concurrency": concurrency, "requests": len(ms), "errors": sum(errors), "qps": len(ms) / elapsed,
+            "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99))}
+
+def print_row(label: str, r: dict):
+    print(f"{label:<10} {r['concurrency']:>5} {r['qps']:>9.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+          f"{r['p99_ms']:>9.2f} {r.get('mean_batch', 1.0):>8.1f} {r['errors']:>7}")
+
+def run_local(queries, levels, seconds: float, params: dict, max_batch: int | None, max_wait_ms: float | None):
+    """Retriever in this process, unbatched vs with the query batcher."""
+    # measure the model and the index, not embedding cache hits on a repeated query set
+    os.environ["EMB_CACHE"] = "false"
+    from src.retriever import open_retriever
+    retriever = open_retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
+    search = lambda q: retriever.search(q, **params)
+    search(queries[0])
+    rows = []
+    for label in ("unbatched", "batched"):
+        if label == "batched":
+            batcher = retriever.start_batcher(max_batch, max_wait_ms)
+        for c in levels:
+            before = batcher.stats() if label == "batched" else None
+            r = drive(search, queries, c, seconds)
+            if before is not None:
+                after = batcher.stats()
+                r["mean_batch"] = (after["queries"] - before["queries"]) / max(after["batches"] - before["batches"], 1)
+            rows.append({"mode": label, **r})
+            print_row(label, r)
+    return rows
+
+def run_http(url: str, queries, levels, seconds: float, params: dict):
+    """A running server (``uvicorn app.server:app``), as configured there (SEARCH_BATCH).
+
+    Start it with EMB_CACHE=false to keep repeated queries from being cache hits.
+    """
+    def get(path: str):
+        with urllib.request.urlopen(url.rstrip("/") + path, timeout=60) as resp:
+            return json.loads(resp.read())
+
+    def search(q: str):
+        body = get("/search?" + urllib.parse.urlencode({"q": q, **params}))
+        if "error" in body:
+            raise RuntimeError(body["error"])
+
+    rows = []
+    for c in levels:
+        before = get("/batch/stats")
+        r = drive(search, queries, c, seconds)
+        after = get("/batch/stats")
+        if after.get("enabled"):
+            r["mean_batch"] = (after["queries"] - before["queries"]) / max(after["batches"] - before["batches"], 1)
+        rows.append({"mode": "http", **r})
+        print_row("http", r)
+    return rows
+
+def main(args):
+    queries = load_queries(args.queries)
+    params = {"top_k": args.top_k, "mode": args.mode, "fetch_k": args.fetch_k}
+    print(f"{len(queries)} queries, mode={args.mode}, {args.seconds:.0f}s per level")
+    print(f"{'':<10} {'conc':>5} {'qps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'batch':>8} {'errors':>7}")
+    if args.url:
+        rows = run_http(args.url, queries, args.concurrency, args.seconds, params)
+    else:
+        rows = run_local(queries, args.concurrency, args.seconds, params, args.max_batch, args.max_wait_ms)
+    report = {"url": args.url, "params": params, "seconds": args.seconds, "runs": rows}
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {args.out}")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Throughput and p50/p95/p99 latency of /search under concurrent load")
+    ap.add_argument("--url", help="load a running server, e.g. http://localhost:8000 (default: a Retriever in this process, unbatched vs batched)")
+    ap.add_argument("--queries", default="data/eval/qa.jsonl")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    ap.add_argument("--seconds", type=float, default=10.0, help="duration of each concurrency level")
+    ap.add_argument("--mode", default=os.getenv("SEARCH_MODE", "hybrid"))
+    ap.add_argument("--top_k", type=int, default=8)
+    ap.add_argument("--fetch_k", type=int, default=int(os.getenv("FETCH_K", "64")))
+    ap.add_argument("--max_batch", type=int, help="batcher size (default SEARCH_BATCH_MAX)")
+    ap.add_argument("--max_wait_ms", type=float, help="batcher wait (default SEARCH_BATCH_WAIT_MS)")
+    ap.add_argument("--out", default="eval_out/load_test_report.json")
+    main(ap.parse_args())
@@ -9,7 +9,7 @@ from tqdm import tqdm
 project_root = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(project_root))
 
-from src.retriever import Retriever
+from src.retriever import open_retriever
 from src.rag import answer_with_citations
 from tools.eval.metrics import exact_match, token_f1, context_precision, context_recall
 
@@ -39,7 +39,7 @@ def load_items(p: str) -> List[RagItem]:
     return items
 
 def main(eval_path: str, mode: str="hybrid", alpha: float=0.65, top_k: int=6, mmr: bool=True):
-    retr = Retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
+    retr = open_retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
     items = load_items(eval_path)
     rows = []
     t0 = time.time()
@@ -9,7 +9,7 @@ from tqdm import tqdm
 project_root = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(project_root))
 
-from src.retriever import Retriever
+from src.retriever import open_retriever
 from tools.eval.metrics import precision_at_k, recall_at_k, mrr_at_k, ndcg_at_k_from_binary, average_precision
 
 load_dotenv()
@@ -37,12 +37,18 @@ def load_items(p: str) -> List[EvalItem]:
             ))
     return items
 
-def main(eval_path: str, mode: str="hybrid", alpha: float=0.65, top_k: int=10, mmr: bool=True):
-    retr = Retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
+def main(eval_path: str, mode: str="hybrid", alpha: float=0.65, top_k: int=10, mmr: bool=True, batch_size: int=64):
+    retr = open_retriever(INDEX_PATH, CHUNKS_PATH, EMBED_MODEL)
     items = load_items(eval_path)
+    # questions go through search_many in batches: one embedding call, index search and BM25 pass each
+    results = []
+    with tqdm(total=len(items), desc="Retrieval eval") as bar:
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            results.extend(retr.search_many([it.question for it in batch], top_k=top_k, mode=mode, mmr=mmr, alpha=alpha))
+            bar.update(len(batch))
     rows = []
-    for it in tqdm(items, desc="Retrieval eval"):
-        hits = retr.search(it.question, top_k=top_k, mode=mode, mmr=mmr, alpha=alpha)
+    for it, hits in zip(items, results):
         got_chunks = [h["chunk_id"] for h in hits]
         got_docs = [h["doc_path"] for h in hits]
         rel_chunks, rel_docs = set(it.relevant_chunks or []), set(it.relevant_docs or [])
@@ -71,5 +77,6 @@ if __name__ == "__main__":
     p.add_argument("--alpha", type=float, default=0.65)
     p.add_argument("--top_k", type=int, default=10)
     p.add_argument("--mmr", action="store_true")
+    p.add_argument("--batch_size", type=int, default=64, help="questions per search_many call")
     args = p.parse_args()
-    main(args.eval_path, args.mode, args.alpha, args.top_k, args.mmr)
+    main(args.eval_path, args.mode, args.alpha, args.top_k, args.mmr, args.batch_size)